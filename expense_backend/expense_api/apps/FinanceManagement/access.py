@@ -0,0 +1,108 @@
+"""
+Who may use which table.
+
+``TableAccess`` holds one row per user and table with the user's role: the
+owner, or a user the table is shared with. ``services`` maintains it when
+tables are created, shared and unshared (deleting a table or a user cascades),
+so a permission check never has to join ownership and ``shared_with``.
+
+A user's roles are cached as one ``{table_id: role}`` map, keyed by the
+user's table catalog version. Every change to who can see a table bumps that
+version in the database, so the API and the MCP server, which do not share a
+cache, never act on a revoked share; a check costs the version's primary-key
+lookup, and rebuilding the map after a change one indexed query.
+
+Owners may do anything with a table; users it is shared with may read it
+and change its rows and columns, but not rename, delete or re-share it.
+Tables created before access rows existed get theirs on ``migrate``
+(``backfill``); ``rebuild`` recreates them from owners and shares (the
+``rebuild_table_access`` command).
+"""
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .models import DynamicTableData, TableAccess
+from .services import bump_catalog_versions, catalog_version
+
+
+ACCESS_CACHE_TIMEOUT = 60 * 60
+
+OWNER = TableAccess.OWNER
+SHARED = TableAccess.SHARED
+
+
+def table_roles(user_id, version=None):
+    """``{table_id: role}`` for every table the user can see; pass ``version`` when already read."""
+    version = catalog_version(user_id) if version is None else version
+    key = f"table_access:{user_id}:{version}"
+    roles = cache.get(key)
+    if roles is None:
+        roles = dict(TableAccess.objects.filter(user_id=user_id).values_list('table_id', 'role'))
+        cache.set(key, roles, ACCESS_CACHE_TIMEOUT)
+    return roles
+
+
+def role(user_id, table_id, version=None):
+    """The user's role on a table, or None when they cannot see it (or ``table_id`` is not an id)."""
+    try:
+        table_id = int(table_id)
+    except (TypeError, ValueError):
+        return None
+    return table_roles(user_id, version).get(table_id)
+
+
+def can_use(user_id, table_id, version=None):
+    return role(user_id, table_id, version) is not None
+
+
+def is_owner(user_id, table_id, version=None):
+    return role(user_id, table_id, version) == OWNER
+
+
+def table_ids(user_id, only=None, version=None):
+    """Ids of the tables the user can see, or only those where their role is ``only``; sorted."""
+    return sorted(
+        table_id for table_id, table_role in table_roles(user_id, version).items()
+        if only is None or table_role == only
+    )
+
+
+def rebuild(tables=None):
+    """Recreate the access rows of all tables, or of ``tables`` (ids), from owners and shares; returns how many."""
+    table_ids = None if tables is None else list(tables)
+    # Deleted tables have no access rows; theirs are removed and not recreated
+    tables = DynamicTableData.objects.filter(deleted_at__isnull=True).order_by('pk')
+    if table_ids is not None:
+        tables = tables.filter(pk__in=table_ids)
+    shares = DynamicTableData.shared_with.through.objects.filter(dynamictabledata__in=tables)
+
+    entries = {
+        (user_id, table_id): SHARED
+        for user_id, table_id in shares.values_list('user_id', 'dynamictabledata_id')
+    }
+    # An owner who is also in shared_with is still the owner
+    entries.update({(user_id, table_id): OWNER for table_id, user_id in tables.values_list('pk', 'user_id')})
+
+    with transaction.atomic():
+        stale = TableAccess.objects.filter(table__in=tables)
+        affected = set(stale.values_list('user_id', flat=True)) | {user_id for user_id, _ in entries}
+        stale.delete()
+        TableAccess.objects.bulk_create(
+            [TableAccess(user_id=user_id, table_id=table_id, role=role) for (user_id, table_id), role in entries.items()],
+            batch_size=1000
+        )
+        # Cached roles are keyed by catalog version
+        bump_catalog_versions(user_ids=affected)
+    return len(entries)
+
+
+def backfill(sender=None, using=DEFAULT_DB_ALIAS, **kwargs):
+    """Create the access rows of tables that have none; a ``post_migrate`` receiver."""
+    existing = connections[using].introspection.table_names()
+    if TableAccess._meta.db_table not in existing or DynamicTableData._meta.db_table not in existing:
+        return
+    missing = list(
+        DynamicTableData.objects.filter(deleted_at__isnull=True, access__isnull=True).values_list('pk', flat=True)
+    )
+    if missing:
+        rebuild(missing)
@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 
 # Register your models here.
+from . import schema
 from .models import DynamicTableData, JsonTable, JsonTableRow
 
 # @admin.register(DynamicTableData)
@@ -15,6 +16,7 @@ class DynamicTableDataAdmin(admin.ModelAdmin):
         return obj.user_id
     
 
+from . import schema
 from .models import DynamicTableData, JsonTable, JsonTableRow
 
 
@@ -31,8 +33,9 @@ class JsonTableAdmin(admin.ModelAdmin):
         table_html += "<tr>" + "".join(f"<th style='padding: 4px'>{header}</th>" for header in obj.headers) + "</tr>"
 
         # Add each row
+        read = schema.row_reader(obj)
         for row in obj.rows.all():  # uses related_name='rows'
-            row_data = row.data
+            row_data = read(row.data)
             table_html += "<tr>" + "".join(f"<td style='padding: 4px'>{row_data.get(header, '')}</td>" for header in obj.headers) + "</tr>"
 
         table_html += "</table>"
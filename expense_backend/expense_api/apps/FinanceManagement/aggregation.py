@@ -0,0 +1,210 @@
+"""
+Group-by aggregation over table rows, computed in the database.
+
+A spec looks like::
+
+    {
+        "group_by": ["Category", {"column": "Date", "bucket": "month"}],
+        "aggregates": [{"fn": "sum", "column": "Amount"}, {"fn": "count"}],
+        "filters": [{"column": "Date", "op": "gte", "value": "2025-01-01"}]
+    }
+
+and compiles to one ``SELECT ... GROUP BY`` over ``JsonTableRow`` using the
+typed shadow values (see ``table_query``). Specs without filters that group
+by month or year of the rollup date column and at most one category column
+are answered from the table's rollups instead (see ``rollups``), reading one
+row per group and month rather than every row. Results are cached per table
+version, so repeated dashboards cost one version lookup until the table
+changes.
+"""
+import hashlib
+import json
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db.models import Avg, Count, DateField, Max, Min, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek, TruncYear
+from django.utils import timezone
+
+from . import column_types as types
+from . import rollups
+from .models import JsonTableRow, TableRollup
+from .schema import column_id
+from .table_query import NUMERIC_TYPES, apply_filters, check_column, column_type, typed_value
+
+
+AGGREGATE_FUNCTIONS = {"sum": Sum, "avg": Avg, "min": Min, "max": Max, "count": Count}
+BUCKETS = {"day": TruncDay, "week": TruncWeek, "month": TruncMonth, "year": TruncYear}
+BUCKET_FORMATS = {"day": "%Y-%m-%d", "week": "%Y-%m-%d", "month": "%Y-%m", "year": "%Y"}
+# Length of the YYYY-MM rollup period kept for buckets rollups can answer
+ROLLUP_BUCKETS = {"month": 7, "year": 4}
+MAX_GROUPS = 1000
+AGGREGATE_CACHE_TIMEOUT = 60 * 60
+
+
+def _group_by(json_table, spec):
+    """Return ``[(label, alias, expression, bucket, header)]`` for the ``group_by`` spec."""
+    items = spec if isinstance(spec, list) else [spec] if spec else []
+    groups = []
+    for index, item in enumerate(items):
+        item = {"column": item} if isinstance(item, str) else item
+        if not isinstance(item, dict):
+            raise ValueError("Each 'group_by' entry is a column name or {'column', 'bucket'}.")
+        header = check_column(json_table, item.get('column'))
+        bucket = item.get('bucket')
+        expression = typed_value(json_table, header)
+        if bucket:
+            if bucket not in BUCKETS:
+                raise ValueError(f"Unknown bucket '{bucket}'. Use one of: {', '.join(BUCKETS)}.")
+            if column_type(json_table, header) != types.DATE:
+                raise ValueError(f"Column '{header}' is not a date column; set its type to 'date' to bucket it.")
+            expression = BUCKETS[bucket](expression, output_field=DateField())
+        label = f"{header} ({bucket})" if bucket else header
+        groups.append((label, f"group_{index}", expression, bucket, header))
+    return groups
+
+
+def _aggregates(json_table, spec):
+    """Return ``{label: (fn, header)}`` for the ``aggregates`` spec; ``header`` is None for the row count."""
+    if not spec:
+        spec = [{"fn": "count"}]
+    if not isinstance(spec, list):
+        raise ValueError("'aggregates' must be a list.")
+    aggregates = {}
+    for item in spec:
+        if not isinstance(item, dict) or item.get('fn') not in AGGREGATE_FUNCTIONS:
+            raise ValueError(f"Each aggregate needs an 'fn' from: {', '.join(AGGREGATE_FUNCTIONS)}.")
+        fn, header = item['fn'], item.get('column')
+        if header is None:
+            if fn != "count":
+                raise ValueError(f"'{fn}' needs a 'column'.")
+            aggregates["count"] = (fn, None)
+            continue
+        check_column(json_table, header)
+        kind = column_type(json_table, header)
+        if fn in ("sum", "avg") and kind not in NUMERIC_TYPES:
+            raise ValueError(f"'{fn}' needs a number or currency column; '{header}' is {kind}.")
+        if fn in ("min", "max") and kind not in (*NUMERIC_TYPES, types.DATE):
+            raise ValueError(f"'{fn}' needs a number, currency or date column; '{header}' is {kind}.")
+        aggregates[f"{fn}_{header}"] = (fn, header)
+    return aggregates
+
+
+def _expressions(json_table, aggregates):
+    return {
+        label: Count('id') if header is None else AGGREGATE_FUNCTIONS[fn](typed_value(json_table, header))
+        for label, (fn, header) in aggregates.items()
+    }
+
+
+def _format(value, bucket=None):
+    if bucket and value is not None:
+        return value.strftime(BUCKET_FORMATS[bucket])
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def _sort_key(key):
+    return tuple((value is None, value or "") for value in key)
+
+
+def _from_rollups(json_table, spec, groups, aggregates):
+    """Answer the spec from the table's rollups, or return None when it needs the rows."""
+    if spec.get('filters') or not rollups.is_current(json_table):
+        return None
+    config = json_table.rollup_config
+    period_length, dimension = None, ''
+    for _, _, _, bucket, header in groups:
+        if bucket in ROLLUP_BUCKETS and period_length is None and column_id(json_table, header) == config['date']:
+            period_length = ROLLUP_BUCKETS[bucket]
+        elif not bucket and not dimension and column_id(json_table, header) in config['dimensions']:
+            dimension = column_id(json_table, header)
+        else:
+            return None
+    measures = {label: column_id(json_table, header) if header else '' for label, (_, header) in aggregates.items()}
+    if any(measure and measure not in config['measures'] for measure in measures.values()):
+        return None
+
+    totals = defaultdict(dict)  # group values -> measure -> [count, total, minimum, maximum]
+    if not groups:
+        totals[()] = {}
+    rollup_rows = TableRollup.objects.filter(
+        table_id=json_table.pk, dimension=dimension, measure__in={'', *measures.values()}
+    ).values_list('period', 'group_key', 'measure', 'row_count', 'total', 'minimum', 'maximum')
+    for period, group_key, measure, row_count, total, minimum, maximum in rollup_rows:
+        key = tuple(
+            (period[:period_length] or None) if bucket else (group_key or None)
+            for _, _, _, bucket, _ in groups
+        )
+        current = totals[key].get(measure)
+        if current is None:
+            totals[key][measure] = [row_count, total, minimum, maximum]
+            continue
+        current[0] += row_count
+        current[1] += total
+        if minimum is not None:
+            current[2] = minimum if current[2] is None else min(current[2], minimum)
+            current[3] = maximum if current[3] is None else max(current[3], maximum)
+
+    results = []
+    for key in sorted(totals, key=_sort_key)[:MAX_GROUPS + 1]:
+        entry = {label: value for (label, _, _, _, _), value in zip(groups, key)}
+        for label, (fn, _) in aggregates.items():
+            row_count, total, minimum, maximum = totals[key].get(measures[label]) or [0, None, None, None]
+            entry[label] = {
+                "count": row_count,
+                "sum": total,
+                "avg": total / row_count if row_count else None,
+                "min": minimum,
+                "max": maximum,
+            }[fn]
+        results.append(entry)
+    return results[:MAX_GROUPS], len(results) > MAX_GROUPS
+
+
+def run_aggregation(json_table, spec):
+    """Run an aggregation spec from the rollups or with one query; returns the groups and whether they were truncated."""
+    groups = _group_by(json_table, spec.get('group_by'))
+    aggregates = _aggregates(json_table, spec.get('aggregates'))
+    summary = _from_rollups(json_table, spec, groups, aggregates)
+    if summary is not None:
+        return summary
+
+    rows = apply_filters(JsonTableRow.objects.filter(table_id=json_table.pk), json_table, spec.get('filters'))
+    if groups:
+        aliases = [alias for _, alias, _, _, _ in groups]
+        rows = (
+            rows.annotate(**{alias: expression for _, alias, expression, _, _ in groups})
+            .values(*aliases)
+            .annotate(**_expressions(json_table, aggregates))
+            .order_by(*aliases)
+        )
+        results = list(rows[:MAX_GROUPS + 1])
+    else:
+        results = [rows.aggregate(**_expressions(json_table, aggregates))]
+
+    truncated = len(results) > MAX_GROUPS
+    output = []
+    for result in results[:MAX_GROUPS]:
+        entry = {label: _format(result[alias], bucket) for label, alias, _, bucket, _ in groups}
+        entry.update({label: _format(result[label]) for label in aggregates})
+        output.append(entry)
+    return output, truncated
+
+
+def aggregate_table(json_table, spec, version):
+    """Cached ``run_aggregation``; ``version`` is the table's current version."""
+    # Relative dates in filters ("ajk") depend on the day
+    fingerprint = hashlib.sha1(
+        json.dumps([spec, timezone.localdate()], sort_keys=True, default=str).encode()
+    ).hexdigest()
+    key = f"table_aggregate:{json_table.pk}:{version}:{fingerprint}"
+    cached = cache.get(key)
+    if cached is not None:
+        return {**cached, "cached": True}
+
+    groups, truncated = run_aggregation(json_table, spec)
+    result = {"groups": groups, "truncated": truncated, "version": version}
+    cache.set(key, result, AGGREGATE_CACHE_TIMEOUT)
+    return {**result, "cached": False}
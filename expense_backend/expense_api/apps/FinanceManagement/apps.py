@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class FinancemanagementConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'expense_api.apps.FinanceManagement'
+
+    def ready(self):
+        from . import access, row_search
+
+        # The row full-text index lives outside the ORM's migrations
+        post_migrate.connect(row_search.install, sender=self)
+        # Tables from before access rows existed would be visible to no one
+        post_migrate.connect(access.backfill, sender=self)
@@ -0,0 +1,129 @@
+"""
+Cached catalogs of a user's tables.
+
+Two views of the same tables are cached per user:
+
+- ``list_tables``: the table list of the REST API, every table the user owns
+  or that is shared with them, with owner, shares and row/column counts;
+- ``get_table_catalog``: the compact catalog the agent prompt includes, the
+  same tables with the user's role on each, so the model can go straight to
+  the read/write tools instead of spending a round trip on
+  ``get_user_tables``.
+
+Cache entries are keyed by the user's table catalog version, which the
+write paths in ``services`` bump on every change to a table the user can
+see, its rows or its shares, even when the write happened in another
+process such as the MCP server. A stale entry is never read, and checking
+costs one primary-key lookup.
+
+For users with many tables the prompt only carries the tables most relevant
+to the query (see ``get_relevant_catalog``).
+"""
+from django.core.cache import cache
+from django.db.models import F
+
+from . import access
+from .models import DynamicTableData
+from .serializers import TableListSerializer
+from .services import catalog_version
+from .table_index import search_user_tables
+
+
+CATALOG_CACHE_TIMEOUT = 60 * 60
+
+
+def _cache_key(kind, user_id, version):
+    return f"{kind}:{user_id}:{version}"
+
+
+def build_table_list(user_id):
+    """
+    The table list in two queries: tables with their owner and headers, then
+    the users they are shared with. Row counts are the tables' own counters.
+    """
+    tables = (
+        DynamicTableData.objects.filter(access__user_id=user_id)
+        .select_related('user')
+        .prefetch_related('shared_with')
+        .annotate(headers=F('jsontable__headers'))
+        .order_by('id')
+    )
+    return [dict(table) for table in TableListSerializer(tables, many=True).data]
+
+
+def list_tables(user_id, version=None):
+    """The cached table list; pass ``version`` when the caller has already read it."""
+    version = catalog_version(user_id) if version is None else version
+    key = _cache_key("table_list", user_id, version)
+    tables = cache.get(key)
+    if tables is None:
+        tables = build_table_list(user_id)
+        cache.set(key, tables, CATALOG_CACHE_TIMEOUT)
+    return tables
+
+
+def build_table_catalog(user_id, version=None):
+    """Load id, name, headers, row count and the user's role for every table the user owns or that is shared with them."""
+    roles = access.table_roles(user_id, version)
+    tables = (
+        DynamicTableData.objects.filter(pk__in=list(roles), deleted_at__isnull=True)
+        .values('id', 'table_name', 'jsontable__headers', 'row_count')
+        .order_by('id')
+    )
+    return [
+        {
+            "id": table['id'],
+            "name": table['table_name'],
+            "headers": table['jsontable__headers'] or [],
+            "row_count": table['row_count'],
+            "role": roles[table['id']],
+        }
+        for table in tables
+    ]
+
+
+def get_table_catalog(user_id):
+    """Return the user's table catalog, rebuilding it only when tables changed."""
+    version = catalog_version(user_id)
+    key = _cache_key("table_catalog", user_id, version)
+    tables = cache.get(key)
+    if tables is None:
+        tables = build_table_catalog(user_id, version)
+        cache.set(key, tables, CATALOG_CACHE_TIMEOUT)
+    return tables
+
+
+def get_relevant_catalog(user_id, query, limit=25):
+    """
+    Return ``(tables, total)``: the catalog ordered by relevance to ``query``
+    and capped at ``limit`` entries, plus the user's total number of tables.
+
+    Matching tables come first and carry a ``relevance`` percentage from the
+    table search index; the remaining slots keep catalog order.
+    """
+    tables = get_table_catalog(user_id)
+    ranked = search_user_tables(user_id, query, limit=limit, include_shared=True)
+    relevance = {table_id: score for table_id, _, score in ranked}
+
+    matches = sorted(
+        (dict(table, relevance=relevance[table['id']]) for table in tables if table['id'] in relevance),
+        key=lambda table: -table['relevance']
+    )
+    others = [table for table in tables if table['id'] not in relevance]
+    ordered = matches + others
+    return (ordered[:limit] if limit else ordered), len(tables)
+
+
+def format_table_catalog(tables, total=None):
+    """Render the catalog as one short line per table for the agent prompt."""
+    if not tables:
+        return "(no tables yet)"
+    lines = [
+        f"- #{table['id']} \"{table['name']}\" | rows: {table['row_count']} | headers: {', '.join(table['headers'])}"
+        + (" | shared with you" if table.get('role') == access.SHARED else "")
+        + (f" | match: {table['relevance']}%" if table.get('relevance') else "")
+        for table in tables
+    ]
+    if total and total > len(tables):
+        lines.append(f"(+{total - len(tables)} more tables, call get_user_tables or search_tables to see them)")
+    return "\n".join(lines)
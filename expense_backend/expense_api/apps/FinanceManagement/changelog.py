@@ -0,0 +1,132 @@
+"""
+Append-only change log of table rows and headers, for delta sync.
+
+Every write path in ``services`` appends ``TableChange`` entries in the same
+transaction as the write. Each table numbers its entries with consecutive
+sequence numbers (``DynamicTableData.change_seq`` holds the latest), so a
+client that has seen everything up to ``seq`` asks for the changes after it
+and applies them in order:
+
+- ``insert``: ``row`` and its ``values``
+- ``update``: ``row`` and only the cells that changed
+- ``delete``: ``row``
+- ``move``: ``row`` and, in ``values``, the row it now follows (``after``,
+  null when it moved to the top)
+- ``schema``: ``action`` (add / rename / delete / types) with its details,
+  plus the table's new ``headers`` and ``column_types``
+- ``resync``: too much changed at once (a bulk import, a large batch), the
+  client reloads the table
+
+Old entries are removed by ``compact`` (the ``compact_table_changes``
+command); ``change_floor`` remembers how far, and clients whose ``since`` is
+below it are told to resync as well. Entries a table snapshot is replayed
+from are kept (see ``snapshots``).
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Max, Min
+from django.utils import timezone
+
+from .models import DynamicTableData, TableChange, TableSnapshot
+
+
+# Larger writes log a single "resync" entry instead of one entry per row
+MAX_LOGGED_ROWS = 500
+MAX_CHANGES_PER_PAGE = 1000
+
+
+def log_changes(table_id, changes):
+    """
+    Append ``changes``, a list of ``(op, row_id, values)``, with consecutive
+    sequence numbers. Call inside the transaction of the write.
+    """
+    if not changes:
+        return
+    if len(changes) > MAX_LOGGED_ROWS:
+        changes = [('resync', None, {"reason": f"{len(changes)} changes"})]
+    with transaction.atomic():
+        # The UPDATE locks the table row until commit, so seqs never collide
+        DynamicTableData.objects.filter(pk=table_id).update(change_seq=F('change_seq') + len(changes))
+        last_seq = DynamicTableData.objects.filter(pk=table_id).values_list('change_seq', flat=True).get()
+        first_seq = last_seq - len(changes) + 1
+        TableChange.objects.bulk_create([
+            TableChange(table_id=table_id, seq=first_seq + offset, op=op, row_id=row_id, values=values)
+            for offset, (op, row_id, values) in enumerate(changes)
+        ])
+
+
+def log_schema_change(json_table, action, **details):
+    log_changes(json_table.pk, [('schema', None, {
+        "action": action,
+        **details,
+        "headers": json_table.headers,
+        "column_types": json_table.column_types,
+    })])
+
+
+def _serialize(change):
+    entry = {"seq": change['seq'], "op": change['op']}
+    if change['row_id'] is not None:
+        entry["row"] = change['row_id']
+    if change['values'] is not None:
+        entry["values"] = change['values']
+    return entry
+
+
+def changes_since(table, since, limit=MAX_CHANGES_PER_PAGE):
+    """
+    The changes after ``since`` as a response dict. ``resync`` is True when
+    the client must reload the table instead: its position was compacted
+    away, is ahead of the log, or the range contains a resync entry.
+    """
+    limit = min(max(limit, 1), MAX_CHANGES_PER_PAGE)
+    response = {"table_id": table.pk, "since": since, "latest_seq": table.change_seq}
+    if since < table.change_floor or since > table.change_seq:
+        return {**response, "resync": True, "changes": [], "has_more": False}
+
+    changes = list(
+        TableChange.objects.filter(table_id=table.pk, seq__gt=since)
+        .order_by('seq')
+        .values('seq', 'op', 'row_id', 'values')[:limit + 1]
+    )
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    if any(change['op'] == 'resync' for change in changes):
+        return {**response, "resync": True, "changes": [], "has_more": False}
+
+    return {
+        **response,
+        "resync": False,
+        "seq": changes[-1]['seq'] if changes else since,
+        "changes": [_serialize(change) for change in changes],
+        "has_more": has_more,
+    }
+
+
+def compact(keep_days=30, keep_per_table=10000, table_id=None):
+    """
+    Drop entries older than ``keep_days`` and all but the latest
+    ``keep_per_table`` of each table, except those after the checkpoint of
+    a snapshot; returns the number of entries removed.
+    """
+    cutoff = timezone.now() - timedelta(days=keep_days)
+    tables = DynamicTableData.objects.filter(change_seq__gt=F('change_floor'))
+    if table_id is not None:
+        tables = tables.filter(pk=table_id)
+
+    removed = 0
+    for table_id, change_seq in tables.values_list('pk', 'change_seq').iterator():
+        with transaction.atomic():
+            old_seq = TableChange.objects.filter(table_id=table_id, created_at__lt=cutoff).aggregate(seq=Max('seq'))['seq'] or 0
+            floor = max(old_seq, change_seq - keep_per_table)
+            pinned = TableSnapshot.objects.filter(
+                table_id=table_id, seq__gt=F('checkpoint__seq')
+            ).aggregate(seq=Min('checkpoint__seq'))['seq']
+            if pinned is not None:
+                floor = min(floor, pinned)
+            if floor <= 0:
+                continue
+            removed += TableChange.objects.filter(table_id=table_id, seq__lte=floor).delete()[0]
+            DynamicTableData.objects.filter(pk=table_id, change_floor__lt=floor).update(change_floor=floor)
+    return removed
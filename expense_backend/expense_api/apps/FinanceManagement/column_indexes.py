@@ -0,0 +1,160 @@
+"""
+Expression indexes on the typed values of hot columns.
+
+Filters and orderings (see ``table_query``) compile to expressions on a
+column's typed value, which no ordinary index covers. For a column a large
+table is queried by again and again, ``create_index`` adds a partial
+expression index on exactly that expression, limited to the table's rows,
+so the planner can use it for the filter and the sort. That needs the query
+to reach the database with the same literals as the index (the JSON key and
+the table id), which is how Django's PostgreSQL backend sends it; SQLite
+binds JSON paths as parameters, so no expression index could ever match
+there and indexes are only created on PostgreSQL.
+
+``record_use`` counts queries per column in the cache; a column queried
+``HOT_COLUMN_USES`` times within a day on a table of at least
+``MIN_INDEXED_ROWS`` rows is queued as a pending ``TableColumnIndex``, so no
+request waits for an index build. The ``build_column_indexes`` command
+builds queued indexes (concurrently on PostgreSQL); a build that fails is
+dropped, since a failed concurrent build leaves an invalid index behind, and
+recorded as failed with its error. The ``create_column_index`` command
+creates or drops them by hand. Changing a column's type or deleting it
+drops its index, since the expression no longer matches.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.db import DatabaseError, connection, models
+
+from .models import JsonTable, JsonTableRow, TableColumnIndex
+from .schema import column_id, column_id_map
+from .table_query import check_column, column_type, typed_value
+
+
+HOT_COLUMN_USES = 20
+MIN_INDEXED_ROWS = 2000
+USE_WINDOW = 24 * 60 * 60
+
+
+def _index(json_table, header):
+    key, kind = column_id(json_table, header), column_type(json_table, header)
+    name = "jtrow_%s" % hashlib.sha1(f"{json_table.pk}:{key}:{kind}".encode()).hexdigest()[:20]
+    return models.Index(typed_value(json_table, header), name=name, condition=models.Q(table_id=json_table.pk))
+
+
+def supported():
+    return connection.vendor == "postgresql"
+
+
+def _queue(json_table, header):
+    """The index record of a column, created as pending when there is none; returns ``(record, created)``."""
+    key, kind = column_id(json_table, header), column_type(json_table, header)
+    record = TableColumnIndex.objects.filter(table_id=json_table.pk, column_id=key, column_type=kind).first()
+    if record is not None:
+        return record, False
+    return TableColumnIndex.objects.get_or_create(
+        name=_index(json_table, header).name,
+        defaults={"table_id": json_table.pk, "column_id": key, "column_type": kind}
+    )
+
+
+def _build(json_table, header, record):
+    """Run the CREATE INDEX of ``record`` and store the outcome; returns True when the index was built."""
+    index = _index(json_table, header)
+    # CONCURRENTLY keeps the rows writable while the index builds, but cannot run in a transaction
+    options = {} if connection.in_atomic_block else {"concurrently": True}
+    statement = index.create_sql(JsonTableRow, connection.schema_editor(), **options)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(str(statement))
+    except DatabaseError as e:
+        if not options:
+            raise
+        # A failed concurrent build leaves an INVALID index that writes still maintain
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP INDEX IF EXISTS {connection.ops.quote_name(index.name)}")
+        TableColumnIndex.objects.filter(pk=record.pk).update(status=TableColumnIndex.FAILED, error=str(e))
+        return False
+    TableColumnIndex.objects.filter(pk=record.pk).update(status=TableColumnIndex.READY, error="")
+    return True
+
+
+def create_index(json_table, header):
+    """Index one column of a table now unless it already is; returns True when an index was created."""
+    check_column(json_table, header)
+    if not supported():
+        return False
+    record, _ = _queue(json_table, header)
+    if record.status == TableColumnIndex.READY:
+        return False
+    return _build(json_table, header, record)
+
+
+def build_index(record):
+    """
+    Build a queued index; returns True when it was built. Records of columns
+    that were deleted or changed type since are removed instead.
+    """
+    json_table = JsonTable.objects.filter(pk=record.table_id).first()
+    headers = {key: header for header, key in column_id_map(json_table).items()} if json_table else {}
+    header = headers.get(record.column_id)
+    if header is None or column_type(json_table, header) != record.column_type:
+        record.delete()
+        return False
+    return _build(json_table, header, record)
+
+
+def build_pending(limit=None):
+    """Build the queued indexes, oldest first, yielding ``(record, built)``."""
+    records = TableColumnIndex.objects.filter(status=TableColumnIndex.PENDING).order_by('created_at', 'pk')
+    for record in (records[:limit] if limit else records):
+        yield record, build_index(record)
+
+
+def drop_indexes(table_id, column_ids=None):
+    """Drop a table's column indexes, or those of ``column_ids``; returns how many were dropped."""
+    indexes = TableColumnIndex.objects.filter(table_id=table_id)
+    if column_ids is not None:
+        indexes = indexes.filter(column_id__in=list(column_ids))
+    dropped = 0
+    for index in indexes:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP INDEX IF EXISTS {connection.ops.quote_name(index.name)}")
+        index.delete()
+        dropped += 1
+    return dropped
+
+
+def columns_changed(json_table):
+    """Drop the indexes of columns that were deleted or whose type changed."""
+    current = {column_id(json_table, header): column_type(json_table, header) for header in json_table.headers}
+    stale = [
+        key for key, kind in
+        TableColumnIndex.objects.filter(table_id=json_table.pk).values_list('column_id', 'column_type')
+        if current.get(key) != kind
+    ]
+    if stale:
+        drop_indexes(json_table.pk, stale)
+
+
+def record_use(json_table, headers):
+    """Count a query by ``headers``; returns the headers that became hot and were queued for indexing."""
+    indexed = []
+    if not supported():
+        return indexed
+    for header in headers:
+        if header not in json_table.headers:
+            continue
+        key = f"column_uses:{json_table.pk}:{column_id(json_table, header)}"
+        cache.add(key, 0, USE_WINDOW)
+        try:
+            uses = cache.incr(key)
+        except ValueError:
+            # Expired between add and incr
+            continue
+        if uses != HOT_COLUMN_USES:
+            continue
+        if JsonTableRow.objects.filter(table_id=json_table.pk).count() >= MIN_INDEXED_ROWS:
+            if _queue(json_table, header)[1]:
+                indexed.append(header)
+    return indexed
@@ -0,0 +1,206 @@
+"""
+Typed column metadata and normalized "shadow" values for table rows.
+
+Row data stays exactly as the user typed it ("100 tk", "ajk"). Next to it each
+row keeps ``typed_data``: for every column with a non-text type, the parsed
+value in a form the database can sort, range-filter and sum:
+
+- number / currency -> float
+- date              -> ISO ``YYYY-MM-DD`` string (sorts chronologically)
+- category          -> trimmed, lower-cased label
+
+Column types are stored per table in ``JsonTable.column_types`` and are
+inferred from header names and existing values when not set explicitly.
+"""
+import re
+from datetime import date, datetime, timedelta
+
+from django.utils import timezone
+
+
+TEXT = "text"
+NUMBER = "number"
+CURRENCY = "currency"
+DATE = "date"
+CATEGORY = "category"
+
+COLUMN_TYPES = (TEXT, NUMBER, CURRENCY, DATE, CATEGORY)
+
+BANGLA_DIGITS = str.maketrans("০১২৩৪৫৬৭৮৯", "0123456789")
+
+CURRENCY_MARKERS_RE = re.compile(r"(৳|\$|€|£|\btk\b|\btaka\b|\bbdt\b|টাকা|\busd\b)", re.IGNORECASE)
+NUMBER_RE = re.compile(r"[-+]?\d+(?:\.\d+)?")
+MULTIPLIERS = {"k": 1_000, "hajar": 1_000, "hazar": 1_000, "হাজার": 1_000, "lakh": 100_000, "lac": 100_000, "লাখ": 100_000}
+MULTIPLIER_RE = re.compile(r"^\s*(k|hajar|hazar|হাজার|lakh|lac|লাখ)\b", re.IGNORECASE)
+
+RELATIVE_DAYS = {
+    "today": 0, "ajk": 0, "aj": 0, "ajke": 0, "আজ": 0, "আজকে": 0,
+    "yesterday": -1, "gotokal": -1, "gtkl": -1, "kal": -1, "গতকাল": -1,
+    "tomorrow": 1, "agamikal": 1, "আগামীকাল": 1,
+}
+
+DATE_FORMATS = (
+    "%Y-%m-%d", "%Y/%m/%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%d/%m/%y", "%d-%m-%y",
+    "%d %B %Y", "%d %b %Y", "%B %d, %Y", "%b %d, %Y", "%B %d %Y", "%b %d %Y",
+)
+DATE_FORMATS_WITHOUT_YEAR = ("%d %B", "%d %b", "%B %d", "%b %d")
+
+# Header words that hint at a column type when there are no values yet
+HEADER_HINTS = {
+    CURRENCY: ("amount", "cost", "price", "taka", "tk", "expense", "income", "salary", "khoroch",
+               "khorch", "dam", "bill", "total", "balance", "টাকা", "খরচ", "দাম", "আয়"),
+    DATE: ("date", "day", "tarikh", "when", "তারিখ", "দিন"),
+    NUMBER: ("qty", "quantity", "count", "number", "no", "pages", "age", "score", "sets", "reps", "পরিমাণ"),
+    CATEGORY: ("category", "type", "status", "method", "dhoron", "ধরন", "ক্যাটাগরি"),
+}
+
+# Share of non-empty values that must parse before a type is inferred
+INFERENCE_THRESHOLD = 0.8
+CATEGORY_MAX_DISTINCT = 20
+
+
+def _clean(value):
+    if value is None:
+        return ""
+    return str(value).strip().translate(BANGLA_DIGITS)
+
+
+def parse_number(value):
+    """Parse "1,200", "100 tk", "৳ ৫০০", "1.5k" or "2 lakh" into a float, or None."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = _clean(value).replace(",", "")
+    match = NUMBER_RE.search(text)
+    if not match:
+        return None
+    # Reject values that merely contain a number, like "Room 12B" or dates
+    rest = (text[:match.start()] + text[match.end():]).strip()
+    rest_without_currency = CURRENCY_MARKERS_RE.sub("", rest).strip()
+    number = float(match.group())
+    multiplier = MULTIPLIER_RE.match(text[match.end():])
+    if multiplier:
+        number *= MULTIPLIERS[multiplier.group(1).lower()]
+        rest_without_currency = CURRENCY_MARKERS_RE.sub("", text[match.end() + multiplier.end():]).strip()
+    if rest_without_currency and rest_without_currency not in ("/-", "=/-", "-"):
+        return None
+    return number
+
+
+def _today():
+    return timezone.localdate()
+
+
+def parse_date(value, today=None):
+    """Parse ISO and common day-first dates, and words like "ajk" or "gotokal", into a date, or None."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = _clean(value)
+    if not text:
+        return None
+    today = today or _today()
+
+    offset = RELATIVE_DAYS.get(text.lower())
+    if offset is not None:
+        return today + timedelta(days=offset)
+
+    text = re.sub(r"(\d)(st|nd|rd|th)\b", r"\1", text, flags=re.IGNORECASE)
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            continue
+    for date_format in DATE_FORMATS_WITHOUT_YEAR:
+        try:
+            parsed = datetime.strptime(f"{text} {today.year}", f"{date_format} %Y").date()
+            return parsed
+        except ValueError:
+            continue
+    # ISO timestamps ("2025-01-31T10:00:00")
+    try:
+        return datetime.fromisoformat(text).date()
+    except ValueError:
+        return None
+
+
+def is_relative_date(value):
+    return _clean(value).lower() in RELATIVE_DAYS
+
+
+def normalize_value(column_type, value, today=None):
+    """Return the shadow value for one cell, or None when it does not parse."""
+    if column_type in (NUMBER, CURRENCY):
+        return parse_number(value)
+    if column_type == DATE:
+        parsed = parse_date(value, today)
+        return parsed.isoformat() if parsed else None
+    if column_type == CATEGORY:
+        label = " ".join(_clean(value).split()).lower()
+        return label or None
+    return None
+
+
+def typed_row(data, column_types, previous=None, today=None):
+    """
+    Build ``typed_data`` for a row.
+
+    ``previous`` is the row's old ``typed_data``: relative dates ("ajk") keep
+    the date they resolved to when first written, instead of moving to the
+    day the row is recomputed.
+    """
+    previous = previous or {}
+    typed = {}
+    for header, column_type in (column_types or {}).items():
+        if column_type == TEXT or header not in (data or {}):
+            continue
+        value = data[header]
+        if column_type == DATE and header in previous and is_relative_date(value):
+            typed[header] = previous[header]
+            continue
+        normalized = normalize_value(column_type, value, today)
+        if normalized is not None:
+            typed[header] = normalized
+    return typed
+
+
+def hint_from_header(header):
+    """Guess a column type from its name alone."""
+    words = set(re.findall(r"\w+", str(header).lower()))
+    for column_type, hints in HEADER_HINTS.items():
+        if words & set(hints):
+            return column_type
+    return TEXT
+
+
+def infer_column_type(header, values):
+    """Infer a column type from its header and a sample of its values."""
+    values = [value for value in values if _clean(value)]
+    hint = hint_from_header(header)
+    if not values:
+        return hint
+
+    def share(parser):
+        return sum(1 for value in values if parser(value) is not None) / len(values)
+
+    if share(parse_date) >= INFERENCE_THRESHOLD and (hint == DATE or share(parse_number) < INFERENCE_THRESHOLD):
+        return DATE
+    if share(parse_number) >= INFERENCE_THRESHOLD:
+        has_currency = any(CURRENCY_MARKERS_RE.search(_clean(value)) for value in values)
+        return CURRENCY if has_currency or hint == CURRENCY else NUMBER
+    distinct = {" ".join(_clean(value).split()).lower() for value in values}
+    if hint == CATEGORY or (len(values) >= 5 and len(distinct) <= CATEGORY_MAX_DISTINCT
+                            and len(distinct) <= len(values) / 2):
+        return CATEGORY
+    return TEXT
+
+
+def infer_column_types(headers, rows_data, sample_size=200):
+    """Infer types for all headers from up to ``sample_size`` rows of data."""
+    sample = list(rows_data)[:sample_size]
+    return {
+        header: infer_column_type(header, [(row or {}).get(header) for row in sample])
+        for header in headers
+    }
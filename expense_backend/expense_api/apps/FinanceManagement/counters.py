@@ -0,0 +1,80 @@
+"""
+Denormalized row counters of tables.
+
+``DynamicTableData`` carries ``row_count``, ``row_bytes`` (the approximate
+size of the rows' stored JSON, see ``row_size``) and ``rows_modified_at``, so
+table lists and statistics never count rows. Every row write in ``services``
+passes its change to ``touch_table``, which applies it with F expressions in
+the same UPDATE that bumps the table's version; concurrent writers therefore
+never lose an increment.
+
+``recount`` measures a table from its rows and stores the result while
+holding the table's row lock, which serializes it with those UPDATEs. It is
+used after rewrites that are not row writes (compaction, clones) and by the
+``repair_table_counters`` command to reconcile drift.
+"""
+import json
+
+from django.db import transaction
+from django.db.models import Max
+
+from .models import DynamicTableData, JsonTableRow, TableChange
+
+
+ROW_OPS = ('insert', 'update', 'delete', 'move')
+
+
+def row_size(data):
+    """Approximate stored size of a row's data in bytes: its compact UTF-8 JSON."""
+    return len(json.dumps(data or {}, ensure_ascii=False, separators=(',', ':')).encode())
+
+
+def measure(table_id):
+    """``(row_count, row_bytes)`` of a table, computed from its rows."""
+    count = size = 0
+    for data in JsonTableRow.objects.filter(table_id=table_id).values_list('data', flat=True).iterator(chunk_size=2000):
+        count += 1
+        size += row_size(data)
+    return count, size
+
+
+def recount(table_id):
+    """
+    Store a table's counters as measured from its rows. Returns the
+    differences that were corrected, ``{field: (stored, actual)}``.
+    """
+    with transaction.atomic():
+        table = (
+            DynamicTableData.objects.select_for_update()
+            .only('row_count', 'row_bytes', 'rows_modified_at', 'modified_at')
+            .filter(pk=table_id).first()
+        )
+        if table is None:
+            return {}
+        count, size = measure(table_id)
+        actual = {'row_count': count, 'row_bytes': size}
+        if table.rows_modified_at is None and count:
+            # Best guess for tables that predate the counter: the latest row change, if still logged
+            latest = TableChange.objects.filter(table_id=table_id, op__in=ROW_OPS).aggregate(latest=Max('created_at'))
+            actual['rows_modified_at'] = latest['latest'] or table.modified_at
+
+        drift = {
+            field: (getattr(table, field), value) for field, value in actual.items()
+            if getattr(table, field) != value
+        }
+        if drift:
+            DynamicTableData.objects.filter(pk=table_id).update(**{field: value for field, (_, value) in drift.items()})
+    return drift
+
+
+def check(table_id):
+    """Compare a table's counters with its rows without changing them; returns ``{field: (stored, actual)}``."""
+    table = DynamicTableData.objects.only('row_count', 'row_bytes').filter(pk=table_id).first()
+    if table is None:
+        return {}
+    count, size = measure(table_id)
+    return {
+        field: (getattr(table, field), value)
+        for field, value in (('row_count', count), ('row_bytes', size))
+        if getattr(table, field) != value
+    }
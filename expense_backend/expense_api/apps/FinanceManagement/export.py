@@ -0,0 +1,116 @@
+"""
+Streaming export of table rows as CSV or NDJSON.
+
+Rows are read with ``iterator(chunk_size=...)`` (a server-side cursor on
+PostgreSQL) and written in header order into small buffers, so memory stays
+flat however large the table is. The header line is sent as soon as the
+response starts; after that output is flushed roughly every ``FLUSH_BYTES``.
+"""
+import csv
+import io
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+
+from . import schema
+from .models import JsonTableRow
+
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson; charset=utf-8", "ndjson"),
+}
+
+ROW_CHUNK_SIZE = 2000
+FLUSH_BYTES = 64 * 1024
+
+
+def _row_values(json_table):
+    read = schema.row_reader(json_table)
+    rows = (
+        JsonTableRow.objects.filter(table_id=json_table.pk)
+        .order_by('position', 'id')
+        .values_list('data', flat=True)
+        .iterator(chunk_size=ROW_CHUNK_SIZE)
+    )
+    return (read(data) for data in rows)
+
+
+def _buffered(lines):
+    """Join small pieces into chunks of about ``FLUSH_BYTES``; the first piece is sent alone."""
+    buffer = []
+    size = 0
+    first = True
+    for line in lines:
+        if first:
+            yield line.encode("utf-8")
+            first = False
+            continue
+        buffer.append(line)
+        size += len(line)
+        if size >= FLUSH_BYTES:
+            yield "".join(buffer).encode("utf-8")
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+
+def csv_lines(headers, rows):
+    """CSV text, one string per line; starts with a BOM so Excel reads Bangla text correctly."""
+    output = io.StringIO()
+    writer = csv.writer(output)
+
+    def line(values):
+        writer.writerow(values)
+        value = output.getvalue()
+        output.seek(0)
+        output.truncate(0)
+        return value
+
+    yield "﻿" + line(headers)
+    for data in rows:
+        data = data or {}
+        yield line(["" if data.get(header) is None else data.get(header) for header in headers])
+
+
+def ndjson_lines(headers, rows):
+    """One JSON object per line with keys in header order."""
+    for data in rows:
+        data = data or {}
+        yield json.dumps({header: data.get(header, "") for header in headers}, ensure_ascii=False) + "\n"
+
+
+def gzip_chunks(chunks):
+    """Gzip a byte stream, flushing after each chunk so data keeps flowing."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_table(json_table, export_format, compress=False):
+    """Return a byte iterator with the table's rows in ``export_format``."""
+    rows = _row_values(json_table)
+    lines = csv_lines(json_table.headers, rows) if export_format == "csv" else ndjson_lines(json_table.headers, rows)
+    chunks = _buffered(lines)
+    return gzip_chunks(chunks) if compress else chunks
+
+
+async def aiter_sync(iterator):
+    """
+    Serve a synchronous byte iterator from an async response.
+
+    Under ASGI Django would otherwise read a sync iterator into a list before
+    sending anything. Each chunk is produced in the request's sync thread, so
+    the database cursor behind the iterator stays on one connection.
+    """
+    sentinel = object()
+    while True:
+        chunk = await sync_to_async(next)(iterator, sentinel)
+        if chunk is sentinel:
+            return
+        yield chunk
@@ -0,0 +1,234 @@
+"""
+Bulk import of rows from CSV, JSON arrays or NDJSON.
+
+Files are parsed as streams, one record at a time, so an upload of any size
+is never loaded into memory at once. Valid rows are inserted with
+``bulk_create`` in chunks of ``batch_size`` rows, each chunk in its own
+transaction; invalid rows are reported with their line (CSV/NDJSON) or
+position (JSON array) and skipped.
+"""
+import csv
+import io
+import json
+import time
+
+from . import services
+
+
+IMPORT_FORMATS = ("csv", "json", "ndjson")
+MAX_REPORTED_ERRORS = 1000
+READ_SIZE = 64 * 1024
+
+
+class ImportFormatError(ValueError):
+    """The file cannot be parsed at all (as opposed to a single bad row)."""
+
+
+def detect_format(filename="", content_type=""):
+    name = (filename or "").lower()
+    if name.endswith((".ndjson", ".jsonl")) or "ndjson" in (content_type or ""):
+        return "ndjson"
+    if name.endswith(".json") or "json" in (content_type or ""):
+        return "json"
+    return "csv"
+
+
+def _text_stream(file):
+    if isinstance(file, io.TextIOBase):
+        return file
+    return io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+
+
+def iter_csv_records(file):
+    """Yield ``(line, record)`` for each CSV row; the first row holds the column names."""
+    reader = csv.reader(_text_stream(file))
+    try:
+        columns = [column.strip() for column in next(reader)]
+    except StopIteration:
+        return
+    except csv.Error as e:
+        raise ImportFormatError(f"Invalid CSV: {e}")
+    while True:
+        try:
+            values = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            raise ImportFormatError(f"Invalid CSV near line {reader.line_num}: {e}")
+        if len(values) > len(columns):
+            yield reader.line_num, ValueError(f"Row has {len(values)} values but there are {len(columns)} columns")
+            continue
+        yield reader.line_num, dict(zip(columns, values))
+
+
+def iter_ndjson_records(file):
+    """Yield ``(line, record)`` for each non-empty line of NDJSON."""
+    for line_number, line in enumerate(_text_stream(file), start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, ValueError(f"Invalid JSON: {e.msg}")
+
+
+def iter_json_array_records(file):
+    """
+    Yield ``(position, record)`` for each element of a top-level JSON array,
+    decoding one element at a time from a rolling buffer.
+    """
+    stream = _text_stream(file)
+    decoder = json.JSONDecoder()
+    buffer = ""
+    index = 0
+    position = 0
+    eof = False
+    started = False
+
+    def fill():
+        nonlocal buffer, index, eof
+        chunk = stream.read(READ_SIZE)
+        if not chunk:
+            eof = True
+        # Drop what has been consumed before growing the buffer
+        buffer = buffer[index:] + chunk
+        index = 0
+
+    while True:
+        while index < len(buffer) and buffer[index] in " \t\r\n":
+            index += 1
+        if index >= len(buffer):
+            if eof:
+                if not started:
+                    return
+                raise ImportFormatError("Unexpected end of JSON array")
+            fill()
+            continue
+
+        char = buffer[index]
+        if not started:
+            if char != "[":
+                raise ImportFormatError("JSON import must be an array of objects")
+            started = True
+            index += 1
+            continue
+        if char == "]":
+            return
+        if char == ",":
+            index += 1
+            continue
+
+        try:
+            record, end = decoder.raw_decode(buffer, index)
+        except json.JSONDecodeError as e:
+            if eof:
+                raise ImportFormatError(f"Invalid JSON after element {position}: {e.msg}")
+            fill()
+            continue
+        # A number at the end of the buffer may be cut off mid-way
+        if end == len(buffer) and not eof and not isinstance(record, (dict, list, str)):
+            fill()
+            continue
+        position += 1
+        index = end
+        yield position, record
+
+
+def iter_records(file, import_format):
+    if import_format == "csv":
+        return iter_csv_records(file)
+    if import_format == "ndjson":
+        return iter_ndjson_records(file)
+    # "json": an array, or NDJSON uploaded with a .json name
+    stream = _text_stream(file)
+    head = stream.read(READ_SIZE).lstrip()[:1]
+    stream.seek(0)
+    return iter_json_array_records(stream) if head == "[" else iter_ndjson_records(stream)
+
+
+def _validate(record, headers, create_columns):
+    """Return ``(data, new_columns)`` for a record, or raise ValueError."""
+    if isinstance(record, Exception):
+        raise record
+    if not isinstance(record, dict):
+        raise ValueError("Each row must be an object")
+
+    data = {}
+    new_columns = []
+    for key, value in record.items():
+        key = str(key).strip()
+        if not key:
+            if value not in (None, ""):
+                raise ValueError("Value without a column name")
+            continue
+        if isinstance(value, (dict, list)):
+            raise ValueError(f"Column '{key}' has a nested value")
+        if key not in headers:
+            if not create_columns:
+                raise ValueError(f"Unknown column '{key}'")
+            new_columns.append(key)
+        data[key] = "" if value is None else value
+
+    if not any(str(value).strip() for value in data.values()):
+        return None, []
+    return data, new_columns
+
+
+def import_rows(json_table, records, create_columns=False, batch_size=1000, dry_run=False):
+    """
+    Validate and insert records; returns a report.
+
+    ``records`` yields ``(line, record)`` pairs as produced by ``iter_records``.
+    Rows missing some columns get empty values for them. With ``dry_run``
+    nothing is written and the report shows what would happen.
+    """
+    started = time.perf_counter()
+    services.ensure_column_types(json_table)
+    headers = list(json_table.headers)
+    report = {
+        "inserted": 0,
+        "skipped_empty": 0,
+        "failed": 0,
+        "created_columns": [],
+        "errors": [],
+    }
+    batch = []
+
+    def flush():
+        if batch and not dry_run:
+            services.bulk_insert_rows(json_table, batch, batch_size)
+        report["inserted"] += len(batch)
+        batch.clear()
+
+    for line, record in records:
+        try:
+            data, new_columns = _validate(record, headers, create_columns)
+        except ValueError as e:
+            report["failed"] += 1
+            if len(report["errors"]) < MAX_REPORTED_ERRORS:
+                report["errors"].append({"line": line, "error": str(e)})
+            continue
+        if data is None:
+            report["skipped_empty"] += 1
+            continue
+
+        if new_columns:
+            # Rows already in the batch need the new column too
+            flush()
+            for column in new_columns:
+                if not dry_run:
+                    services.add_column(json_table, column)
+                headers.append(column)
+                report["created_columns"].append(column)
+
+        batch.append({header: data.get(header, "") for header in headers})
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    seconds = time.perf_counter() - started
+    report["seconds"] = round(seconds, 3)
+    report["rows_per_second"] = round(report["inserted"] / seconds) if seconds else report["inserted"]
+    report["errors_truncated"] = report["failed"] > len(report["errors"])
+    report["dry_run"] = dry_run
+    return report
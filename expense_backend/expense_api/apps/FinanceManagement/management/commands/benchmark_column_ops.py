@@ -0,0 +1,105 @@
+"""
+Compare column changes through column ids with the old row-by-row loop.
+
+Creates a scratch table with ``--rows`` rows, times add / rename / delete of a
+column both ways, plus the set-based compaction that later brings rows up to
+date, and removes the table (and its scratch user) afterwards.
+
+    python manage.py benchmark_column_ops --rows 50000
+"""
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from expense_api.apps.FinanceManagement import schema, services
+from expense_api.apps.FinanceManagement.models import JsonTableRow
+
+
+def loop_add(json_table, header):
+    json_table.headers.append(header)
+    json_table.save()
+    for row in json_table.rows.all():
+        row.data[header] = ""
+        row.save()
+
+
+def loop_rename(json_table, old_header, new_header):
+    json_table.headers[json_table.headers.index(old_header)] = new_header
+    json_table.save()
+    for row in json_table.rows.all():
+        if old_header in row.data:
+            row.data[new_header] = row.data.pop(old_header)
+            row.save()
+
+
+def loop_delete(json_table, header):
+    json_table.headers.remove(header)
+    json_table.save()
+    for row in json_table.rows.all():
+        if header in row.data:
+            del row.data[header]
+            row.save()
+
+
+class Command(BaseCommand):
+    help = "Benchmark column add/rename/delete against the per-row loop."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=50000)
+        parser.add_argument("--skip-loop", action="store_true", help="Only time the column id operations")
+
+    def timed(self, label, function, *args):
+        started = time.perf_counter()
+        function(*args)
+        seconds = time.perf_counter() - started
+        self.stdout.write(f"  {label:<8} {seconds:8.3f}s")
+        return seconds
+
+    def handle(self, *args, **options):
+        user = User.objects.create(username=f"benchmark-{uuid.uuid4().hex[:12]}")
+        try:
+            table, json_table = services.create_table(user, "Column benchmark", ["Date", "Amount", "Note"])
+            JsonTableRow.objects.bulk_create(
+                [
+                    JsonTableRow(
+                        table=json_table,
+                        data={"Date": "2025-01-01", "Amount": f"{i} tk", "Note": f"row {i}"},
+                        typed_data={"Date": "2025-01-01", "Amount": float(i)}
+                    )
+                    for i in range(options["rows"])
+                ],
+                batch_size=5000
+            )
+            self.stdout.write(f"{options['rows']} rows on {connection.vendor}")
+
+            totals = {}
+            if not options["skip_loop"]:
+                self.stdout.write("row-by-row loop:")
+                totals["loop"] = sum([
+                    self.timed("add", loop_add, json_table, "Loop"),
+                    self.timed("rename", loop_rename, json_table, "Loop", "Loop 2"),
+                    self.timed("delete", loop_delete, json_table, "Loop 2"),
+                ])
+
+            self.stdout.write("column ids:")
+            totals["column ids"] = sum([
+                self.timed("add", services.add_column, json_table, "Extra"),
+                self.timed("rename", services.rename_column, json_table, "Extra", "Extra 2"),
+                self.timed("delete", services.delete_columns, json_table, ["Amount"]),
+            ])
+            self.stdout.write("compaction (set-based, off the request path):")
+            totals["compaction"] = self.timed("compact", schema.compact_table, json_table.pk)
+
+            for label, seconds in totals.items():
+                self.stdout.write(f"{label}: {seconds:.3f}s total")
+            if "loop" in totals and totals["column ids"]:
+                self.stdout.write(self.style.SUCCESS(
+                    f"schema changes {totals['loop'] / totals['column ids']:.0f}x faster, "
+                    f"including compaction {totals['loop'] / (totals['column ids'] + totals['compaction']):.0f}x"
+                ))
+        finally:
+            # Cascades to the scratch table and its rows
+            user.delete()
@@ -0,0 +1,131 @@
+"""
+Compare the dict and the array row format on the same rows.
+
+Generates ``--rows`` rows shaped like the app's expense tables (long Bangla
+and English header names, amounts, dates, categories, notes and empty
+cells), stores them once per format and reports the stored size and the
+time to insert, read back through the row reader and filter on a text
+column in SQL, and removes the tables (and their scratch user) afterwards.
+With ``--table`` it only compares an existing table's rows in memory.
+
+    python manage.py benchmark_row_format --rows 20000
+    python manage.py benchmark_row_format --table 12
+"""
+import random
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from expense_api.apps.FinanceManagement import row_format, schema, services, table_query
+from expense_api.apps.FinanceManagement.models import JsonTable, JsonTableRow
+
+
+HEADERS = [
+    "তারিখ (Date)",
+    "খরচের বিবরণ / Expense description",
+    "পরিমাণ টাকায় (Amount in BDT)",
+    "Category / খাত",
+    "Payment method (bKash, Nagad, Cash, Card)",
+    "দোকান বা প্রাপক (Shop or payee)",
+    "Paid by / কে দিয়েছে",
+    "মাসিক বাজেট থেকে? (From monthly budget?)",
+    "Receipt number / রসিদ নম্বর",
+    "মন্তব্য (Notes)",
+]
+CATEGORIES = ["বাজার", "Transport", "বিদ্যুৎ বিল", "Rent", "Mobile recharge", "খাবার", "Medicine"]
+NOTES = ["", "", "chal ar dal", "সাপ্তাহিক বাজার", "office lunch", "রিকশা ভাড়া", "gas bill due next month"]
+
+
+def generate_rows(count, seed=7):
+    rng = random.Random(seed)
+    rows = []
+    for index in range(count):
+        rows.append({
+            HEADERS[0]: f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            HEADERS[1]: rng.choice(["চাল ও ডাল", "Uber to office", "Electricity bill", "বাসা ভাড়া", "ঔষধ"]),
+            HEADERS[2]: f"{rng.randint(20, 25000):,} টাকা",
+            HEADERS[3]: rng.choice(CATEGORIES),
+            HEADERS[4]: rng.choice(["bKash", "Nagad", "Cash", "Card"]),
+            HEADERS[5]: rng.choice(["", "Shwapno", "মীনা বাজার", "Pathao", "DESCO"]),
+            HEADERS[6]: rng.choice(["Rahim", "Karim", "আমি"]),
+            HEADERS[7]: rng.choice(["হ্যাঁ", "না", ""]),
+            HEADERS[8]: f"RC-{index:07d}" if rng.random() < 0.4 else "",
+            HEADERS[9]: rng.choice(NOTES),
+        })
+    return rows
+
+
+def stored_bytes(table_id):
+    """Stored size of a table's row data: on-disk (possibly compressed) size on PostgreSQL, text size elsewhere."""
+    table = connection.ops.quote_name(JsonTableRow._meta.db_table)
+    size = "pg_column_size(data)" if connection.vendor == "postgresql" else "length(CAST(data AS BLOB))"
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT COALESCE(SUM({size}), 0) FROM {table} WHERE table_id = %s", [table_id])
+        return cursor.fetchone()[0]
+
+
+class Command(BaseCommand):
+    help = "Benchmark the storage and speed of the dict and array row formats."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=20000)
+        parser.add_argument("--table", type=int, help="Only compare this existing table's rows, in memory")
+
+    def report(self, sizes):
+        for name, result in sizes.items():
+            self.stdout.write(
+                f"  {name:<6} {result['bytes']:>12,} bytes  "
+                f"encode {result['encode_seconds']:7.3f}s  decode {result['decode_seconds']:7.3f}s"
+            )
+
+    def timed(self, function, *args):
+        started = time.perf_counter()
+        result = function(*args)
+        return time.perf_counter() - started, result
+
+    def handle(self, *args, **options):
+        if options["table"]:
+            json_table = JsonTable.objects.get(pk=options["table"])
+            self.stdout.write(f"table #{json_table.pk} ({len(json_table.headers)} columns), in memory:")
+            self.report(row_format.compare(json_table))
+            return
+
+        rows = generate_rows(options["rows"])
+        self.stdout.write(f"{len(rows)} rows of {len(HEADERS)} columns on {connection.vendor}")
+        user = User.objects.create(username=f"benchmark-{uuid.uuid4().hex[:12]}")
+        try:
+            results = {}
+            for name in (JsonTable.DICT_ROWS, JsonTable.ARRAY_ROWS):
+                _, json_table = services.create_table(user, f"Row format benchmark ({name})", list(HEADERS))
+                row_format.convert_table(json_table.pk, name)
+                json_table.refresh_from_db()
+
+                insert, _ = self.timed(services.bulk_insert_rows, json_table, rows, 2000)
+                read = schema.row_reader(json_table)
+                data = JsonTableRow.objects.filter(table_id=json_table.pk).values_list('data', flat=True)
+                scan, _ = self.timed(lambda: [read(values) for values in data.iterator(chunk_size=2000)])
+                matches = table_query.apply_filters(
+                    JsonTableRow.objects.filter(table_id=json_table.pk), json_table,
+                    {"column": HEADERS[9], "op": "contains", "value": "bill"}
+                )
+                search, _ = self.timed(matches.count)
+                results[name] = {"stored": stored_bytes(json_table.pk), "insert": insert, "read": scan, "filter": search}
+                self.stdout.write(
+                    f"  {name:<6} stored {results[name]['stored']:>12,} bytes  insert {insert:7.3f}s  "
+                    f"read {scan:7.3f}s  filter {search:7.3f}s"
+                )
+
+            self.stdout.write("in memory (compact JSON text, with serialization):")
+            self.report(row_format.compare(json_table))
+
+            dict_rows, array_rows = results[JsonTable.DICT_ROWS], results[JsonTable.ARRAY_ROWS]
+            self.stdout.write(self.style.SUCCESS(
+                f"array rows take {array_rows['stored'] / dict_rows['stored']:.0%} of the dict rows' storage, "
+                f"read {dict_rows['read'] / array_rows['read']:.1f}x as fast"
+            ))
+        finally:
+            # Cascades to the scratch tables and their rows
+            user.delete()
@@ -0,0 +1,59 @@
+"""
+Build the column indexes queued for hot columns.
+
+Requests only queue an index when a column becomes hot (see
+``column_indexes``); this builds them concurrently, outside any request.
+Failed builds are dropped and kept as failed with their error;
+``--retry-failed`` queues them again. Run it from cron, or keep it running
+with ``--loop``.
+
+    python manage.py build_column_indexes
+    python manage.py build_column_indexes --retry-failed
+    python manage.py build_column_indexes --loop --interval 60
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from expense_api.apps.FinanceManagement import column_indexes
+from expense_api.apps.FinanceManagement.models import TableColumnIndex
+
+
+class Command(BaseCommand):
+    help = "Build the queued expression indexes of hot table columns."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, help="Build at most this many per pass")
+        parser.add_argument("--retry-failed", action="store_true", help="Queue failed builds again first")
+        parser.add_argument("--loop", action="store_true", help="Keep running, building every --interval seconds")
+        parser.add_argument("--interval", type=float, default=60.0, help="Seconds between passes with --loop")
+
+    def build(self, options):
+        built = failed = 0
+        for record, ok in column_indexes.build_pending(options["limit"]):
+            if ok:
+                built += 1
+                self.stdout.write(f"#{record.table_id}: indexed {record.column_id} ({record.column_type})")
+                continue
+            record = TableColumnIndex.objects.filter(pk=record.pk).first()
+            if record is None:
+                self.stdout.write("  skipped a column that was deleted or changed type")
+            else:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f"#{record.table_id}: {record.column_id} failed: {record.error}"))
+        return built, failed
+
+    def handle(self, *args, **options):
+        if not column_indexes.supported():
+            raise CommandError("Column indexes are only supported on PostgreSQL")
+        if options["retry_failed"]:
+            TableColumnIndex.objects.filter(status=TableColumnIndex.FAILED).update(status=TableColumnIndex.PENDING, error="")
+        try:
+            while True:
+                built, failed = self.build(options)
+                if not options["loop"]:
+                    self.stdout.write(self.style.SUCCESS(f"Built {built} indexes, {failed} failed"))
+                    return
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping index builds")
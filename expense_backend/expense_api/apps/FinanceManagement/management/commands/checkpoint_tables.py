@@ -0,0 +1,59 @@
+"""
+Take compressed checkpoints of tables that changed since their last one.
+
+Restoring a table replays its change log from the nearest checkpoint (see
+``snapshots``), so regular checkpoints keep restores short and let points
+after a large import be restored. Checkpoints that no snapshot uses are
+pruned down to the latest ``--keep`` of each table. Run it from cron, or
+keep it running with ``--loop``.
+
+    python manage.py checkpoint_tables
+    python manage.py checkpoint_tables --table 12 --min-changes 0
+    python manage.py checkpoint_tables --keep 3 --snapshot-days 90
+    python manage.py checkpoint_tables --loop --interval 600
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from expense_api.apps.FinanceManagement import snapshots
+
+
+class Command(BaseCommand):
+    help = "Checkpoint tables with enough changes since their last checkpoint, and prune old checkpoints."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--table", type=int, help="Only this table")
+        parser.add_argument(
+            "--min-changes", type=int, default=snapshots.CHECKPOINT_CHANGES,
+            help="Changes since the last checkpoint before taking another"
+        )
+        parser.add_argument("--keep", type=int, default=2, help="Checkpoints kept per table besides those snapshots use")
+        parser.add_argument("--snapshot-days", type=int, help="Also delete snapshots older than this")
+        parser.add_argument("--loop", action="store_true", help="Keep running, checkpointing every --interval seconds")
+        parser.add_argument("--interval", type=float, default=600.0, help="Seconds between passes with --loop")
+
+    def checkpoint(self, options):
+        tables = 0
+        for table_id, checkpoint in snapshots.checkpoint_tables(options["min_changes"], options["table"]):
+            tables += 1
+            ratio = len(checkpoint.content) / checkpoint.raw_bytes if checkpoint.raw_bytes else 0
+            self.stdout.write(
+                f"#{table_id}: {checkpoint.row_count} rows at #{checkpoint.seq}, "
+                f"{len(checkpoint.content):,} bytes ({ratio:.0%} of {checkpoint.raw_bytes:,})"
+            )
+        return tables, snapshots.prune(options["keep"], options["snapshot_days"])
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                tables, (removed_snapshots, removed_checkpoints) = self.checkpoint(options)
+                if not options["loop"]:
+                    self.stdout.write(self.style.SUCCESS(
+                        f"Checkpointed {tables} tables, removed {removed_checkpoints} checkpoints "
+                        f"and {removed_snapshots} snapshots"
+                    ))
+                    return
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping checkpoints")
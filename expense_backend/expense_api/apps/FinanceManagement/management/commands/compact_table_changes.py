@@ -0,0 +1,25 @@
+"""
+Trim the table change logs used for delta sync.
+
+Clients that were offline longer than the retained history are told to
+reload the table, so this only bounds the log's size.
+
+    python manage.py compact_table_changes
+    python manage.py compact_table_changes --keep-days 7 --keep-per-table 2000
+"""
+from django.core.management.base import BaseCommand
+
+from expense_api.apps.FinanceManagement import changelog
+
+
+class Command(BaseCommand):
+    help = "Remove old entries from the table change logs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keep-days", type=int, default=30, help="Keep entries newer than this")
+        parser.add_argument("--keep-per-table", type=int, default=10000, help="Always keep at most this many per table")
+        parser.add_argument("--table", type=int, help="Only this table")
+
+    def handle(self, *args, **options):
+        removed = changelog.compact(options["keep_days"], options["keep_per_table"], options["table"])
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} change log entries"))
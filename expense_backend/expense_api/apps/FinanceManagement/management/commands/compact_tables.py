@@ -0,0 +1,50 @@
+"""
+Bring row bodies in line with their table's columns.
+
+Column changes only touch table metadata (see ``schema``). This rewrites
+the rows of tables with pending changes in set-based updates: values of
+deleted columns are removed and added columns get their default stored.
+Run it from cron, or keep it running with ``--loop``.
+
+    python manage.py compact_tables
+    python manage.py compact_tables --table 12
+    python manage.py compact_tables --loop --interval 60
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from expense_api.apps.FinanceManagement import schema
+
+
+class Command(BaseCommand):
+    help = "Compact rows of tables whose columns were added or deleted."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--table", type=int, help="Only this table")
+        parser.add_argument("--limit", type=int, help="At most this many tables per pass")
+        parser.add_argument("--loop", action="store_true", help="Keep running, compacting every --interval seconds")
+        parser.add_argument("--interval", type=float, default=60.0, help="Seconds between passes with --loop")
+
+    def compact(self, options):
+        if options["table"]:
+            results = [(options["table"], schema.compact_table(options["table"]))]
+        else:
+            results = schema.compact_tables(options["limit"])
+        count = 0
+        for table_id, updated in results:
+            if updated is not None:
+                count += 1
+                self.stdout.write(f"#{table_id}: {updated} row updates")
+        return count
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                count = self.compact(options)
+                if not options["loop"]:
+                    self.stdout.write(self.style.SUCCESS(f"Compacted {count} tables"))
+                    return
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping compaction")
@@ -0,0 +1,51 @@
+"""
+Convert tables between the dict and the array row format.
+
+Array rows store values in the order of a layout of column ids instead of
+repeating every column id in every row (see ``schema``), which pays off for
+wide tables with long header names. ``--dry-run`` reports what each table
+would take in both formats without writing anything.
+
+    python manage.py convert_row_format --to array --dry-run
+    python manage.py convert_row_format --to array --min-columns 8
+    python manage.py convert_row_format --to dict --table 12
+"""
+from django.core.management.base import BaseCommand
+
+from expense_api.apps.FinanceManagement import row_format
+from expense_api.apps.FinanceManagement.models import JsonTable
+
+
+class Command(BaseCommand):
+    help = "Rewrite the rows of tables in the dict or the array row format."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--to", required=True, choices=[JsonTable.DICT_ROWS, JsonTable.ARRAY_ROWS])
+        parser.add_argument("--table", type=int, help="Only this table")
+        parser.add_argument("--min-columns", type=int, default=0, help="Only tables with at least this many columns")
+        parser.add_argument("--dry-run", action="store_true", help="Only compare the sizes of both formats")
+
+    def handle(self, *args, **options):
+        tables = (
+            JsonTable.objects.filter(table__deleted_at__isnull=True)
+            .exclude(row_format=options["to"]).order_by('pk')
+        )
+        if options["table"]:
+            tables = tables.filter(pk=options["table"])
+        tables = [table for table in tables.iterator() if len(table.headers) >= options["min_columns"]]
+
+        converted = rows = 0
+        for table in tables:
+            if options["dry_run"]:
+                sizes = row_format.compare(table)
+                before, after = sizes[table.row_format]["bytes"], sizes[options["to"]]["bytes"]
+                change = f"{(after - before) / before:+.0%}" if before else "n/a"
+                self.stdout.write(f"#{table.pk}: {sizes[table.row_format]['rows']} rows, {before} -> {after} bytes ({change})")
+                continue
+            count = row_format.convert_table(table.pk, options["to"])
+            if count is not None:
+                converted += 1
+                rows += count
+                self.stdout.write(f"#{table.pk}: {count} rows")
+        if not options["dry_run"]:
+            self.stdout.write(self.style.SUCCESS(f"Converted {converted} tables ({rows} rows) to {options['to']} rows"))
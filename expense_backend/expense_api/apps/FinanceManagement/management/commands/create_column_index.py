@@ -0,0 +1,59 @@
+"""
+Create, drop or list the expression indexes on table columns.
+
+Hot columns are queued and built by ``build_column_indexes`` (see
+``column_indexes``); this indexes a column right away, for example before a
+dashboard goes live.
+
+    python manage.py create_column_index --list
+    python manage.py create_column_index --table 12 --column Date
+    python manage.py create_column_index --table 12 --column Date --drop
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from expense_api.apps.FinanceManagement import column_indexes
+from expense_api.apps.FinanceManagement.models import JsonTable, TableColumnIndex
+from expense_api.apps.FinanceManagement.schema import column_id
+
+
+class Command(BaseCommand):
+    help = "Create or drop the expression index on one column of a table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--table", type=int, help="Table id")
+        parser.add_argument("--column", help="Column header")
+        parser.add_argument("--drop", action="store_true", help="Drop the column's index instead")
+        parser.add_argument("--list", action="store_true", help="List the existing column indexes")
+
+    def handle(self, *args, **options):
+        if options["list"]:
+            for index in TableColumnIndex.objects.order_by('table_id', 'column_id'):
+                self.stdout.write(
+                    f"#{index.table_id} {index.column_id} ({index.column_type}): {index.name} [{index.status}]"
+                    + (f" {index.error}" if index.error else "")
+                )
+            return
+
+        if not options["table"] or not options["column"]:
+            raise CommandError("--table and --column are required")
+        json_table = JsonTable.objects.filter(pk=options["table"]).first()
+        if json_table is None:
+            raise CommandError(f"Table {options['table']} does not exist")
+
+        if not options["drop"] and not column_indexes.supported():
+            raise CommandError("Column indexes are only supported on PostgreSQL")
+        try:
+            if options["drop"]:
+                dropped = column_indexes.drop_indexes(json_table.pk, [column_id(json_table, options["column"])])
+                self.stdout.write(self.style.SUCCESS(f"Dropped {dropped} indexes"))
+            elif column_indexes.create_index(json_table, options["column"]):
+                self.stdout.write(self.style.SUCCESS(f"Indexed '{options['column']}'"))
+            else:
+                index = TableColumnIndex.objects.filter(
+                    table_id=json_table.pk, column_id=column_id(json_table, options["column"])
+                ).first()
+                if index is not None and index.status == TableColumnIndex.FAILED:
+                    raise CommandError(f"Indexing '{options['column']}' failed: {index.error}")
+                self.stdout.write(f"'{options['column']}' is already indexed")
+        except ValueError as e:
+            raise CommandError(str(e))
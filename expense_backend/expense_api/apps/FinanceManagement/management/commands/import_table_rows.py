@@ -0,0 +1,57 @@
+"""
+Import rows into a table from a CSV, JSON array or NDJSON file.
+
+The file is streamed, so it can be larger than memory.
+
+    python manage.py import_table_rows --table 12 expenses.csv
+    python manage.py import_table_rows --table 12 dump.ndjson --create-columns --dry-run
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from expense_api.apps.FinanceManagement.importer import (
+    IMPORT_FORMATS, ImportFormatError, detect_format, import_rows, iter_records
+)
+from expense_api.apps.FinanceManagement.models import JsonTable
+
+
+class Command(BaseCommand):
+    help = "Bulk import rows into a table from a CSV, JSON or NDJSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import")
+        parser.add_argument("--table", type=int, required=True, help="JsonTable id to import into")
+        parser.add_argument("--format", choices=IMPORT_FORMATS, help="Defaults to the file extension")
+        parser.add_argument("--create-columns", action="store_true", help="Add columns that the table does not have yet")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows per insert batch")
+        parser.add_argument("--dry-run", action="store_true", help="Validate only, write nothing")
+
+    def handle(self, *args, **options):
+        json_table = JsonTable.objects.select_related('table').filter(pk=options["table"]).first()
+        if json_table is None:
+            raise CommandError(f"Table {options['table']} does not exist")
+
+        import_format = options["format"] or detect_format(options["path"])
+        try:
+            with open(options["path"], "rb") as file:
+                report = import_rows(
+                    json_table,
+                    iter_records(file, import_format),
+                    create_columns=options["create_columns"],
+                    batch_size=options["batch_size"],
+                    dry_run=options["dry_run"]
+                )
+        except (OSError, ImportFormatError, UnicodeDecodeError) as e:
+            raise CommandError(str(e))
+
+        errors = report.pop("errors")
+        for error in errors[:20]:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        if len(errors) > 20:
+            self.stderr.write(f"... and {report['failed'] - 20} more errors")
+        self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Would import' if report['dry_run'] else 'Imported'} {report['inserted']} rows "
+            f"into #{json_table.pk} {json_table.table.table_name}"
+        ))
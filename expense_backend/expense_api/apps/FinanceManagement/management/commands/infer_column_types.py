@@ -0,0 +1,30 @@
+"""
+Infer column types and fill in typed shadow values for existing tables.
+
+New tables get types from their header names and tables without types are
+inferred on their next write, so this is a one-off backfill.
+
+    python manage.py infer_column_types
+    python manage.py infer_column_types --table 12 --reinfer
+"""
+from django.core.management.base import BaseCommand
+
+from expense_api.apps.FinanceManagement import services
+from expense_api.apps.FinanceManagement.models import JsonTable
+
+
+class Command(BaseCommand):
+    help = "Infer column types from row values and recompute typed row data."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--table", type=int, help="Only this table")
+        parser.add_argument("--reinfer", action="store_true", help="Also re-infer columns that already have a type")
+
+    def handle(self, *args, **options):
+        tables = JsonTable.objects.select_related('table').order_by('pk')
+        if options["table"]:
+            tables = tables.filter(pk=options["table"])
+        for json_table in tables.iterator():
+            column_types = services.refresh_column_types(json_table, keep_existing=not options["reinfer"])
+            self.stdout.write(f"#{json_table.pk} {json_table.table.table_name}: {column_types}")
+        self.stdout.write(self.style.SUCCESS("Done"))
@@ -0,0 +1,58 @@
+"""
+Remove the rows of deleted tables.
+
+Deleting a table only hides it (see ``services.delete_table``); this deletes
+its rows in bounded batches and then the table itself. It can be stopped at
+any time and picks up where it left off. Run it from cron, or keep it
+running with ``--loop``.
+
+    python manage.py purge_deleted_tables
+    python manage.py purge_deleted_tables --table 12
+    python manage.py purge_deleted_tables --batch-size 2000 --pause 0.5 --max-seconds 300
+    python manage.py purge_deleted_tables --loop --interval 60
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from expense_api.apps.FinanceManagement import purge
+
+
+class Command(BaseCommand):
+    help = "Delete the rows of deleted tables in batches, then the tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--table", type=int, help="Only this table")
+        parser.add_argument("--batch-size", type=int, default=purge.PURGE_BATCH_SIZE, help="Rows per transaction")
+        parser.add_argument("--max-seconds", type=float, help="Stop a pass after this long; the next one continues")
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches")
+        parser.add_argument("--loop", action="store_true", help="Keep running, purging every --interval seconds")
+        parser.add_argument("--interval", type=float, default=60.0, help="Seconds between passes with --loop")
+
+    def purge(self, options):
+        batch = dict(batch_size=options["batch_size"], max_seconds=options["max_seconds"], pause=options["pause"])
+        if options["table"]:
+            results = ((options["table"], *progress) for progress in purge.purge_table(options["table"], **batch))
+        else:
+            results = purge.purge_tables(**batch)
+        deleted = 0
+        tables = 0
+        for table_id, count, remaining in results:
+            deleted += count
+            if count:
+                self.stdout.write(f"#{table_id}: deleted {count} rows, about {remaining} left")
+            else:
+                tables += 1
+                self.stdout.write(f"#{table_id}: purged")
+        return deleted, tables
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                deleted, tables = self.purge(options)
+                if not options["loop"]:
+                    self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} rows, purged {tables} tables"))
+                    return
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping purge")
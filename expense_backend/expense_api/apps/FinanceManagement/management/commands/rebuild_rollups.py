@@ -0,0 +1,48 @@
+"""
+Build or verify the monthly rollups of tables.
+
+Rollups are maintained on every write once built, so this backfills tables
+created before rollups existed (``--missing``), rebuilds after a suspected
+drift, or with ``--check`` only reports where rollups and rows disagree.
+
+    python manage.py rebuild_rollups --missing
+    python manage.py rebuild_rollups --table 12
+    python manage.py rebuild_rollups --check
+"""
+from django.core.management.base import BaseCommand
+
+from expense_api.apps.FinanceManagement import rollups
+from expense_api.apps.FinanceManagement.models import JsonTable
+
+
+class Command(BaseCommand):
+    help = "Rebuild the monthly rollups of tables from their rows, or check them."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--table", type=int, help="Only this table")
+        parser.add_argument("--missing", action="store_true", help="Only tables whose rollups are not built yet")
+        parser.add_argument("--check", action="store_true", help="Report differences instead of rebuilding")
+
+    def handle(self, *args, **options):
+        tables = JsonTable.objects.order_by('pk')
+        if options["table"]:
+            tables = tables.filter(pk=options["table"])
+        if options["missing"]:
+            tables = tables.filter(rollup_config__isnull=True)
+
+        count = problems = 0
+        for json_table in tables.iterator():
+            count += 1
+            if not options["check"]:
+                self.stdout.write(f"#{json_table.pk}: {rollups.rebuild_table(json_table)} rollups")
+                continue
+            for problem in rollups.check_table(json_table):
+                problems += 1
+                self.stdout.write(f"#{json_table.pk}: {problem}")
+
+        if not options["check"]:
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt rollups of {count} tables"))
+        elif problems:
+            self.stdout.write(self.style.ERROR(f"{problems} differences in {count} tables"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Rollups of {count} tables match their rows"))
@@ -0,0 +1,37 @@
+"""
+Give rows evenly spaced position keys.
+
+Rows get a position when they are written, so this backfills rows created
+before positions existed (they come first, in id order, until then). With
+``--all`` it also respaces tables whose keys grew long from many moves.
+
+    python manage.py rebuild_row_positions
+    python manage.py rebuild_row_positions --table 12
+    python manage.py rebuild_row_positions --all
+"""
+from django.core.management.base import BaseCommand
+
+from expense_api.apps.FinanceManagement import positions
+from expense_api.apps.FinanceManagement.models import JsonTable, JsonTableRow
+
+
+class Command(BaseCommand):
+    help = "Assign position keys to rows without one, keeping their order."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--table", type=int, help="Only this table")
+        parser.add_argument("--all", action="store_true", help="Respace every table, not only those with unkeyed rows")
+
+    def handle(self, *args, **options):
+        table_ids = JsonTable.objects.filter(table__deleted_at__isnull=True).order_by('pk').values_list('pk', flat=True)
+        if options["table"]:
+            table_ids = table_ids.filter(pk=options["table"])
+        elif not options["all"]:
+            table_ids = table_ids.filter(
+                pk__in=JsonTableRow.objects.filter(position='').values('table_id')
+            )
+        tables = count = 0
+        for table_id in table_ids:
+            count += positions.rebalance(table_id)
+            tables += 1
+        self.stdout.write(self.style.SUCCESS(f"Positioned {count} rows of {tables} tables"))
@@ -0,0 +1,30 @@
+"""
+Rebuild the row full-text search index.
+
+Rows are indexed on every write, so this is only needed after changing the
+tokenizer in ``table_index``, or for rows written before the index existed.
+
+    python manage.py rebuild_row_search
+    python manage.py rebuild_row_search --table 12
+"""
+from django.core.management.base import BaseCommand
+
+from expense_api.apps.FinanceManagement import row_search
+from expense_api.apps.FinanceManagement.models import JsonTable
+
+
+class Command(BaseCommand):
+    help = "Re-index the contents of table rows for full-text search."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--table", type=int, help="Only this table")
+
+    def handle(self, *args, **options):
+        table_ids = JsonTable.objects.order_by('pk').values_list('pk', flat=True)
+        if options["table"]:
+            table_ids = table_ids.filter(pk=options["table"])
+        row_search.install()
+        count = 0
+        for table_id in table_ids:
+            count += row_search.index_table(table_id)
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} rows"))
@@ -0,0 +1,24 @@
+"""
+Rebuild the table access rows from table owners and shares.
+
+Access rows are maintained when tables are created, shared and unshared, and
+tables without any get theirs on migrate, so this repairs them after
+``shared_with`` was changed outside ``services``.
+
+    python manage.py rebuild_table_access
+    python manage.py rebuild_table_access --table 12
+"""
+from django.core.management.base import BaseCommand
+
+from expense_api.apps.FinanceManagement import access
+
+
+class Command(BaseCommand):
+    help = "Recreate the access rows of tables from their owners and shares."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--table", type=int, help="Only this table")
+
+    def handle(self, *args, **options):
+        count = access.rebuild([options["table"]] if options["table"] else None)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} access rows"))
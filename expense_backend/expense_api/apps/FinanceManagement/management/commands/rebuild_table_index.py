@@ -0,0 +1,24 @@
+"""
+Rebuild the table search index.
+
+Tables are indexed on every write, so this is only needed after changing the
+tokenizer or concept list in ``table_index``, or for tables created before the
+index existed.
+
+    python manage.py rebuild_table_index
+    python manage.py rebuild_table_index --user 1
+"""
+from django.core.management.base import BaseCommand
+
+from expense_api.apps.FinanceManagement.table_index import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the search index over table names, descriptions and headers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, help="Only rebuild this user's tables")
+
+    def handle(self, *args, **options):
+        count = rebuild_index(options["user"])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} tables"))
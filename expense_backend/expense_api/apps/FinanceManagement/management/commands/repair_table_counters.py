@@ -0,0 +1,46 @@
+"""
+Reconcile the row counters of tables with their rows.
+
+Counters are updated on every row write, so drift only comes from rows
+written outside ``services`` or from tables that predate the counters. This
+recounts every table (or one), or with ``--check`` only reports the
+differences.
+
+    python manage.py repair_table_counters
+    python manage.py repair_table_counters --table 12
+    python manage.py repair_table_counters --check
+"""
+from django.core.management.base import BaseCommand
+
+from expense_api.apps.FinanceManagement import counters
+from expense_api.apps.FinanceManagement.models import DynamicTableData
+
+
+class Command(BaseCommand):
+    help = "Recount the rows and row bytes of tables and fix counters that drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--table", type=int, help="Only this table")
+        parser.add_argument("--check", action="store_true", help="Report differences instead of fixing them")
+
+    def handle(self, *args, **options):
+        table_ids = DynamicTableData.objects.filter(deleted_at__isnull=True).order_by('pk').values_list('pk', flat=True)
+        if options["table"]:
+            table_ids = table_ids.filter(pk=options["table"])
+
+        count = drifted = 0
+        for table_id in table_ids.iterator():
+            count += 1
+            drift = counters.check(table_id) if options["check"] else counters.recount(table_id)
+            if drift:
+                drifted += 1
+                self.stdout.write(f"#{table_id}: " + ", ".join(
+                    f"{field} {stored} -> {actual}" for field, (stored, actual) in drift.items()
+                ))
+
+        if options["check"] and drifted:
+            self.stdout.write(self.style.ERROR(f"{drifted} of {count} tables have drifted counters"))
+        elif options["check"]:
+            self.stdout.write(self.style.SUCCESS(f"Counters of {count} tables match their rows"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Repaired {drifted} of {count} tables"))
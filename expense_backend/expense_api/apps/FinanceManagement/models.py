@@ -10,14 +10,64 @@ class DynamicTableData(models.Model):
     description = models.TextField(blank=True, null=True)
     pending_count = models.IntegerField(default=0)
     is_shared = models.BooleanField(default=False)
+    version = models.PositiveBigIntegerField(default=1)  # Bumped on every change, see services.touch_table
+    change_seq = models.PositiveBigIntegerField(default=0)  # Seq of the latest TableChange
+    change_floor = models.PositiveBigIntegerField(default=0)  # Changes up to this seq were compacted away
+    # Row counters, updated with every row write, see counters.py; signed so drift never fails a write
+    row_count = models.IntegerField(default=0)
+    row_bytes = models.BigIntegerField(default=0)  # Approximate size of the rows' stored JSON
+    rows_modified_at = models.DateTimeField(null=True, blank=True)  # Last row insert, update or delete
+    deleted_at = models.DateTimeField(null=True, blank=True)  # Deleted, rows still being purged, see purge.py
 
     def __str__(self):
         return self.table_name
 
 
+class TableCatalogVersion(models.Model):
+    """Bumped whenever any table the user owns or can see changes; the table list's ETag."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='table_catalog_version')
+    version = models.PositiveBigIntegerField(default=1)
+
+    def __str__(self):
+        return f"Table catalog v{self.version} of user {self.user_id}"
+
+
+class TableAccess(models.Model):
+    """One user's role on one table, kept in step with ``user`` and ``shared_with`` by services.py, see access.py."""
+    OWNER = 'owner'
+    SHARED = 'shared'
+    ROLE_CHOICES = [(OWNER, 'Owner'), (SHARED, 'Shared')]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='table_access')
+    table = models.ForeignKey(DynamicTableData, on_delete=models.CASCADE, related_name='access')
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'table'], name='unique_table_access'),
+        ]
+
+    def __str__(self):
+        return f"{self.role} access of user {self.user_id} to table {self.table_id}"
+
+
 class JsonTable(models.Model):
+    DICT_ROWS = 'dict'
+    ARRAY_ROWS = 'array'
+    ROW_FORMAT_CHOICES = [(DICT_ROWS, 'Dict'), (ARRAY_ROWS, 'Array')]
+
     table = models.OneToOneField(DynamicTableData, on_delete=models.CASCADE, primary_key=True)
     headers = models.JSONField()  # Store headers as list of strings
+    column_types = models.JSONField(default=dict, blank=True)  # header -> text/number/currency/date/category
+    # Column ids for row data, see schema.py
+    column_ids = models.JSONField(default=dict, blank=True)  # header -> column id, when they differ
+    column_defaults = models.JSONField(default=dict, blank=True)  # column id -> value for rows without it
+    retired_columns = models.JSONField(default=list, blank=True)  # ids of deleted columns, never reused
+    needs_compaction = models.BooleanField(default=False)
+    rollup_config = models.JSONField(null=True, blank=True)  # Columns the rollups are built for, see rollups.py
+    # How row data is stored, see schema.py: dicts keyed by column id, or arrays aligned to a layout
+    row_format = models.CharField(max_length=5, choices=ROW_FORMAT_CHOICES, default=DICT_ROWS)
+    row_layouts = models.JSONField(default=list, blank=True)  # Column ids of each array layout version
 
     def __str__(self):
         return f"JsonTable for {self.table.table_name}"
@@ -26,6 +76,145 @@ class JsonTable(models.Model):
 class JsonTableRow(models.Model):
     table = models.ForeignKey(JsonTable, related_name='rows', on_delete=models.CASCADE)
     data = models.JSONField()  # Store each row as a JSON object
+    typed_data = models.JSONField(default=dict, blank=True)  # Parsed values of typed columns, see column_types.py
+    # Both are keyed by column id (schema.column_id), not by header name
+    position = models.CharField(max_length=255, blank=True, default='')  # Fractional order key, see positions.py
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['table', 'position', 'id']),
+        ]
+
+    def __str__(self):
+        return f"Row {self.id} of JsonTable {self.table_id}"
+
+
+class TableRollup(models.Model):
+    """Running totals of one group of a table's rows for one month, see rollups.py."""
+    table = models.ForeignKey(JsonTable, related_name='rollups', on_delete=models.CASCADE)
+    period = models.CharField(max_length=7, blank=True)  # YYYY-MM of the rollup date column, '' without a date
+    dimension = models.CharField(max_length=255, blank=True)  # Column id grouped by, '' for all rows
+    group_key = models.TextField(blank=True)  # Category value, '' for rows without one
+    measure = models.CharField(max_length=255, blank=True)  # Column id summed, '' for the row count
+    row_count = models.BigIntegerField(default=0)
+    total = models.FloatField(default=0)
+    minimum = models.FloatField(null=True, blank=True)
+    maximum = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['table', 'dimension', 'measure', 'period', 'group_key'], name='unique_table_rollup'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.period or '-'} {self.dimension}={self.group_key} {self.measure or 'rows'} of table {self.table_id}"
+
+
+class RowSearchDocument(models.Model):
+    """Searchable words of one row, full-text indexed outside the ORM, see row_search.py."""
+    row = models.OneToOneField(JsonTableRow, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    table = models.ForeignKey(JsonTable, related_name='+', on_delete=models.CASCADE)
+    document = models.TextField()
+
+    def __str__(self):
+        return f"Search document of row {self.row_id}"
+
+
+class TableColumnIndex(models.Model):
+    """A partial expression index on the typed value of one column of a table, see column_indexes.py."""
+    PENDING = 'pending'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed'),
+    ]
+
+    table = models.ForeignKey(JsonTable, related_name='column_indexes', on_delete=models.CASCADE)
+    column_id = models.CharField(max_length=255)
+    column_type = models.CharField(max_length=20)
+    name = models.CharField(max_length=30, unique=True)  # Name of the database index
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    error = models.TextField(blank=True)  # Why the last build failed
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} on {self.column_id} of table {self.table_id} ({self.status})"
+
+
+class TableSearchTerm(models.Model):
+    """One weighted term of a table's name, description or headers (inverted index entry)."""
+    table = models.ForeignKey(DynamicTableData, related_name='search_terms', on_delete=models.CASCADE)
+    term = models.CharField(max_length=64)
+    weight = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'table']),
+        ]
+
+    def __str__(self):
+        return f"{self.term} -> table {self.table_id}"
+
+
+class TableChange(models.Model):
+    """One entry of a table's append-only change log, see changelog.py."""
+    OPS = [
+        ('insert', 'Insert'),
+        ('update', 'Update'),
+        ('delete', 'Delete'),
+        ('move', 'Move'),
+        ('schema', 'Schema'),
+        ('resync', 'Resync'),
+    ]
+
+    table = models.ForeignKey(DynamicTableData, related_name='changes', on_delete=models.CASCADE)
+    seq = models.PositiveBigIntegerField()
+    op = models.CharField(max_length=10, choices=OPS)
+    row_id = models.BigIntegerField(null=True, blank=True)
+    values = models.JSONField(null=True, blank=True)  # Row values by header name, or schema details
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['table', 'seq'], name='unique_table_change_seq'),
+        ]
+
+    def __str__(self):
+        return f"#{self.seq} {self.op} on table {self.table_id}"
+
+
+
+class TableCheckpoint(models.Model):
+    """A compressed copy of a table's headers and rows as of one change log seq, see snapshots.py."""
+    table = models.ForeignKey(DynamicTableData, related_name='checkpoints', on_delete=models.CASCADE)
+    seq = models.PositiveBigIntegerField()  # The table's change_seq when it was taken
+    row_count = models.IntegerField(default=0)
+    raw_bytes = models.BigIntegerField(default=0)  # Size before compression
+    content = models.BinaryField()  # zstd-compressed JSON lines
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['table', 'seq']),
+        ]
+
+    def __str__(self):
+        return f"Checkpoint of table {self.table_id} at #{self.seq}"
+
+
+class TableSnapshot(models.Model):
+    """A named point in a table's history: a checkpoint plus the change log up to ``seq``."""
+    table = models.ForeignKey(DynamicTableData, related_name='snapshots', on_delete=models.CASCADE)
+    seq = models.PositiveBigIntegerField()
+    # Deleted with the table, never on its own while a snapshot needs it
+    checkpoint = models.ForeignKey(TableCheckpoint, related_name='snapshots', on_delete=models.RESTRICT)
+    label = models.CharField(max_length=255, blank=True)
+    created_by = models.ForeignKey(User, null=True, blank=True, related_name='+', on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"Row {self.id} of JsonTable {self.table_id}"
\ No newline at end of file
+        return f"Snapshot '{self.label}' of table {self.table_id} at #{self.seq}"
@@ -0,0 +1,227 @@
+"""
+Manual order of table rows.
+
+Every row has a ``position``: a fractional key, a string of base-36 digits
+read as the fraction ``0.d1d2d3...`` and compared as a plain string. There
+is always room for another key between two keys, so inserting a row between
+two others or moving one writes only that row. Appended rows step the first
+``HEAD_DIGITS`` digits by ``STEP``, which keeps their keys short; repeated
+insertions at one spot make keys longer, and a table whose key would grow
+past ``MAX_POSITION_LENGTH`` has its keys respaced by ``rebalance``.
+
+Rows are read in ``(position, id)`` order, indexed per table, which is also
+the keyset of paged reads. Rows created before positions existed have an
+empty key, so they keep coming first in id order; ``rebalance`` (the
+``rebuild_row_positions`` command) gives them keys, and placing a row next
+to one of them does it for their table.
+
+Keys use only digits and lowercase letters, which sort the same under
+byte-wise and locale collations, and never end in ``0`` (``"1"`` and
+``"10"`` are the same fraction, with nothing between them).
+"""
+from bisect import bisect_left
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import DynamicTableData, JsonTableRow
+
+
+DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+BASE = len(DIGITS)
+HEAD_DIGITS = 8
+STEP = BASE ** 3
+MAX_POSITION_LENGTH = 64
+REBALANCE_BATCH_SIZE = 2000
+
+
+def _encode(value):
+    """``value`` as ``HEAD_DIGITS`` digits, without trailing zeros."""
+    digits = []
+    for _ in range(HEAD_DIGITS):
+        value, digit = divmod(value, BASE)
+        digits.append(DIGITS[digit])
+    return "".join(reversed(digits)).rstrip("0")
+
+
+def _head(key):
+    return int(key[:HEAD_DIGITS].ljust(HEAD_DIGITS, "0"), BASE)
+
+
+def _midpoint(low, high):
+    """A key between ``low`` ('' for the start) and ``high`` (None for the end)."""
+    if high is not None:
+        # Keep the common prefix, reading missing digits of low as 0
+        common = 0
+        while common < len(high) and (low[common] if common < len(low) else "0") == high[common]:
+            common += 1
+        if common:
+            return high[:common] + _midpoint(low[common:], high[common:])
+    low_digit = DIGITS.index(low[0]) if low else 0
+    high_digit = DIGITS.index(high[0]) if high is not None else BASE
+    if high_digit - low_digit > 1:
+        return DIGITS[(low_digit + high_digit) // 2]
+    if high is not None and len(high) > 1:
+        return high[0]
+    return DIGITS[low_digit] + _midpoint(low[1:], None)
+
+
+def key_between(before=None, after=None):
+    """
+    A new key after ``before`` and before ``after``, either of which may be
+    None for the start or the end. Raises ValueError unless ``before < after``.
+    """
+    if before is not None and after is not None and before >= after:
+        raise ValueError("No position between equal or reversed keys.")
+    if after == "":
+        raise ValueError("No position before an empty key.")
+    if after is None and before is not None:
+        head = _head(before) + STEP
+        if head < BASE ** HEAD_DIGITS:
+            return _encode(head)
+    elif before is None and after is not None:
+        head = _head(after) - STEP
+        if head > 0:
+            return _encode(head)
+    elif before is None:
+        return _encode(STEP)
+    return _midpoint(before or "", after)
+
+
+def keys_after(before, count):
+    """``count`` ascending keys after ``before`` (None for an empty table)."""
+    keys = []
+    for _ in range(count):
+        before = key_between(before, None)
+        keys.append(before)
+    return keys
+
+
+def _between(low, high, count):
+    """``count`` ascending keys between ``low`` and ``high`` (None for the start or the end), bisecting the gap."""
+    if not count:
+        return []
+    if high is None:
+        return keys_after(low, count)
+    middle = key_between(low, high)
+    half = count // 2
+    return [*_between(low, middle, half), middle, *_between(middle, high, count - half - 1)]
+
+
+def _kept(keys):
+    """Indexes of a longest strictly ascending run of ``keys``, skipping empty ones."""
+    tails, tail_indexes, previous = [], [], [None] * len(keys)
+    for index, key in enumerate(keys):
+        if not key:
+            continue
+        length = bisect_left(tails, key)
+        if length == len(tails):
+            tails.append(key)
+            tail_indexes.append(index)
+        else:
+            tails[length], tail_indexes[length] = key, index
+        previous[index] = tail_indexes[length - 1] if length else None
+    kept = []
+    index = tail_indexes[-1] if tail_indexes else None
+    while index is not None:
+        kept.append(index)
+        index = previous[index]
+    return set(kept)
+
+
+def order_keys(row_ids, current):
+    """
+    Keys that put ``row_ids`` in that order, as ``{pk: key}``. The largest
+    set of rows whose ``current`` key (``{pk: key}``) is already in order
+    keep it, so they need no write; the others get keys between them, or
+    evenly spaced keys for every row when those would grow too long.
+    """
+    keys = [current.get(row_id) or "" for row_id in row_ids]
+    kept = _kept(keys)
+    result = {}
+    start, low = 0, None
+    for index in [*sorted(kept), len(keys)]:
+        high = keys[index] if index < len(keys) else None
+        for row_id, key in zip(row_ids[start:index], _between(low, high, index - start)):
+            if len(key) > MAX_POSITION_LENGTH:
+                return dict(zip(row_ids, keys_after(None, len(row_ids))))
+            result[row_id] = key
+        if index < len(keys):
+            result[row_ids[index]] = low = keys[index]
+        start = index + 1
+    return result
+
+
+def _lock(table_id):
+    # Serializes writers choosing positions in one table; they bump its version anyway
+    list(DynamicTableData.objects.select_for_update().filter(pk=table_id).values_list('pk'))
+
+
+def _ordered(table_id, exclude=None):
+    rows = JsonTableRow.objects.filter(table_id=table_id)
+    return rows.exclude(pk=exclude) if exclude is not None else rows
+
+
+def append_positions(table_id, count):
+    """Keys for ``count`` rows appended to a table; call inside the transaction that inserts them."""
+    _lock(table_id)
+    last = _ordered(table_id).order_by('-position').values_list('position', flat=True).first()
+    return keys_after(last or None, count)
+
+
+def _neighbours(table_id, after=None, before=None, exclude=None):
+    """``(previous, next)`` as ``(pk, position)`` or None, around the anchor row or at the end."""
+    rows = _ordered(table_id, exclude)
+    if after is not None:
+        anchor = rows.values_list('pk', 'position').get(pk=after)
+        following = rows.filter(
+            Q(position__gt=anchor[1]) | Q(position=anchor[1], pk__gt=anchor[0])
+        ).order_by('position', 'pk').values_list('pk', 'position').first()
+        return anchor, following
+    if before is not None:
+        anchor = rows.values_list('pk', 'position').get(pk=before)
+        preceding = rows.filter(
+            Q(position__lt=anchor[1]) | Q(position=anchor[1], pk__lt=anchor[0])
+        ).order_by('-position', '-pk').values_list('pk', 'position').first()
+        return preceding, anchor
+    return rows.order_by('-position', '-pk').values_list('pk', 'position').first(), None
+
+
+def place(table_id, after=None, before=None, exclude=None):
+    """
+    The key for a row right after the row ``after`` or right before the row
+    ``before`` (primary keys), or at the end without either; ``exclude`` is
+    the row being moved. Returns ``(key, pk of the row it now follows)``.
+    Call inside the transaction that writes the row; raises
+    JsonTableRow.DoesNotExist for an unknown anchor.
+    """
+    _lock(table_id)
+    for attempt in range(2):
+        preceding, following = _neighbours(table_id, after, before, exclude)
+        low = preceding[1] if preceding else None
+        high = following[1] if following else None
+        try:
+            key = key_between(low or None, high)
+        except ValueError:
+            key = None
+        if key is not None and len(key) <= MAX_POSITION_LENGTH:
+            return key, preceding[0] if preceding else None
+        if attempt:
+            break
+        # Unkeyed or crowded neighbours: respace the table once and look again
+        rebalance(table_id)
+    raise ValueError("Could not find a position for the row.")
+
+
+def rebalance(table_id):
+    """Give every row of a table a short, evenly spaced key in its current order; returns the row count."""
+    with transaction.atomic():
+        _lock(table_id)
+        pks = list(_ordered(table_id).order_by('position', 'pk').values_list('pk', flat=True))
+        keys = keys_after(None, len(pks))
+        for start in range(0, len(pks), REBALANCE_BATCH_SIZE):
+            JsonTableRow.objects.bulk_update(
+                [JsonTableRow(pk=pk, position=key) for pk, key in zip(pks[start:start + REBALANCE_BATCH_SIZE], keys[start:])],
+                ['position']
+            )
+    return len(pks)
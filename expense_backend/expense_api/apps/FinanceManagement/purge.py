@@ -0,0 +1,119 @@
+"""
+Removing the rows of deleted tables.
+
+``services.delete_table`` only marks a table deleted (``deleted_at``) and
+drops its access rows, so it leaves every listing, view and tool in one
+short transaction however many rows it has. This module removes what is
+left: rows (with their search documents) and change log entries go in
+batches of ``PURGE_BATCH_SIZE`` by primary key, each batch in its own
+transaction with raw DELETEs, so no statement holds locks for long and no
+row is loaded into Python. Once a table has no rows, deleting it cascades
+the small remainder (rollups, column index records, checkpoints and
+snapshots).
+
+Progress lives in the database only: a purge that is stopped just leaves
+fewer rows for the next run. Run it with the ``purge_deleted_tables``
+command, from cron or with ``--loop``.
+"""
+import time
+
+from django.db import connection, transaction
+from django.db.models import F
+
+from .models import DynamicTableData, JsonTableRow, RowSearchDocument, TableChange
+
+
+PURGE_BATCH_SIZE = 5000
+
+
+def _delete_batch(model, table_id, batch_size, before=None):
+    """
+    Delete the first ``batch_size`` rows of ``model`` with ``table_id`` by
+    primary key; returns how many. ``before`` runs first with the batch's
+    highest primary key, to delete what refers to the rows.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    pk = connection.ops.quote_name(model._meta.pk.column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT MAX({pk}) FROM (SELECT {pk} FROM {table} WHERE table_id = %s ORDER BY {pk} LIMIT %s) AS batch",
+            [table_id, batch_size]
+        )
+        upper = cursor.fetchone()[0]
+        if upper is None:
+            return 0
+        if before is not None:
+            before(upper)
+        cursor.execute(f"DELETE FROM {table} WHERE table_id = %s AND {pk} <= %s", [table_id, upper])
+        return cursor.rowcount
+
+
+def _delete_rows(table_id, batch_size):
+    def delete_documents(upper):
+        # Also keeps the SQLite full-text table in step, through its triggers
+        RowSearchDocument.objects.filter(table_id=table_id, row_id__lte=upper).delete()
+
+    with transaction.atomic():
+        deleted = _delete_batch(JsonTableRow, table_id, batch_size, before=delete_documents)
+        if deleted:
+            DynamicTableData.objects.filter(pk=table_id).update(row_count=F('row_count') - deleted)
+    return deleted
+
+
+def purge_table(table_id, batch_size=PURGE_BATCH_SIZE, max_seconds=None, pause=0):
+    """
+    Remove a deleted table's rows, change log and finally the table,
+    yielding ``(rows deleted, rows remaining)`` after each batch of rows.
+    Stops early after ``max_seconds``; the table then stays deleted and a
+    later purge continues. Does nothing for tables that are not deleted.
+    """
+    started = time.monotonic()
+
+    def out_of_time():
+        return max_seconds is not None and time.monotonic() - started >= max_seconds
+
+    table = DynamicTableData.objects.filter(pk=table_id, deleted_at__isnull=False).only('pk', 'row_count').first()
+    if table is None:
+        return
+    remaining = max(table.row_count, 0)
+    while True:
+        deleted = _delete_rows(table_id, batch_size)
+        if not deleted:
+            break
+        remaining = max(remaining - deleted, 0)
+        yield deleted, remaining
+        if out_of_time():
+            return
+        if pause:
+            time.sleep(pause)
+
+    while _delete_batch(TableChange, table_id, batch_size):
+        if out_of_time():
+            return
+    with transaction.atomic():
+        # Rows written after the last batch (there should be none) go with the cascade
+        DynamicTableData.objects.filter(pk=table_id, deleted_at__isnull=False).delete()
+    yield 0, 0
+
+
+def deleted_tables():
+    """Ids of the tables waiting to be purged, oldest deletion first."""
+    return list(
+        DynamicTableData.objects.filter(deleted_at__isnull=False)
+        .order_by('deleted_at', 'pk').values_list('pk', flat=True)
+    )
+
+
+def purge_tables(batch_size=PURGE_BATCH_SIZE, max_seconds=None, pause=0):
+    """
+    Purge every deleted table in turn, yielding ``(table_id, rows deleted,
+    rows remaining)``. With ``max_seconds``, a pass always gets at least one
+    batch done.
+    """
+    started = time.monotonic()
+    for position, table_id in enumerate(deleted_tables()):
+        left = None if max_seconds is None else max_seconds - (time.monotonic() - started)
+        if left is not None and left <= 0 and position:
+            return
+        for deleted, remaining in purge_table(table_id, batch_size, left, pause):
+            yield table_id, deleted, remaining
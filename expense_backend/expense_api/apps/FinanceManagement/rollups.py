@@ -0,0 +1,272 @@
+"""
+Monthly rollups of table rows, maintained incrementally.
+
+For every table, ``TableRollup`` rows hold running totals per month of the
+table's first date column (``period``):
+
+- of all rows (``dimension`` '') and per value of each category column;
+- for the row count (``measure`` '') and for each number or currency column:
+  ``row_count``, ``total``, ``minimum`` and ``maximum`` of its values.
+
+The write paths in ``services`` hand the typed values of the rows they remove
+and add to ``apply_changes``, in the same transaction as the write. Counts
+and totals are adjusted in place; a minimum or maximum is recomputed from
+the rows of its group only when the value holding it was removed. Summaries
+by month, year and category (see ``aggregation``) then read O(groups) rollups
+instead of scanning every row.
+
+``JsonTable.rollup_config`` records the columns the rollups were built for.
+Tables without one (created before rollups existed, or cloned) are not
+maintained until ``rebuild_table`` (the ``rebuild_rollups`` command) builds
+them; changing column types rebuilds a table's rollups.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, FloatField, Max, Min, Sum, TextField, Value
+from django.db.models.functions import Cast, Coalesce, Substr
+
+from . import column_types as types
+from . import schema
+from .models import JsonTable, JsonTableRow, TableRollup
+from .schema import column_id
+from .table_query import NUMERIC_TYPES, key_text
+
+
+def current_config(json_table):
+    """The date column, category columns and numeric columns (by column id) rollups use for this table."""
+    column_types = json_table.column_types or {}
+
+    def ids(*kinds):
+        return [column_id(json_table, header) for header in json_table.headers if column_types.get(header) in kinds]
+
+    dates = ids(types.DATE)
+    return {"date": dates[0] if dates else None, "dimensions": ids(types.CATEGORY), "measures": ids(*NUMERIC_TYPES)}
+
+
+def is_current(json_table):
+    """True when the table's rollups are built and match its columns."""
+    return json_table.rollup_config is not None and json_table.rollup_config == current_config(json_table)
+
+
+def _contributions(config, typed):
+    """Yield ``((period, dimension, group_key, measure), value)`` for each rollup a row counts in."""
+    typed = typed or {}
+    date = typed.get(config['date']) if config['date'] else None
+    period = date[:7] if isinstance(date, str) else ''
+    for dimension in ['', *config['dimensions']]:
+        group_key = (typed.get(dimension) or '') if dimension else ''
+        yield (period, dimension, group_key, ''), None
+        for measure in config['measures']:
+            value = typed.get(measure)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                yield (period, dimension, group_key, measure), float(value)
+
+
+# ============ SQL EXPRESSIONS ============
+
+def _period(config):
+    if not config['date']:
+        return Value('', output_field=TextField())
+    return Coalesce(
+        Substr(key_text(config['date'], 'typed_data'), 1, 7), Value(''), output_field=TextField()
+    )
+
+
+def _group_key(dimension):
+    if not dimension:
+        return Value('', output_field=TextField())
+    return Coalesce(key_text(dimension, 'typed_data'), Value(''), output_field=TextField())
+
+
+def _measure(measure):
+    return Cast(key_text(measure, 'typed_data'), FloatField())
+
+
+# ============ INCREMENTAL MAINTENANCE ============
+
+def _recompute_extremes(json_table, config, rollup):
+    values = (
+        JsonTableRow.objects.filter(table_id=json_table.pk)
+        .alias(period=_period(config), group_key=_group_key(rollup.dimension))
+        .annotate(value=_measure(rollup.measure))
+        .filter(period=rollup.period, group_key=rollup.group_key, value__isnull=False)
+        .aggregate(minimum=Min('value'), maximum=Max('value'))
+    )
+    rollup.minimum, rollup.maximum = values['minimum'], values['maximum']
+
+
+def apply_changes(json_table, removed=(), added=()):
+    """
+    Update the rollups for rows whose typed values were ``removed`` and
+    ``added`` (an update is both). Call inside the write's transaction, after
+    the rows are saved and after ``changelog.log_changes``, whose lock on the
+    table serializes concurrent writers.
+    """
+    config = json_table.rollup_config
+    if config is None:
+        return
+
+    changes = defaultdict(lambda: (Counter(), Counter()))
+    for index, rows in enumerate((removed, added)):
+        for typed in rows:
+            for key, value in _contributions(config, typed):
+                changes[key][index][value] += 1
+
+    deltas = {}
+    for key, (removed_values, added_values) in changes.items():
+        # An update that keeps a value cancels out
+        common = removed_values & added_values
+        removed_values, added_values = removed_values - common, added_values - common
+        if removed_values or added_values:
+            deltas[key] = (list(removed_values.elements()), list(added_values.elements()))
+    if not deltas:
+        return
+
+    existing = {
+        (rollup.period, rollup.dimension, rollup.group_key, rollup.measure): rollup
+        for rollup in TableRollup.objects.filter(table_id=json_table.pk, period__in={key[0] for key in deltas})
+    }
+    created, changed, emptied = [], [], []
+    for key, (removed_values, added_values) in deltas.items():
+        rollup = existing.get(key)
+        if rollup is None:
+            period, dimension, group_key, measure = key
+            rollup = TableRollup(
+                table_id=json_table.pk, period=period, dimension=dimension, group_key=group_key, measure=measure
+            )
+        rollup.row_count += len(added_values) - len(removed_values)
+        if rollup.row_count <= 0:
+            if rollup.pk:
+                emptied.append(rollup.pk)
+            continue
+
+        if rollup.measure:
+            rollup.total += sum(added_values) - sum(removed_values)
+            if rollup.minimum in removed_values or rollup.maximum in removed_values:
+                _recompute_extremes(json_table, config, rollup)
+            elif added_values:
+                rollup.minimum = min(value for value in (rollup.minimum, *added_values) if value is not None)
+                rollup.maximum = max(value for value in (rollup.maximum, *added_values) if value is not None)
+        (changed if rollup.pk else created).append(rollup)
+
+    TableRollup.objects.filter(pk__in=emptied).delete()
+    TableRollup.objects.bulk_update(changed, ['row_count', 'total', 'minimum', 'maximum'], batch_size=500)
+    TableRollup.objects.bulk_create(created, batch_size=500)
+
+
+def columns_changed(json_table):
+    """
+    Follow added or deleted columns without rescanning rows. Rows only have
+    typed values for columns that existed when they were written, so a new
+    category column starts with every row under the empty group key, and a
+    new numeric column without rollups, unless the column was added with a
+    default: every row then holds its typed value (see
+    ``schema.typed_defaults``).
+    """
+    config = json_table.rollup_config
+    if config is None:
+        return
+    current = current_config(json_table)
+    if current['date'] != config['date']:
+        rebuild_table(json_table)
+        return
+    defaults = schema.typed_defaults(json_table)
+
+    with transaction.atomic():
+        rollups = TableRollup.objects.filter(table_id=json_table.pk)
+        rollups.exclude(dimension__in=['', *current['dimensions']]).delete()
+        rollups.exclude(measure__in=['', *current['measures']]).delete()
+        new_dimensions = [dimension for dimension in current['dimensions'] if dimension not in config['dimensions']]
+        if new_dimensions:
+            totals = list(rollups.filter(dimension=''))
+            TableRollup.objects.bulk_create([
+                TableRollup(
+                    table_id=json_table.pk, period=rollup.period, dimension=dimension,
+                    group_key=defaults.get(dimension, ''), measure=rollup.measure, row_count=rollup.row_count,
+                    total=rollup.total, minimum=rollup.minimum, maximum=rollup.maximum
+                )
+                for dimension in new_dimensions for rollup in totals
+            ], batch_size=500)
+        new_measures = [
+            measure for measure in current['measures']
+            if measure not in config['measures'] and isinstance(defaults.get(measure), (int, float))
+        ]
+        if new_measures:
+            counts = list(rollups.filter(measure=''))
+            TableRollup.objects.bulk_create([
+                TableRollup(
+                    table_id=json_table.pk, period=rollup.period, dimension=rollup.dimension,
+                    group_key=rollup.group_key, measure=measure, row_count=rollup.row_count,
+                    total=rollup.row_count * defaults[measure], minimum=defaults[measure], maximum=defaults[measure]
+                )
+                for measure in new_measures for rollup in counts
+            ], batch_size=500)
+        JsonTable.objects.filter(pk=json_table.pk).update(rollup_config=current)
+        json_table.rollup_config = current
+
+
+# ============ REBUILDING ============
+
+def compute(table_id, config):
+    """Yield a table's rollups computed from its rows, with one GROUP BY query per dimension and measure."""
+    rows = JsonTableRow.objects.filter(table_id=table_id).annotate(period=_period(config))
+    for dimension in ['', *config['dimensions']]:
+        grouped = rows.annotate(group_key=_group_key(dimension))
+        for measure in ['', *config['measures']]:
+            if measure:
+                values = grouped.annotate(value=_measure(measure)).filter(value__isnull=False)
+                aggregates = dict(row_count=Count('id'), total=Sum('value'), minimum=Min('value'), maximum=Max('value'))
+            else:
+                values, aggregates = grouped, dict(row_count=Count('id'))
+            for result in values.values('period', 'group_key').annotate(**aggregates).order_by():
+                yield TableRollup(
+                    table_id=table_id, dimension=dimension, measure=measure,
+                    total=result.pop('total', None) or 0, **result
+                )
+
+
+def rebuild_table(json_table):
+    """Replace a table's rollups with ones computed from its rows; returns how many there are."""
+    config = current_config(json_table)
+    with transaction.atomic():
+        TableRollup.objects.filter(table_id=json_table.pk).delete()
+        rollups = TableRollup.objects.bulk_create(compute(json_table.pk, config), batch_size=1000)
+        JsonTable.objects.filter(pk=json_table.pk).update(rollup_config=config)
+        json_table.rollup_config = config
+    return len(rollups)
+
+
+def _same(a, b):
+    if a is None or b is None:
+        return a is b
+    return abs(a - b) <= 1e-6 * max(1.0, abs(a), abs(b))
+
+
+def check_table(json_table):
+    """Compare a table's rollups with its rows; returns a description of each difference."""
+    if json_table.rollup_config is None:
+        return ["rollups are not built"]
+    problems = []
+    if not is_current(json_table):
+        problems.append("rollups were built for other columns")
+
+    fields = ('row_count', 'total', 'minimum', 'maximum')
+    stored = {
+        (rollup.period, rollup.dimension, rollup.group_key, rollup.measure): rollup
+        for rollup in TableRollup.objects.filter(table_id=json_table.pk)
+    }
+    for expected in compute(json_table.pk, json_table.rollup_config):
+        key = (expected.period, expected.dimension, expected.group_key, expected.measure)
+        actual = stored.pop(key, None)
+        if actual is None:
+            problems.append(f"missing {key}")
+        elif not all(_same(getattr(actual, field), getattr(expected, field)) for field in fields):
+            problems.append(
+                f"wrong {key}: " + ", ".join(
+                    f"{field} {getattr(actual, field)} != {getattr(expected, field)}" for field in fields
+                    if not _same(getattr(actual, field), getattr(expected, field))
+                )
+            )
+    problems.extend(f"extra {key}" for key in stored)
+    return problems
@@ -0,0 +1,100 @@
+"""
+Converting tables between the dict and the array row format.
+
+Both formats are described in ``schema``; readers accept either, so a table
+is converted by rewriting its rows in batches inside one transaction that
+holds the table's JsonTable row. Converting to arrays starts a new layout
+version with exactly the current columns, which is also how an array table
+sheds the slots of deleted columns. Expression indexes on text columns
+address ``data`` by key or by slot, so a table's column indexes are dropped
+and built again once its columns are hot (see ``column_indexes``).
+
+``compare`` measures what a table's rows take in each format without
+writing anything; the ``convert_row_format`` command converts tables and
+``benchmark_row_format`` times both formats on generated rows.
+"""
+import json
+import time
+
+from django.db import transaction
+
+from . import column_indexes, counters, row_search, schema
+from .models import JsonTable, JsonTableRow
+
+
+CONVERT_BATCH_SIZE = 1000
+
+
+def convert_table(table_id, row_format):
+    """
+    Rewrite a table's rows in ``row_format`` (``JsonTable.DICT_ROWS`` or
+    ``JsonTable.ARRAY_ROWS``); returns the number of rows, or None when the
+    table does not exist or is already in that format.
+    """
+    with transaction.atomic():
+        json_table = JsonTable.objects.select_for_update().filter(pk=table_id).first()
+        if json_table is None or json_table.row_format == row_format:
+            return None
+        read = schema.row_reader(json_table)
+        json_table.row_format = row_format
+        if row_format == JsonTable.ARRAY_ROWS:
+            schema.new_layout(json_table)
+        write = schema.row_writer(json_table)
+
+        count = 0
+        batch = []
+        for row in JsonTableRow.objects.filter(table_id=table_id).only('pk', 'data').iterator(chunk_size=CONVERT_BATCH_SIZE):
+            row.data = write(read(row.data))
+            batch.append(row)
+            if len(batch) >= CONVERT_BATCH_SIZE:
+                JsonTableRow.objects.bulk_update(batch, ['data'])
+                count += len(batch)
+                batch = []
+        JsonTableRow.objects.bulk_update(batch, ['data'])
+        count += len(batch)
+
+        json_table.save(update_fields=['row_format', 'row_layouts'])
+        column_indexes.drop_indexes(table_id)
+        # Values of deleted columns are gone from the rewritten rows
+        row_search.index_table(table_id)
+        counters.recount(table_id)
+    return count
+
+
+def compare(json_table, limit=None):
+    """
+    What the table's rows take as dicts and as arrays of the current layout:
+    ``{format: {"rows", "bytes", "encode_seconds", "decode_seconds"}}`` over
+    the rows read (``limit`` at most). Bytes are those of the compact JSON
+    text (see ``counters.row_size``); encoding and decoding include JSON
+    serialization. Nothing is written.
+    """
+    rows = JsonTableRow.objects.filter(table_id=json_table.pk).order_by('pk').values_list('data', flat=True)
+    values = [schema.row_reader(json_table)(data) for data in (rows[:limit] if limit else rows)]
+
+    results = {}
+    for row_format in (JsonTable.DICT_ROWS, JsonTable.ARRAY_ROWS):
+        shaped = JsonTable(
+            pk=json_table.pk, headers=list(json_table.headers), column_types=json_table.column_types,
+            column_ids=json_table.column_ids, column_defaults=json_table.column_defaults,
+            retired_columns=json_table.retired_columns, row_format=row_format,
+            row_layouts=list(json_table.row_layouts or [])
+        )
+        if row_format == JsonTable.ARRAY_ROWS:
+            schema.new_layout(shaped)
+        write, read = schema.row_writer(shaped), schema.row_reader(shaped)
+
+        started = time.perf_counter()
+        texts = [json.dumps(write(row), ensure_ascii=False, separators=(',', ':')) for row in values]
+        encoded = time.perf_counter() - started
+        started = time.perf_counter()
+        for text in texts:
+            read(json.loads(text))
+        decoded = time.perf_counter() - started
+        results[row_format] = {
+            "rows": len(texts),
+            "bytes": sum(len(text.encode()) for text in texts),
+            "encode_seconds": encoded,
+            "decode_seconds": decoded,
+        }
+    return results
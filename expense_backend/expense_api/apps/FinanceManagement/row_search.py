@@ -0,0 +1,200 @@
+"""
+Full-text search over the contents of table rows.
+
+Each row has a ``RowSearchDocument``: the words of its cell values, as
+produced by ``table_index.search_words`` (so Bangla, Banglish and English
+spellings of a concept meet). The documents are full-text indexed by the
+database itself, outside the ORM:
+
+- PostgreSQL: a GIN index on ``to_tsvector('simple', document)``, ranked
+  with ``ts_rank``;
+- SQLite: an FTS5 table over the documents, kept in sync by triggers and
+  ranked with ``bm25``.
+
+``install`` creates them after ``migrate``. Other databases, or SQLite built
+without FTS5, fall back to a substring scan of the documents.
+
+``services`` re-indexes rows whenever it writes them; rows are indexed by
+their stored values, so header renames need nothing and values of deleted
+columns leave the index when the table is compacted (see ``schema``). The
+default of an added column is appended to the documents (``add_value``).
+"""
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connection, connections, transaction
+from django.db.models import Q, Value
+from django.db.models.functions import Concat
+
+from .models import JsonTableRow, RowSearchDocument
+from .table_index import search_words
+
+
+FTS_TABLE = "financemanagement_rowsearch_fts"
+GIN_INDEX = "financemanagement_rowsearch_gin"
+MAX_RESULTS = 100
+INDEX_BATCH_SIZE = 1000
+
+
+def document(data):
+    """The document of a row's stored values, in either row format (see ``schema``)."""
+    if isinstance(data, list):
+        values = [*(data[1] or {}).values(), *data[2:]]
+    else:
+        values = (data or {}).values()
+    words = []
+    for value in values:
+        if value not in (None, ""):
+            words.extend(search_words(value))
+    return " ".join(words)
+
+
+# ============ INDEX SETUP ============
+
+def _fts_statements(documents):
+    fts = FTS_TABLE
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5(document, content='{documents}', content_rowid='row_id')",
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {documents} BEGIN "
+        f"INSERT INTO {fts}(rowid, document) VALUES (new.row_id, new.document); END",
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {documents} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, document) VALUES ('delete', old.row_id, old.document); END",
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE ON {documents} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, document) VALUES ('delete', old.row_id, old.document); "
+        f"INSERT INTO {fts}(rowid, document) VALUES (new.row_id, new.document); END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def install(sender=None, using=DEFAULT_DB_ALIAS, **kwargs):
+    """Create the database's full-text index over row documents; a ``post_migrate`` receiver."""
+    db = connections[using]
+    documents = RowSearchDocument._meta.db_table
+    if documents not in db.introspection.table_names():
+        return
+    with db.cursor() as cursor:
+        if db.vendor == "postgresql":
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {GIN_INDEX} ON {documents} "
+                f"USING gin (to_tsvector('simple'::regconfig, document))"
+            )
+        elif db.vendor == "sqlite" and FTS_TABLE not in db.introspection.table_names():
+            try:
+                with transaction.atomic(using=using):
+                    for statement in _fts_statements(documents):
+                        cursor.execute(statement)
+            except OperationalError:
+                # SQLite built without FTS5: searches scan the documents instead
+                pass
+
+
+def _has_fts():
+    return connection.vendor == "sqlite" and FTS_TABLE in connection.introspection.table_names()
+
+
+# ============ KEEPING IT IN SYNC ============
+
+def index_rows(rows):
+    """(Re)index saved rows from their stored ``data``."""
+    RowSearchDocument.objects.bulk_create(
+        [RowSearchDocument(row_id=row.pk, table_id=row.table_id, document=document(row.data)) for row in rows],
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['row'],
+        update_fields=['document'],
+    )
+
+
+def index_table(table_id):
+    """Re-index every row of a table; returns the number of rows."""
+    count = 0
+    batch = []
+    rows = JsonTableRow.objects.filter(table_id=table_id).only('pk', 'table_id', 'data')
+    with transaction.atomic():
+        for row in rows.iterator(chunk_size=INDEX_BATCH_SIZE):
+            batch.append(row)
+            if len(batch) >= INDEX_BATCH_SIZE:
+                index_rows(batch)
+                count += len(batch)
+                batch = []
+        index_rows(batch)
+    return count + len(batch)
+
+
+def add_value(table_id, value):
+    """
+    Add the words of ``value`` to every document of a table with one UPDATE,
+    for a column added with a default (rows are indexed by their stored values
+    and do not store the default until the table is compacted).
+    """
+    words = " ".join(search_words(value)) if value not in (None, "") else ""
+    if not words:
+        return 0
+    return RowSearchDocument.objects.filter(table_id=table_id).update(document=Concat('document', Value(" " + words)))
+
+
+# ============ SEARCHING ============
+
+def _search_postgresql(words, table_ids, limit):
+    documents = RowSearchDocument._meta.db_table
+    query = " || ".join(["plainto_tsquery('simple'::regconfig, %s)"] * len(words))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT row_id, table_id, ts_rank(to_tsvector('simple'::regconfig, document), query) AS score "
+            f"FROM {documents}, ({'SELECT ' + query}) AS search(query) "
+            f"WHERE table_id = ANY(%s) AND to_tsvector('simple'::regconfig, document) @@ query "
+            f"ORDER BY score DESC, row_id LIMIT %s",
+            [*words, list(table_ids), limit]
+        )
+        return cursor.fetchall()
+
+
+def _search_sqlite(words, table_ids, limit):
+    documents = RowSearchDocument._meta.db_table
+    match = " OR ".join('"%s"' % word.replace('"', '""') for word in words)
+    placeholders = ", ".join(["%s"] * len(table_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT d.row_id, d.table_id, -bm25({FTS_TABLE}) AS score "
+            f"FROM {FTS_TABLE} JOIN {documents} d ON d.row_id = {FTS_TABLE}.rowid "
+            f"WHERE {FTS_TABLE} MATCH %s AND d.table_id IN ({placeholders}) "
+            f"ORDER BY score DESC, d.row_id LIMIT %s",
+            [match, *table_ids, limit]
+        )
+        return cursor.fetchall()
+
+
+def _search_scan(words, table_ids, limit):
+    matches = Q()
+    for word in words:
+        matches |= Q(document__icontains=word)
+    results = []
+    for row_id, table_id, text in (
+        RowSearchDocument.objects.filter(matches, table_id__in=table_ids).values_list('row_id', 'table_id', 'document')
+    ):
+        present = set(text.split())
+        score = sum(1 for word in words if word in present)
+        if score:
+            results.append((row_id, table_id, float(score)))
+    results.sort(key=lambda result: (-result[2], result[0]))
+    return results[:limit]
+
+
+def search_rows(table_ids, query, limit=20):
+    """
+    Search the rows of ``table_ids``. Returns ``[(row_id, table_id, score)]``,
+    best match first; rows matching more of the query's words rank higher.
+    """
+    words = list(dict.fromkeys(search_words(query)))
+    table_ids = list(table_ids)
+    if not words or not table_ids:
+        return []
+    limit = min(max(limit, 1), MAX_RESULTS)
+    if connection.vendor == "postgresql":
+        return _search_postgresql(words, table_ids, limit)
+    if _has_fts():
+        return _search_sqlite(words, table_ids, limit)
+    return _search_scan(words, table_ids, limit)
+
+
+def load_rows(ranked):
+    """The rows of ``search_rows`` results with their tables, as ``[(row, score)]`` in rank order."""
+    rows = JsonTableRow.objects.select_related('table__table').in_bulk([row_id for row_id, _, _ in ranked])
+    return [(rows[row_id], score) for row_id, _, score in ranked if row_id in rows]
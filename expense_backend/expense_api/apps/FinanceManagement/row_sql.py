@@ -0,0 +1,156 @@
+"""
+Set-based changes to the keys of every row of a table.
+
+Used by the compactor (see ``schema``) to bring row bodies in line with the
+table's columns, and to give every row the typed value of a column added
+with a default. Instead of loading and saving rows one by one, each change
+is a single UPDATE on the JSON columns: JSONB operators on PostgreSQL and
+the JSON1 functions on SQLite. Other databases, and keys that cannot be
+written as an SQLite JSON path, fall back to a batched loop.
+"""
+import json
+import sqlite3
+
+from django.db import connection
+
+from .models import JsonTableRow
+
+
+LOOP_BATCH_SIZE = 1000
+
+
+def _table_sql():
+    quote = connection.ops.quote_name
+    return quote(JsonTableRow._meta.db_table), quote(JsonTableRow._meta.get_field('table').column)
+
+
+def _sqlite_path(key):
+    return f'$."{key}"'
+
+
+def _use_sql(*keys):
+    if connection.vendor == "postgresql":
+        return True
+    if connection.vendor == "sqlite":
+        # JSON1 is always built in from 3.38; keys with quotes cannot be used in a path
+        return sqlite3.sqlite_version_info >= (3, 38) and not any('"' in key or "\\" in key for key in keys)
+    return False
+
+
+def _execute(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+def _loop(table_id, change):
+    """Fallback: apply ``change(data, typed_data)`` to every row, saving in batches."""
+    changed = []
+    count = 0
+    for row in JsonTableRow.objects.filter(table_id=table_id).iterator(chunk_size=LOOP_BATCH_SIZE):
+        row.data = row.data or {}
+        row.typed_data = row.typed_data or {}
+        if change(row.data, row.typed_data):
+            changed.append(row)
+        if len(changed) >= LOOP_BATCH_SIZE:
+            JsonTableRow.objects.bulk_update(changed, ['data', 'typed_data'])
+            count += len(changed)
+            changed = []
+    JsonTableRow.objects.bulk_update(changed, ['data', 'typed_data'])
+    return count + len(changed)
+
+
+def fill_key(table_id, key, value="", typed_value=None):
+    """
+    Set ``key`` to ``value`` in rows whose data does not have it, and to
+    ``typed_value`` in their typed data when one is given; returns the number
+    of rows updated.
+    """
+    if not _use_sql(key):
+        def change(data, typed_data):
+            if key in data:
+                return False
+            data[key] = value
+            if typed_value is not None:
+                typed_data[key] = typed_value
+            return True
+        return _loop(table_id, change)
+
+    table, fk = _table_sql()
+    typed, typed_params = "", []
+    if connection.vendor == "postgresql":
+        if typed_value is not None:
+            typed = ", typed_data = COALESCE(typed_data, '{}'::jsonb) || jsonb_build_object(%s::text, %s::jsonb)"
+            typed_params = [key, json.dumps(typed_value)]
+        return _execute(
+            f"UPDATE {table} SET data = COALESCE(data, '{{}}'::jsonb) || jsonb_build_object(%s::text, %s::jsonb)"
+            f"{typed} WHERE {fk} = %s AND NOT COALESCE(data ? %s::text, false)",
+            [key, json.dumps(value), *typed_params, table_id, key]
+        )
+    if typed_value is not None:
+        typed = ", typed_data = json_insert(COALESCE(typed_data, '{}'), %s, json(%s))"
+        typed_params = [_sqlite_path(key), json.dumps(typed_value)]
+    return _execute(
+        f"UPDATE {table} SET data = json_insert(COALESCE(data, '{{}}'), %s, json(%s))"
+        f"{typed} WHERE {fk} = %s AND json_type(data, %s) IS NULL",
+        [_sqlite_path(key), json.dumps(value), *typed_params, table_id, _sqlite_path(key)]
+    )
+
+
+def fill_typed_key(table_id, key, value):
+    """Set ``key`` to ``value`` in rows whose typed data does not have it; returns the number of rows updated."""
+    if not _use_sql(key):
+        def change(data, typed_data):
+            if key in typed_data:
+                return False
+            typed_data[key] = value
+            return True
+        return _loop(table_id, change)
+
+    table, fk = _table_sql()
+    if connection.vendor == "postgresql":
+        return _execute(
+            f"UPDATE {table} "
+            f"SET typed_data = COALESCE(typed_data, '{{}}'::jsonb) || jsonb_build_object(%s::text, %s::jsonb) "
+            f"WHERE {fk} = %s AND NOT COALESCE(typed_data ? %s::text, false)",
+            [key, json.dumps(value), table_id, key]
+        )
+    return _execute(
+        f"UPDATE {table} SET typed_data = json_insert(COALESCE(typed_data, '{{}}'), %s, json(%s)) "
+        f"WHERE {fk} = %s AND json_type(typed_data, %s) IS NULL",
+        [_sqlite_path(key), json.dumps(value), table_id, _sqlite_path(key)]
+    )
+
+
+def remove_keys(table_id, keys):
+    """Remove ``keys`` from every row's data and typed data."""
+    keys = list(keys)
+    if not keys:
+        return 0
+    if not _use_sql(*keys):
+        def change(data, typed_data):
+            changed = False
+            for key in keys:
+                for values in (data, typed_data):
+                    if key in values:
+                        del values[key]
+                        changed = True
+            return changed
+        return _loop(table_id, change)
+
+    table, fk = _table_sql()
+    if connection.vendor == "postgresql":
+        return _execute(
+            f"UPDATE {table} SET data = data - %s::text[], typed_data = typed_data - %s::text[] "
+            f"WHERE {fk} = %s AND (data ?| %s::text[] OR typed_data ?| %s::text[])",
+            [keys, keys, table_id, keys, keys]
+        )
+    paths = [_sqlite_path(key) for key in keys]
+    placeholders = ", ".join(["%s"] * len(paths))
+    exists = " OR ".join(["json_type(data, %s) IS NOT NULL OR json_type(typed_data, %s) IS NOT NULL"] * len(paths))
+    return _execute(
+        f"UPDATE {table} SET data = json_remove(data, {placeholders}), "
+        f"typed_data = json_remove(typed_data, {placeholders}) "
+        f"WHERE {fk} = %s AND ({exists})",
+        [*paths, *paths, table_id, *[path for path in paths for _ in range(2)]]
+    )
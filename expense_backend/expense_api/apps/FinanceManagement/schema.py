@@ -0,0 +1,346 @@
+"""
+Column ids: the indirection between header names and the keys of row data.
+
+Row bodies store values under a column id, not under the header the user
+sees. For columns created before column ids existed, and for most columns
+since, the id is simply the header name at creation time, so existing rows
+need no rewrite; ``JsonTable.column_ids`` only records headers whose id
+differs from their name. That keeps every schema change O(1):
+
+- renaming a header changes only ``column_ids`` (the id stays the same);
+- adding a column records a default in ``column_defaults`` which readers
+  apply to rows that do not have the column yet (a typed default is also
+  written to every row's ``typed_data``, so SQL filters, groups and rollups
+  see it; see ``typed_defaults``);
+- deleting a column retires its id in ``retired_columns``; readers hide
+  retired ids and ids are not reused while rows may hold their values, so
+  old values never reappear.
+
+Rows are rewritten into the current shape when they are next written
+(``row_writer``), or in bulk by ``compact_table`` / the ``compact_tables``
+command, which runs the set-based updates from ``row_sql`` and re-indexes
+the rewritten rows for search. Once a dict table is compacted its defaults
+and retired ids are cleared, so it is read and written as stored again.
+
+``typed_data`` is keyed by column id as well; ``column_types`` is metadata
+and stays keyed by header name.
+
+Row data is stored in one of two formats (``JsonTable.row_format``):
+
+- ``dict``: ``{column id: value}``, every row repeating every key;
+- ``array``: ``[layout version, extras, value, ...]``, the values in the
+  order of the column ids in ``row_layouts[version - 1]`` and ``extras`` the
+  keys that belong to no column (or null), which saves repeating long
+  header names in every row. Added columns extend the latest layout, so
+  older rows simply end early; deleted columns keep their slot until the
+  table is converted again (see ``row_format``), so a column's slot never
+  moves and SQL can address it (``data_key``). A null cell reads as a
+  missing one.
+
+Readers accept both formats whatever the table's, and the API only ever
+sees ``{header: value}``.
+"""
+from django.db import transaction
+
+from . import column_types as types
+from . import counters, row_search, row_sql
+from .models import JsonTable, JsonTableRow
+
+
+ARRAY_HEAD = 2  # Layout version and extras come before the values of an array row
+
+
+def column_id(json_table, header):
+    return (json_table.column_ids or {}).get(header, header)
+
+
+def column_id_map(json_table):
+    """Header name -> column id for every current header."""
+    column_ids = json_table.column_ids or {}
+    return {header: column_ids.get(header, header) for header in json_table.headers}
+
+
+def _new_column_id(json_table, header):
+    taken = set(column_id_map(json_table).values()) | set(json_table.retired_columns or [])
+    if header not in taken:
+        return header
+    suffix = 2
+    while f"{header}#{suffix}" in taken:
+        suffix += 1
+    return f"{header}#{suffix}"
+
+
+def is_identity(json_table):
+    """True when row data can be read as stored."""
+    if json_table.row_format == JsonTable.ARRAY_ROWS:
+        return False
+    return not (json_table.column_ids or json_table.column_defaults or json_table.retired_columns)
+
+
+def _slots(json_table):
+    """Column id -> index of its value in the latest array layout."""
+    layouts = json_table.row_layouts or []
+    return {key: index for index, key in enumerate(layouts[-1])} if layouts else {}
+
+
+def data_key(json_table, header):
+    """The key of a column's value in stored ``data``: its column id, or its index in array rows."""
+    key = column_id(json_table, header)
+    if json_table.row_format == JsonTable.ARRAY_ROWS:
+        return str(ARRAY_HEAD + _slots(json_table)[key])
+    return key
+
+
+def data_lookup(json_table, key):
+    """ORM lookup path of ``key`` in stored ``data``: a header, or a key of no column like the agent's ``id``."""
+    if key in json_table.headers:
+        return f"data__{data_key(json_table, key)}"
+    if json_table.row_format == JsonTable.ARRAY_ROWS:
+        return f"data__1__{key}"
+    return f"data__{key}"
+
+
+def new_layout(json_table):
+    """Start an array layout version holding exactly the current columns. Does not save."""
+    json_table.row_layouts = [*(json_table.row_layouts or []), list(column_id_map(json_table).values())]
+
+
+# ============ SCHEMA CHANGES (metadata only) ============
+
+def add_column(json_table, header, default=""):
+    """Add a header; rows without a value for it read ``default``. Does not save."""
+    new_id = _new_column_id(json_table, header)
+    json_table.headers.append(header)
+    if new_id != header:
+        json_table.column_ids = {**(json_table.column_ids or {}), header: new_id}
+    json_table.column_defaults = {**(json_table.column_defaults or {}), new_id: default}
+    if json_table.row_format == JsonTable.ARRAY_ROWS:
+        # Appended in place: rows of this layout version just lack the new value
+        json_table.row_layouts = [*json_table.row_layouts[:-1], [*json_table.row_layouts[-1], new_id]]
+    json_table.needs_compaction = True
+
+
+def typed_defaults(json_table):
+    """Column id -> typed value of each default of a typed column that parses (see ``column_types``)."""
+    names = {key: header for header, key in column_id_map(json_table).items()}
+    column_types = json_table.column_types or {}
+    typed = {}
+    for key, default in (json_table.column_defaults or {}).items():
+        kind = column_types.get(names.get(key), types.TEXT)
+        value = types.normalize_value(kind, default) if kind != types.TEXT else None
+        if value is not None:
+            typed[key] = value
+    return typed
+
+
+def rename_column(json_table, old_header, new_header):
+    """Rename a header; its column id, and so every row, stays untouched. Does not save."""
+    old_id = column_id(json_table, old_header)
+    json_table.headers[json_table.headers.index(old_header)] = new_header
+    column_ids = {header: value for header, value in (json_table.column_ids or {}).items() if header != old_header}
+    if old_id != new_header:
+        column_ids[new_header] = old_id
+    json_table.column_ids = column_ids
+
+
+def drop_columns(json_table, headers):
+    """Remove headers and retire their column ids. Does not save."""
+    dropped_ids = [column_id(json_table, header) for header in headers]
+    json_table.headers = [header for header in json_table.headers if header not in headers]
+    json_table.column_ids = {
+        header: value for header, value in (json_table.column_ids or {}).items() if header not in headers
+    }
+    json_table.column_defaults = {
+        key: value for key, value in (json_table.column_defaults or {}).items() if key not in dropped_ids
+    }
+    json_table.retired_columns = list(dict.fromkeys([*(json_table.retired_columns or []), *dropped_ids]))
+    json_table.needs_compaction = True
+
+
+# ============ READING AND WRITING ROWS ============
+
+def _unpacker(json_table):
+    """Return a function that turns stored row data in either format into a new ``{column id: value}``."""
+    layouts = json_table.row_layouts or []
+
+    def unpack(data):
+        if not isinstance(data, list):
+            return dict(data or {})
+        values = dict(data[1] or {})
+        for key, value in zip(layouts[data[0] - 1], data[ARRAY_HEAD:]):
+            if value is not None:
+                values[key] = value
+        return values
+
+    return unpack
+
+
+def _packer(json_table):
+    """Return a function that turns ``{column id: value}`` into an array row of the latest layout."""
+    version = len(json_table.row_layouts)
+    layout = json_table.row_layouts[-1]
+    slots = set(layout)
+
+    def pack(data):
+        values = [data.get(key) for key in layout]
+        while values and values[-1] is None:
+            values.pop()
+        extras = {key: value for key, value in data.items() if key not in slots}
+        return [version, extras or None, *values]
+
+    return pack
+
+
+def row_reader(json_table, defaults=True):
+    """
+    Return a function that turns stored row data into ``{header: value}``.
+
+    Keys that belong to no column (like the ``id`` the agent adds to rows)
+    are passed through; values of retired columns are hidden.
+    """
+    if is_identity(json_table):
+        return _unpacker(json_table)
+
+    names = {value: header for header, value in column_id_map(json_table).items()}
+    hidden = set(json_table.retired_columns or []) - set(names)
+    renamed = set(json_table.column_ids or {}) - set(names)
+    column_defaults = {
+        names[key]: value for key, value in (json_table.column_defaults or {}).items() if key in names
+    } if defaults else {}
+    # Header of each slot of each array layout, None for retired columns
+    slot_headers = [[names.get(key) for key in layout] for layout in json_table.row_layouts or []]
+
+    def read_keys(values, items):
+        for key, value in items:
+            if key in names:
+                values[names[key]] = value
+            elif key not in hidden and key not in renamed:
+                values.setdefault(key, value)
+
+    def read(data):
+        values = {}
+        if isinstance(data, list):
+            for header, value in zip(slot_headers[data[0] - 1], data[ARRAY_HEAD:]):
+                if header is not None and value is not None:
+                    values[header] = value
+            if data[1]:
+                read_keys(values, data[1].items())
+        else:
+            read_keys(values, (data or {}).items())
+        for header, default in column_defaults.items():
+            values.setdefault(header, default)
+        return values
+
+    return read
+
+
+def row_writer(json_table):
+    """
+    Return a function that turns ``{header: value}`` into stored row data.
+
+    Written rows are materialized: keys use column ids, columns added since
+    the row was last written get their default and retired ids are dropped.
+    Tables in the array format get array rows of the latest layout.
+    """
+    if is_identity(json_table):
+        return lambda values: dict(values or {})
+    pack = _packer(json_table) if json_table.row_format == JsonTable.ARRAY_ROWS else None
+
+    ids = column_id_map(json_table)
+    retired = set(json_table.retired_columns or []) - set(ids.values())
+    column_defaults = json_table.column_defaults or {}
+
+    def write(values):
+        data = {}
+        for key, value in (values or {}).items():
+            key = ids.get(key, key)
+            if key not in retired:
+                data[key] = value
+        for key, default in column_defaults.items():
+            data.setdefault(key, default)
+        return pack(data) if pack else data
+
+    return write
+
+
+def typed_reader(json_table):
+    return row_reader(json_table, defaults=False)
+
+
+def typed_writer(json_table):
+    """Like ``row_writer`` for ``typed_data``, without defaults."""
+    ids = column_id_map(json_table)
+    return lambda values: {ids.get(key, key): value for key, value in (values or {}).items()}
+
+
+# ============ COMPACTION ============
+
+def compact_table(table_id):
+    """
+    Rewrite a table's rows into the current shape with set-based updates:
+    values of retired columns are removed and added columns get their
+    default (and its typed value), after which dict tables forget both. Returns the number of row
+    updates, or None when the table had nothing to compact.
+    """
+    with transaction.atomic():
+        json_table = JsonTable.objects.select_for_update().filter(pk=table_id).first()
+        if json_table is None or not json_table.needs_compaction:
+            return None
+        current_ids = set(column_id_map(json_table).values())
+        retired = [key for key in (json_table.retired_columns or []) if key not in current_ids]
+        fields = ['needs_compaction']
+        if json_table.row_format == JsonTable.ARRAY_ROWS:
+            updated = _compact_array_rows(json_table, retired)
+        else:
+            updated = row_sql.remove_keys(json_table.pk, retired)
+            typed = typed_defaults(json_table)
+            for key, default in (json_table.column_defaults or {}).items():
+                updated += row_sql.fill_key(json_table.pk, key, default, typed.get(key))
+            # Every row now has the defaults and none has a retired key, so
+            # the table can be read as stored again (see ``is_identity``)
+            json_table.column_defaults, json_table.retired_columns = {}, []
+            fields += ['column_defaults', 'retired_columns']
+        if updated:
+            row_search.index_table(json_table.pk)
+            counters.recount(json_table.pk)
+        json_table.needs_compaction = False
+        json_table.save(update_fields=fields)
+    return updated
+
+
+def _compact_array_rows(json_table, retired):
+    """
+    Compaction of array rows, rewritten in batches: slots cannot be set by
+    column id in SQL. Retired slots are emptied, not removed, so no value moves.
+    """
+    read, write, unpack = row_reader(json_table), row_writer(json_table), _unpacker(json_table)
+    retired = set(retired)
+    typed = typed_defaults(json_table)
+    changed = []
+    count = 0
+    for row in JsonTableRow.objects.filter(table_id=json_table.pk).iterator(chunk_size=row_sql.LOOP_BATCH_SIZE):
+        data = write(read(row.data))
+        typed_data = {key: value for key, value in (row.typed_data or {}).items() if key not in retired}
+        stored = unpack(row.data)
+        for key, value in typed.items():
+            if key not in stored:
+                typed_data.setdefault(key, value)
+        if data != row.data or typed_data != row.typed_data:
+            row.data, row.typed_data = data, typed_data
+            changed.append(row)
+        if len(changed) >= row_sql.LOOP_BATCH_SIZE:
+            JsonTableRow.objects.bulk_update(changed, ['data', 'typed_data'])
+            count += len(changed)
+            changed = []
+    JsonTableRow.objects.bulk_update(changed, ['data', 'typed_data'])
+    return count + len(changed)
+
+
+def compact_tables(limit=None):
+    """Compact every table with pending schema changes; yields ``(table_id, updated)``."""
+    table_ids = (
+        JsonTable.objects.filter(needs_compaction=True, table__deleted_at__isnull=True)
+        .order_by('pk').values_list('pk', flat=True)
+    )
+    for table_id in table_ids[:limit] if limit else table_ids:
+        yield table_id, compact_table(table_id)
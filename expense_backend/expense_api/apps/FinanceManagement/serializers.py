@@ -22,4 +22,16 @@ class DynamicTableSerializer(serializers.ModelSerializer):
         return [{
             'id': user.id,
             'username': user.username
-        } for user in obj.shared_with.all()]
\ No newline at end of file
+        } for user in obj.shared_with.all()]
+
+
+class TableListSerializer(DynamicTableSerializer):
+    """The table list entry: ``DynamicTableSerializer`` plus row counters and the headers annotated by ``catalog.list_tables``."""
+    column_count = serializers.SerializerMethodField()
+
+    class Meta(DynamicTableSerializer.Meta):
+        fields = DynamicTableSerializer.Meta.fields + ['row_count', 'row_bytes', 'rows_modified_at', 'column_count']
+        read_only_fields = ['row_count', 'row_bytes', 'rows_modified_at']
+
+    def get_column_count(self, obj):
+        return len(obj.headers or [])
@@ -0,0 +1,647 @@
+"""
+Write paths for dynamic tables.
+
+The REST views and the MCP server both mutate tables through these helpers,
+so every write to rows or headers also, in the same transaction:
+
+- computes the rows' typed shadow values (see ``column_types``);
+- appends to the table's change log (see ``changelog``);
+- keeps the monthly rollups current (see ``rollups``);
+- re-indexes the written rows for search (see ``row_search``);
+- updates the row counters (see ``counters``) and ``modified_at``, which
+  invalidates cached table catalogs;
+- refreshes the table search index when headers or names change.
+
+Creating and sharing tables also maintains their ``TableAccess`` rows, which
+``access`` resolves permissions from. Tables are checkpointed when created
+and can be restored to an earlier point of their change log (see
+``snapshots``).
+
+Row values are passed in and returned keyed by header name; stored rows are
+keyed by column id, or aligned to a layout of column ids (see ``schema``), so
+header changes never rewrite rows.
+"""
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import column_types as types
+from . import changelog, column_indexes, counters, positions, rollups, row_search, row_sql, schema, snapshots, table_index
+from .models import DynamicTableData, JsonTable, JsonTableRow, TableAccess, TableCatalogVersion
+
+
+def bump_catalog_versions(table_id=None, user_ids=()):
+    """Bump the table catalog version of everyone who can see ``table_id``, and of ``user_ids``."""
+    audience = models.Q(user_id__in=list(user_ids))
+    if table_id is not None:
+        audience |= models.Q(user__table_access__table_id=table_id)
+    TableCatalogVersion.objects.filter(audience).update(version=F('version') + 1)
+
+
+def touch_table(table_id, user_ids=(), rows=None):
+    """
+    Mark a table as modified without loading it: bumps its version and the
+    catalog versions of its owner, the users it is shared with and ``user_ids``
+    (for users who just lost access).
+
+    Row writes pass ``rows``, the ``(count, bytes)`` they added (negative when
+    removed), which the same UPDATE applies to the row counters.
+    """
+    now = timezone.now()
+    fields = {'modified_at': now, 'version': F('version') + 1}
+    if rows is not None:
+        count, size = rows
+        fields.update(row_count=F('row_count') + count, row_bytes=F('row_bytes') + size, rows_modified_at=now)
+    DynamicTableData.objects.filter(pk=table_id).update(**fields)
+    bump_catalog_versions(table_id, user_ids)
+
+
+def catalog_version(user_id):
+    version, _ = TableCatalogVersion.objects.get_or_create(user_id=user_id)
+    return version.version
+
+
+def create_table(user, table_name, headers, description="", column_types=None):
+    """Create a table together with its JsonTable headers; column types default to header-name hints."""
+    with transaction.atomic():
+        table_data = DynamicTableData.objects.create(
+            table_name=table_name,
+            user=user,
+            description=description,
+            pending_count=0
+        )
+        TableAccess.objects.create(user=user, table=table_data, role=TableAccess.OWNER)
+        column_types = {
+            header: (column_types or {}).get(header) or types.hint_from_header(header)
+            for header in headers
+        }
+        json_table = JsonTable(
+            table=table_data, headers=headers, column_types=column_types,
+            row_format=getattr(settings, "TABLE_ROW_FORMAT", JsonTable.DICT_ROWS)
+        )
+        if json_table.row_format == JsonTable.ARRAY_ROWS:
+            schema.new_layout(json_table)
+        json_table.rollup_config = rollups.current_config(json_table)
+        json_table.save(force_insert=True)
+        table_index.index_table(table_data, headers)
+        # Empty, so cheap; makes every later change restorable
+        snapshots.checkpoint(table_data.pk)
+        bump_catalog_versions(user_ids=[user.pk])
+    return table_data, json_table
+
+
+def update_table(table, table_name=None, description=None, pending_count=None):
+    """Update a table's metadata; the search index is refreshed when name or description change."""
+    with transaction.atomic():
+        fields = {}
+        if table_name is not None:
+            fields['table_name'] = table_name
+        if description is not None:
+            fields['description'] = description
+        if pending_count is not None:
+            fields['pending_count'] = pending_count
+        for field, value in fields.items():
+            setattr(table, field, value)
+        # Only the changed fields, so a stale in-memory version is never written back
+        table.save(update_fields=[*fields, 'modified_at'])
+        touch_table(table.pk)
+        if table_name is not None or description is not None:
+            table_index.index_table(table)
+    return table
+
+
+def share_table(table, users):
+    """Share a table with ``users``; returns the users it was not shared with before."""
+    with transaction.atomic():
+        already = set(TableAccess.objects.filter(table=table, user__in=users).values_list('user_id', flat=True))
+        added = [user for user in users if user.pk not in already]
+        if not added:
+            return []
+        table.shared_with.add(*added)
+        TableAccess.objects.bulk_create(
+            [TableAccess(user=user, table=table, role=TableAccess.SHARED) for user in added],
+            ignore_conflicts=True
+        )
+        if not table.is_shared:
+            table.is_shared = True
+            table.save(update_fields=['is_shared'])
+        touch_table(table.pk)
+    return added
+
+
+def unshare_table(table, users=None):
+    """Stop sharing a table with ``users``, or with everyone; returns the ids of users who lost it."""
+    with transaction.atomic():
+        shares = TableAccess.objects.filter(table=table, role=TableAccess.SHARED)
+        if users is not None:
+            shares = shares.filter(user__in=users)
+        removed_ids = list(shares.values_list('user_id', flat=True))
+        if users is None:
+            table.shared_with.clear()
+        else:
+            table.shared_with.remove(*users)
+        shares.delete()
+        if table.is_shared and not table.shared_with.exists():
+            table.is_shared = False
+            table.save(update_fields=['is_shared'])
+        # They lose the table, so their catalogs change too
+        touch_table(table.pk, removed_ids)
+    return removed_ids
+
+
+def delete_table(table):
+    """
+    Delete a table at once without touching its rows: it loses its access
+    rows and search terms, so no listing, view or tool sees it again, and
+    ``purge`` removes the rows later. Everyone who could see it gets a new
+    catalog version.
+    """
+    with transaction.atomic():
+        bump_catalog_versions(table.pk)
+        TableAccess.objects.filter(table_id=table.pk).delete()
+        table_index.unindex_table(table.pk)
+        column_indexes.drop_indexes(table.pk)
+        table.deleted_at = timezone.now()
+        DynamicTableData.objects.filter(pk=table.pk).update(deleted_at=table.deleted_at, version=F('version') + 1)
+
+
+def ensure_column_types(json_table):
+    """Infer column types for tables created before typed columns existed."""
+    if json_table.headers and not json_table.column_types:
+        refresh_column_types(json_table)
+
+
+def read_row(json_table, row):
+    """A row's values keyed by header name."""
+    return schema.row_reader(json_table)(row.data)
+
+
+def _row_fields(json_table, values, previous_typed=None):
+    """Stored ``data`` and ``typed_data`` for values keyed by header name."""
+    typed = types.typed_row(values, json_table.column_types, previous=previous_typed)
+    return schema.row_writer(json_table)(values), schema.typed_writer(json_table)(typed)
+
+
+def insert_row(json_table, data, after=None, before=None):
+    """
+    Add a row to a table and return it: right after the row ``after`` or
+    right before the row ``before`` (primary keys), or at the end.
+    """
+    with transaction.atomic():
+        ensure_column_types(json_table)
+        stored, typed = _row_fields(json_table, data)
+        position, follows = positions.place(json_table.pk, after, before)
+        row = JsonTableRow.objects.create(table=json_table, data=stored, typed_data=typed, position=position)
+        changes = [('insert', row.pk, data)]
+        if after is not None or before is not None:
+            changes.append(('move', row.pk, {"after": follows}))
+        changelog.log_changes(json_table.pk, changes)
+        rollups.apply_changes(json_table, added=[typed])
+        row_search.index_rows([row])
+        touch_table(json_table.pk, rows=(1, counters.row_size(stored)))
+    return row
+
+
+def bulk_insert_rows(json_table, rows_data, batch_size=1000):
+    """Insert many rows in one transaction; ``json_table.column_types`` must be set already."""
+    write = schema.row_writer(json_table)
+    write_typed = schema.typed_writer(json_table)
+    with transaction.atomic():
+        keys = positions.append_positions(json_table.pk, len(rows_data))
+        rows = JsonTableRow.objects.bulk_create(
+            [
+                JsonTableRow(
+                    table=json_table,
+                    data=write(data),
+                    typed_data=write_typed(types.typed_row(data, json_table.column_types)),
+                    position=position
+                )
+                for data, position in zip(rows_data, keys)
+            ],
+            batch_size=batch_size
+        )
+        changelog.log_changes(json_table.pk, [('insert', row.pk, data) for row, data in zip(rows, rows_data)])
+        rollups.apply_changes(json_table, added=[row.typed_data for row in rows])
+        row_search.index_rows(rows)
+        touch_table(json_table.pk, rows=(len(rows), sum(counters.row_size(row.data) for row in rows)))
+    return len(rows_data)
+
+
+def update_row(row, new_data):
+    """Merge ``new_data`` into a row and return the updated values."""
+    with transaction.atomic():
+        json_table = row.table
+        ensure_column_types(json_table)
+        current_data = read_row(json_table, row)
+        current_data.update(new_data)
+        # Edited relative dates ("ajk") resolve again, untouched ones keep their date
+        previous_typed = {
+            header: value for header, value in schema.typed_reader(json_table)(row.typed_data).items()
+            if header not in new_data
+        }
+        old_typed, old_size = row.typed_data, counters.row_size(row.data)
+        row.data, row.typed_data = _row_fields(json_table, current_data, previous_typed)
+        row.save(update_fields=['data', 'typed_data'])
+        changelog.log_changes(row.table_id, [('update', row.pk, new_data)])
+        rollups.apply_changes(json_table, removed=[old_typed], added=[row.typed_data])
+        row_search.index_rows([row])
+        touch_table(row.table_id, rows=(0, counters.row_size(row.data) - old_size))
+    return current_data
+
+
+def move_row(row, after=None, before=None):
+    """
+    Move a row right after the row ``after`` or right before the row
+    ``before`` (primary keys), or to the end; only the moved row is written.
+    Returns the primary key of the row it now follows, None at the start.
+    """
+    with transaction.atomic():
+        row.position, follows = positions.place(row.table_id, after, before, exclude=row.pk)
+        row.save(update_fields=['position'])
+        changelog.log_changes(row.table_id, [('move', row.pk, {"after": follows})])
+        touch_table(row.table_id, rows=(0, 0))
+    return follows
+
+
+def delete_row(row):
+    """Delete a single row."""
+    with transaction.atomic():
+        json_table, row_id = row.table, row.pk
+        row.delete()
+        changelog.log_changes(json_table.pk, [('delete', row_id, None)])
+        rollups.apply_changes(json_table, removed=[row.typed_data])
+        touch_table(json_table.pk, rows=(-1, -counters.row_size(row.data)))
+
+
+ROW_OPERATIONS = ("add", "update", "delete")
+BATCH_MODES = ("atomic", "best_effort")
+MAX_BATCH_OPERATIONS = 1000
+
+
+def _find_rows(json_table, row_ids):
+    """Resolve row ids (primary keys, or the ``id`` key in row data for strings) in two queries."""
+    pks = [row_id for row_id in row_ids if isinstance(row_id, int) and not isinstance(row_id, bool)]
+    data_ids = [row_id for row_id in row_ids if isinstance(row_id, str)]
+    found = {}
+    if pks:
+        for row in json_table.rows.filter(pk__in=pks):
+            found[row.pk] = row
+    if data_ids:
+        read = schema.row_reader(json_table)
+        lookup = schema.data_lookup(json_table, 'id')
+        for row in json_table.rows.filter(**{f"{lookup}__in": data_ids}).order_by('id'):
+            found.setdefault(str(read(row.data).get('id')), row)
+    return found
+
+
+def _check_values(json_table, values, name):
+    if not isinstance(values, dict):
+        raise ValueError(f"'{name}' must be a dictionary")
+    unknown = [key for key in values if key not in json_table.headers]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(map(str, unknown))}")
+
+
+def _check_operation(json_table, operation):
+    if not isinstance(operation, dict) or operation.get('op') not in ROW_OPERATIONS:
+        raise ValueError(f"'op' must be one of: {', '.join(ROW_OPERATIONS)}")
+    if operation['op'] == 'add':
+        _check_values(json_table, operation.get('row'), 'row')
+        return
+    if operation.get('rowId') is None:
+        raise ValueError("'rowId' is required")
+    if operation['op'] == 'update':
+        _check_values(json_table, operation.get('data'), 'data')
+
+
+def apply_row_operations(json_table, operations, mode="atomic"):
+    """
+    Apply an ordered list of row operations in one transaction.
+
+    Operations are ``{"op": "add", "row": {...}}``,
+    ``{"op": "update", "rowId": ..., "data": {...}}`` and
+    ``{"op": "delete", "rowId": ...}``. They are validated and folded in memory
+    (later operations see the effect of earlier ones), then written with one
+    bulk insert, one bulk update and one delete.
+
+    In ``atomic`` mode nothing is written if any operation fails; in
+    ``best_effort`` mode the failing ones are skipped. Returns
+    ``(results, applied)`` with one result per operation.
+    """
+    if mode not in BATCH_MODES:
+        raise ValueError(f"Unknown mode '{mode}'. Use one of: {', '.join(BATCH_MODES)}")
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        raise ValueError(f"At most {MAX_BATCH_OPERATIONS} operations per batch")
+
+    ensure_column_types(json_table)
+    valid = []
+    results = []
+    for operation in operations:
+        try:
+            _check_operation(json_table, operation)
+            valid.append(operation)
+            results.append(None)
+        except ValueError as e:
+            valid.append(None)
+            results.append({"status": "error", "error": str(e)})
+
+    rows = _find_rows(json_table, [operation['rowId'] for operation in valid if operation and operation['op'] != 'add'])
+    read = schema.row_reader(json_table)
+    read_typed = schema.typed_reader(json_table)
+    added = []      # [(index, values)]
+    updated = {}    # pk -> (row, values)
+    deleted = {}    # pk -> row
+
+    for index, operation in enumerate(valid):
+        if operation is None:
+            continue
+        if operation['op'] == 'add':
+            added.append((index, dict(operation['row'])))
+            results[index] = {"status": "ok"}
+            continue
+
+        row = rows.get(operation['rowId'])
+        if row is None or row.pk in deleted:
+            results[index] = {"status": "error", "error": f"Row with ID '{operation['rowId']}' not found in table."}
+            continue
+        if operation['op'] == 'delete':
+            deleted[row.pk] = row
+            updated.pop(row.pk, None)
+            results[index] = {"status": "ok", "id": row.pk}
+        else:
+            _, values, edited = updated.get(row.pk) or (row, read(row.data), set())
+            values.update(operation['data'])
+            edited.update(operation['data'])
+            updated[row.pk] = (row, values, edited)
+            results[index] = {"status": "ok", "id": row.pk, "row": dict(values)}
+
+    failed = any(result["status"] == "error" for result in results)
+    if failed and mode == "atomic":
+        for result in results:
+            if result["status"] == "ok":
+                result.update(status="not_applied")
+                result.pop("row", None)
+        return results, False
+
+    with transaction.atomic():
+        new_rows = []
+        keys = positions.append_positions(json_table.pk, len(added)) if added else []
+        for (index, values), position in zip(added, keys):
+            stored, typed = _row_fields(json_table, values)
+            new_rows.append(JsonTableRow(table=json_table, data=stored, typed_data=typed, position=position))
+        JsonTableRow.objects.bulk_create(new_rows, batch_size=500)
+        for (index, values), row in zip(added, new_rows):
+            results[index].update(id=row.pk, row=values)
+
+        changed = []
+        old_typed = []
+        size = sum(counters.row_size(row.data) for row in new_rows)
+        size -= sum(counters.row_size(row.data) for row in deleted.values())
+        for row, values, edited in updated.values():
+            old_typed.append(row.typed_data)
+            size -= counters.row_size(row.data)
+            previous_typed = {
+                header: value for header, value in read_typed(row.typed_data).items() if header not in edited
+            }
+            row.data, row.typed_data = _row_fields(json_table, values, previous_typed)
+            size += counters.row_size(row.data)
+            changed.append(row)
+        JsonTableRow.objects.bulk_update(changed, ['data', 'typed_data'], batch_size=500)
+
+        if deleted:
+            JsonTableRow.objects.filter(pk__in=list(deleted)).delete()
+        if new_rows or changed or deleted:
+            changelog.log_changes(json_table.pk, [
+                *[('insert', row.pk, values) for (index, values), row in zip(added, new_rows)],
+                *[('update', row.pk, {header: values.get(header) for header in edited})
+                  for row, values, edited in updated.values()],
+                *[('delete', row_id, None) for row_id in sorted(deleted)],
+            ])
+            rollups.apply_changes(
+                json_table,
+                removed=[*old_typed, *[row.typed_data for row in deleted.values()]],
+                added=[row.typed_data for row in [*new_rows, *changed]]
+            )
+            row_search.index_rows([*new_rows, *changed])
+            touch_table(json_table.pk, rows=(len(new_rows) - len(deleted), size))
+
+    return results, True
+
+
+def add_column(json_table, header, column_type=None, default=""):
+    """
+    Append a header; existing rows read ``default`` for it until they are
+    rewritten, and get its typed value right away.
+    """
+    with transaction.atomic():
+        schema.add_column(json_table, header, default)
+        json_table.column_types = {**(json_table.column_types or {}), header: column_type or types.hint_from_header(header)}
+        json_table.save()
+        key = schema.column_id(json_table, header)
+        typed_default = schema.typed_defaults(json_table).get(key)
+        if typed_default is not None:
+            # Filters, groups and rollups read typed values in SQL
+            row_sql.fill_typed_key(json_table.pk, key, typed_default)
+        row_search.add_value(json_table.pk, default)
+        changelog.log_schema_change(json_table, 'add', header=header, default=default)
+        rollups.columns_changed(json_table)
+        touch_table(json_table.pk)
+        table_index.index_table(json_table.table, json_table.headers)
+    return json_table.headers
+
+
+def delete_columns(json_table, headers):
+    """Remove the given headers; their values are dropped from rows on compaction."""
+    headers = [header for header in headers if header in json_table.headers]
+    if not headers:
+        return json_table.headers
+    with transaction.atomic():
+        schema.drop_columns(json_table, headers)
+        json_table.column_types = {
+            header: column_type
+            for header, column_type in (json_table.column_types or {}).items()
+            if header not in headers
+        }
+        json_table.save()
+        changelog.log_schema_change(json_table, 'delete', removed=headers)
+        rollups.columns_changed(json_table)
+        column_indexes.columns_changed(json_table)
+        touch_table(json_table.pk)
+        table_index.index_table(json_table.table, json_table.headers)
+    return json_table.headers
+
+
+def rename_column(json_table, old_header, new_header):
+    """Rename a header in place; rows are untouched since they store the column id."""
+    with transaction.atomic():
+        schema.rename_column(json_table, old_header, new_header)
+        column_types = dict(json_table.column_types or {})
+        if old_header in column_types:
+            column_types[new_header] = column_types.pop(old_header)
+        json_table.column_types = column_types
+        json_table.save()
+        changelog.log_schema_change(json_table, 'rename', old=old_header, new=new_header)
+        touch_table(json_table.pk)
+        table_index.index_table(json_table.table, json_table.headers)
+    return json_table.headers
+
+
+def _recompute_typed_rows(json_table, batch_size=500):
+    read = schema.row_reader(json_table)
+    read_typed = schema.typed_reader(json_table)
+    write_typed = schema.typed_writer(json_table)
+    rows = []
+    for row in json_table.rows.all().iterator(chunk_size=batch_size):
+        typed_data = write_typed(
+            types.typed_row(read(row.data), json_table.column_types, previous=read_typed(row.typed_data))
+        )
+        if typed_data != row.typed_data:
+            row.typed_data = typed_data
+            rows.append(row)
+    JsonTableRow.objects.bulk_update(rows, ['typed_data'], batch_size=batch_size)
+    return len(rows)
+
+
+def set_column_type(json_table, header, column_type):
+    """Change the type of one column and recompute the shadow values of every row."""
+    if column_type not in types.COLUMN_TYPES:
+        raise ValueError(f"Unknown column type '{column_type}'. Use one of: {', '.join(types.COLUMN_TYPES)}")
+    if header not in json_table.headers:
+        raise ValueError(f"Column '{header}' does not exist.")
+    with transaction.atomic():
+        json_table.column_types = {**(json_table.column_types or {}), header: column_type}
+        json_table.save(update_fields=['column_types'])
+        _recompute_typed_rows(json_table)
+        changelog.log_schema_change(json_table, 'types')
+        if json_table.rollup_config is not None:
+            rollups.rebuild_table(json_table)
+        column_indexes.columns_changed(json_table)
+        touch_table(json_table.pk)
+    return json_table.column_types
+
+
+def refresh_column_types(json_table, keep_existing=False):
+    """
+    Infer column types from the table's rows and recompute shadow values.
+
+    With ``keep_existing`` only columns without a type are inferred.
+    """
+    with transaction.atomic():
+        read = schema.row_reader(json_table)
+        inferred = types.infer_column_types(
+            json_table.headers,
+            [read(data) for data in json_table.rows.order_by('-id').values_list('data', flat=True)[:200]]
+        )
+        if keep_existing:
+            inferred.update({
+                header: column_type
+                for header, column_type in (json_table.column_types or {}).items()
+                if header in inferred
+            })
+        json_table.column_types = inferred
+        json_table.save(update_fields=['column_types'])
+        _recompute_typed_rows(json_table)
+        changelog.log_schema_change(json_table, 'types')
+        if json_table.rollup_config is not None:
+            rollups.rebuild_table(json_table)
+        column_indexes.columns_changed(json_table)
+        touch_table(json_table.pk)
+    return json_table.column_types
+
+
+RESTORE_BATCH_SIZE = 1000
+
+
+def _restore_columns(json_table, state):
+    """
+    Give the table the headers, types and defaults of ``state``, keeping the
+    column ids of headers it still has. Returns True when array rows get a
+    new layout. Does not save.
+    """
+    dropped = [header for header in json_table.headers if header not in state['headers']]
+    if dropped:
+        schema.drop_columns(json_table, dropped)
+    for header in state['headers']:
+        if header not in json_table.headers:
+            schema.add_column(json_table, header, state['defaults'].get(header, ""))
+    json_table.headers = list(state['headers'])
+    json_table.column_types = dict(state['column_types'] or {})
+    json_table.column_defaults = {
+        schema.column_id(json_table, header): default
+        for header, default in state['defaults'].items() if header in json_table.headers
+    }
+    json_table.needs_compaction = False
+    if json_table.row_format != JsonTable.ARRAY_ROWS:
+        return False
+    if set(json_table.row_layouts[-1]) == set(schema.column_id_map(json_table).values()):
+        return False
+    # Every row is rewritten below, so start a layout without the dropped slots
+    schema.new_layout(json_table)
+    return True
+
+
+def restore_table(json_table, seq, user=None):
+    """
+    Bring a table's headers and rows back to how they were after change
+    ``seq`` (see ``snapshots.table_at``), in the same order and with the
+    same row ids. Only rows that differ are written. The table as it was is
+    snapshotted first (``undo_snapshot``), then a single resync entry is
+    logged and a new checkpoint taken; returns that snapshot's id and counts
+    of the rows ``restored``, ``recreated``, ``updated`` and ``deleted``.
+    Raises ValueError when the table cannot be restored to ``seq``.
+    """
+    with transaction.atomic():
+        json_table = JsonTable.objects.select_for_update().select_related('table').get(pk=json_table.pk)
+        state = snapshots.table_at(json_table.table, seq)
+        undo = snapshots.create_snapshot(json_table.table, f"Before restoring to #{seq}", user)
+        read, read_typed = schema.row_reader(json_table), schema.typed_reader(json_table)
+        new_layout = _restore_columns(json_table, state)
+        json_table.save()
+
+        target = dict(state['rows'])
+        keys = positions.order_keys(
+            list(target), dict(JsonTableRow.objects.filter(table_id=json_table.pk).values_list('pk', 'position'))
+        )
+        counts = {"undo_snapshot": undo.pk, "restored": len(target), "recreated": 0, "updated": 0, "deleted": 0}
+        changed, deleted = [], []
+        for row in JsonTableRow.objects.filter(table_id=json_table.pk).only('pk', 'data', 'typed_data', 'position').iterator(chunk_size=RESTORE_BATCH_SIZE):
+            values = target.pop(row.pk, None)
+            if values is None:
+                deleted.append(row.pk)
+                continue
+            current = read(row.data)
+            # Dates typed from relative values ("ajk") keep their day unless the value differs
+            previous_typed = {
+                header: value for header, value in read_typed(row.typed_data).items()
+                if current.get(header) == values.get(header)
+            }
+            data, typed = _row_fields(json_table, values, previous_typed)
+            if (data, typed, keys[row.pk]) != (row.data, row.typed_data, row.position):
+                row.data, row.typed_data, row.position = data, typed, keys[row.pk]
+                changed.append(row)
+        JsonTableRow.objects.bulk_update(changed, ['data', 'typed_data', 'position'], batch_size=RESTORE_BATCH_SIZE)
+        for start in range(0, len(deleted), RESTORE_BATCH_SIZE):
+            JsonTableRow.objects.filter(pk__in=deleted[start:start + RESTORE_BATCH_SIZE]).delete()
+        # Deleted rows come back with their old ids, which are never handed out again
+        recreated = []
+        for row_id, values in target.items():
+            data, typed = _row_fields(json_table, values)
+            recreated.append(JsonTableRow(pk=row_id, table=json_table, data=data, typed_data=typed, position=keys[row_id]))
+        JsonTableRow.objects.bulk_create(recreated, batch_size=RESTORE_BATCH_SIZE)
+        counts.update(recreated=len(recreated), updated=len(changed), deleted=len(deleted))
+
+        changelog.log_changes(json_table.pk, [('resync', None, {"reason": f"restored to #{seq}"})])
+        if json_table.rollup_config is not None:
+            rollups.rebuild_table(json_table)
+        if new_layout:
+            # Their expressions address slots of the old layout
+            column_indexes.drop_indexes(json_table.pk)
+        else:
+            column_indexes.columns_changed(json_table)
+        row_search.index_table(json_table.pk)
+        touch_table(json_table.pk, rows=(0, 0))
+        counters.recount(json_table.pk)
+        table_index.index_table(json_table.table, json_table.headers)
+        snapshots.checkpoint(json_table.pk)
+    return counts
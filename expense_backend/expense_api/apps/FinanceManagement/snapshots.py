@@ -0,0 +1,279 @@
+"""
+Table snapshots and point-in-time restore.
+
+A table's past is kept as checkpoints plus its change log (see
+``changelog``). A ``TableCheckpoint`` is a zstd-compressed copy of the
+table's headers and rows at one change log seq, written as JSON lines: the
+headers, column types and column defaults first, then one
+``[row id, {header: value}]`` per row in table order. Between checkpoints
+the change log holds every row insert, update, delete and move and every
+header change, so the table as of any seq is the nearest checkpoint at or
+before it with the entries after it replayed (``table_at``).
+
+Taking a snapshot therefore writes no rows: a ``TableSnapshot`` records the
+seq and the checkpoint to start from, and only when no usable checkpoint
+exists (a new table, a resync entry since the last one) is one taken on the
+spot. Snapshots keep the change log after their checkpoint from being
+compacted (``changelog.compact``). ``services.restore_table`` brings a
+table back to a snapshot or seq.
+
+Checkpoints are taken when a table is created, after a restore and by the
+``checkpoint_tables`` command, which also prunes old ones (``prune``).
+Resync entries (large imports and batches) cannot be replayed, so points
+between a resync and the next checkpoint cannot be restored.
+"""
+import io
+import json
+from datetime import timedelta
+
+import zstandard
+from django.db import transaction
+from django.db.models import Exists, F, Max, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import schema
+from .models import DynamicTableData, JsonTable, JsonTableRow, TableChange, TableCheckpoint, TableSnapshot
+
+
+CHECKPOINT_CHANGES = 1000  # Changes since a table's last checkpoint before checkpoint_tables takes another
+COMPRESSION_LEVEL = 10
+READ_BATCH_SIZE = 2000
+
+
+# ============ CHECKPOINTS ============
+
+def _lock(table_id):
+    return DynamicTableData.objects.select_for_update().only('id', 'change_seq', 'change_floor').get(pk=table_id)
+
+
+def checkpoint(table_id):
+    """Take a checkpoint of a table as of its latest change, or return the one already taken there."""
+    with transaction.atomic():
+        # Writers bump change_seq under this lock, so the rows read match the seq
+        table = _lock(table_id)
+        existing = TableCheckpoint.objects.filter(table_id=table_id, seq=table.change_seq).first()
+        if existing is not None:
+            return existing
+        json_table = JsonTable.objects.get(pk=table_id)
+        read = schema.row_reader(json_table)
+        names = {key: header for header, key in schema.column_id_map(json_table).items()}
+
+        compressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL).compressobj()
+        chunks = []
+        raw_bytes = row_count = 0
+
+        def write(item):
+            nonlocal raw_bytes
+            line = (json.dumps(item, ensure_ascii=False, separators=(',', ':')) + "\n").encode()
+            raw_bytes += len(line)
+            chunks.append(compressor.compress(line))
+
+        write({
+            "headers": json_table.headers,
+            "column_types": json_table.column_types,
+            "defaults": {
+                names[key]: value for key, value in (json_table.column_defaults or {}).items() if key in names
+            },
+        })
+        rows = JsonTableRow.objects.filter(table_id=table_id).order_by('position', 'pk').values_list('pk', 'data')
+        for row_id, data in rows.iterator(chunk_size=READ_BATCH_SIZE):
+            write([row_id, read(data)])
+            row_count += 1
+        chunks.append(compressor.flush())
+
+        return TableCheckpoint.objects.create(
+            table_id=table_id, seq=table.change_seq, row_count=row_count,
+            raw_bytes=raw_bytes, content=b"".join(chunks)
+        )
+
+
+def _read(checkpoint):
+    """The header line of a checkpoint and an iterator over its rows."""
+    stream = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(bytes(checkpoint.content)))
+    lines = io.TextIOWrapper(stream, encoding='utf-8')
+    return json.loads(next(lines)), (json.loads(line) for line in lines)
+
+
+def base_checkpoint(table, seq):
+    """
+    The latest checkpoint of ``table`` that the table as of ``seq`` can be
+    replayed from, or None: taken at or before ``seq``, with the change log
+    from it to ``seq`` still kept and free of resync entries.
+    """
+    resync = TableChange.objects.filter(
+        table_id=table.pk, op='resync', seq__lte=seq
+    ).aggregate(seq=Max('seq'))['seq'] or 0
+    return (
+        TableCheckpoint.objects.filter(table_id=table.pk, seq__lte=seq, seq__gte=resync)
+        .filter(Q(seq__gte=table.change_floor) | Q(seq=seq))
+        .defer('content').order_by('-seq').first()
+    )
+
+
+def checkpoint_tables(min_changes=CHECKPOINT_CHANGES, table_id=None):
+    """
+    Checkpoint every table with ``min_changes`` changes, or a resync entry,
+    since its last checkpoint, and tables without one; yields
+    ``(table_id, checkpoint)``.
+    """
+    latest = TableCheckpoint.objects.filter(table=OuterRef('pk')).order_by('-seq').values('seq')[:1]
+    tables = DynamicTableData.objects.filter(deleted_at__isnull=True).annotate(
+        checkpoint_seq=Coalesce(Subquery(latest), Value(-1))
+    ).filter(
+        Q(checkpoint_seq__lt=0)
+        | Q(change_seq__gte=F('checkpoint_seq') + min_changes)
+        | Exists(TableChange.objects.filter(table=OuterRef('pk'), op='resync', seq__gt=OuterRef('checkpoint_seq')))
+    )
+    if table_id is not None:
+        tables = tables.filter(pk=table_id)
+    for pk in tables.order_by('pk').values_list('pk', flat=True):
+        yield pk, checkpoint(pk)
+
+
+def prune(keep_per_table=2, snapshot_days=None):
+    """
+    Delete snapshots older than ``snapshot_days`` (when given), then every
+    checkpoint that no snapshot uses except the latest ``keep_per_table`` of
+    each table. Returns ``(snapshots, checkpoints)`` deleted.
+    """
+    snapshots = 0
+    if snapshot_days is not None:
+        cutoff = timezone.now() - timedelta(days=snapshot_days)
+        snapshots = TableSnapshot.objects.filter(created_at__lt=cutoff).delete()[0]
+
+    checkpoints = 0
+    for table_id in TableCheckpoint.objects.values_list('table_id', flat=True).distinct().order_by('table_id'):
+        keep = TableCheckpoint.objects.filter(table_id=table_id).order_by('-seq').values_list('pk', flat=True)
+        checkpoints += (
+            TableCheckpoint.objects.filter(table_id=table_id, snapshots__isnull=True)
+            .exclude(pk__in=list(keep[:keep_per_table])).delete()[0]
+        )
+    return snapshots, checkpoints
+
+
+# ============ SNAPSHOTS ============
+
+def create_snapshot(table, label="", user=None):
+    """
+    Record the table as it is now. Uses the latest checkpoint the current
+    seq can be replayed from, so it costs no more than a few small queries
+    unless the table needs a checkpoint first.
+    """
+    with transaction.atomic():
+        table = _lock(table.pk)
+        base = base_checkpoint(table, table.change_seq) or checkpoint(table.pk)
+        return TableSnapshot.objects.create(
+            table_id=table.pk, seq=table.change_seq, checkpoint=base, label=label, created_by=user
+        )
+
+
+def seq_at(table, when):
+    """The seq of the table's last change at or before ``when``; raises ValueError when that is not known."""
+    seq = TableChange.objects.filter(
+        table_id=table.pk, created_at__lte=when
+    ).order_by('-seq').values_list('seq', flat=True).first()
+    if seq is not None:
+        return seq
+    if table.created_at > when:
+        raise ValueError("The table did not exist at that time.")
+    if table.change_floor:
+        raise ValueError("The table's history does not go back that far.")
+    return 0
+
+
+# ============ REPLAYING ============
+
+class _Order:
+    """Row ids in table order, as a circular linked list through 0 so that moves cost O(1)."""
+
+    def __init__(self):
+        self.next, self.prev = {0: 0}, {0: 0}
+
+    def __contains__(self, row_id):
+        return row_id in self.next
+
+    def insert(self, row_id, after=0):
+        following = self.next[after]
+        self.next[after], self.prev[row_id] = row_id, after
+        self.next[row_id], self.prev[following] = following, row_id
+
+    def append(self, row_id):
+        self.insert(row_id, self.prev[0])
+
+    def remove(self, row_id):
+        before, after = self.prev.pop(row_id), self.next.pop(row_id)
+        self.next[before], self.prev[after] = after, before
+
+    def __iter__(self):
+        row_id = self.next[0]
+        while row_id:
+            yield row_id
+            row_id = self.next[row_id]
+
+
+def _apply_schema(state, rows, details):
+    action = details.get('action')
+    if action == 'add':
+        header, default = details['header'], details.get('default', "")
+        for values in rows.values():
+            values.setdefault(header, default)
+        state['defaults'][header] = default
+    elif action == 'rename':
+        old, new = details['old'], details['new']
+        for values in rows.values():
+            if old in values:
+                values[new] = values.pop(old)
+        if old in state['defaults']:
+            state['defaults'][new] = state['defaults'].pop(old)
+    elif action == 'delete':
+        for header in details['removed']:
+            for values in rows.values():
+                values.pop(header, None)
+            state['defaults'].pop(header, None)
+    state['headers'] = details['headers']
+    state['column_types'] = details['column_types']
+
+
+def table_at(table, seq):
+    """
+    The table as of change ``seq``: ``{"seq", "headers", "column_types",
+    "defaults", "rows"}`` with ``rows`` a list of ``(row id, {header:
+    value})`` in table order. Raises ValueError when that point cannot be
+    rebuilt.
+    """
+    if seq < 0 or seq > table.change_seq:
+        raise ValueError(f"Change #{seq} does not exist; the table is at #{table.change_seq}.")
+    base = base_checkpoint(table, seq)
+    if base is None:
+        raise ValueError(f"The table cannot be restored to #{seq}: no checkpoint to replay it from.")
+
+    state, stored = _read(TableCheckpoint.objects.get(pk=base.pk))
+    rows, order = {}, _Order()
+    for row_id, values in stored:
+        rows[row_id] = values
+        order.append(row_id)
+
+    changes = TableChange.objects.filter(
+        table_id=table.pk, seq__gt=base.seq, seq__lte=seq
+    ).order_by('seq').values_list('op', 'row_id', 'values')
+    for op, row_id, values in changes.iterator(chunk_size=READ_BATCH_SIZE):
+        if op == 'insert':
+            rows[row_id] = {**state['defaults'], **(values or {})}
+            order.append(row_id)
+        elif op == 'update' and row_id in rows:
+            rows[row_id].update(values or {})
+        elif op == 'delete' and row_id in rows:
+            del rows[row_id]
+            order.remove(row_id)
+        elif op == 'move' and row_id in rows:
+            order.remove(row_id)
+            after = (values or {}).get('after')
+            order.insert(row_id, after if after in rows else 0)
+        elif op == 'schema':
+            _apply_schema(state, rows, values or {})
+        elif op == 'resync':
+            # base_checkpoint never replays across one
+            raise ValueError(f"The table cannot be restored to #{seq}.")
+
+    return {**state, "seq": seq, "rows": [(row_id, rows[row_id]) for row_id in order]}
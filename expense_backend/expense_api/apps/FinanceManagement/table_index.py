@@ -0,0 +1,295 @@
+"""
+Inverted index over table names, descriptions and headers.
+
+Every table is broken into weighted terms (``TableSearchTerm`` rows) when it is
+created, renamed or its headers change. A search only reads the postings of
+the query's terms and ranks tables with a BM25-style TF-IDF score, so the cost
+depends on the query, not on how many tables a user has.
+
+Tokens are transliteration aware: Bangla script, Banglish spellings and English
+words for the same concept ("খরচ", "khoroch", "expense") all map to one concept
+term, in addition to the literal token.
+"""
+import math
+import re
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import DynamicTableData, JsonTable, TableSearchTerm
+
+
+# Field weights: a match in the table name matters more than one in a header.
+NAME_WEIGHT = 3.0
+HEADER_WEIGHT = 1.5
+DESCRIPTION_WEIGHT = 1.0
+CONCEPT_WEIGHT = 0.8
+SKELETON_WEIGHT = 0.4
+
+# BM25 term-frequency saturation
+TF_SATURATION = 1.2
+
+TOKEN_RE = re.compile(r"[ঀ-৿]+|[0-9]+|[^\W\d_]+", re.UNICODE)
+
+BANGLA_DIGITS = str.maketrans("০১২৩৪৫৬৭৮৯", "0123456789")
+
+STOPWORDS = {
+    "a", "an", "the", "of", "in", "on", "at", "to", "for", "and", "or", "my", "me", "i", "is", "was",
+    "show", "add", "get", "all", "with", "from", "this", "that", "please",
+    "ami", "amar", "e", "te", "ke", "er", "r", "ta", "ti", "koto", "kori", "korchi", "korechi", "korsi",
+    "korlam", "dao", "dekhao", "ki", "ar", "o",
+    "আমি", "আমার", "করেছি", "করলাম", "এবং", "ও", "কত", "দেখাও",
+}
+
+# Bangla case/plural suffixes stripped from Bangla-script tokens (longest first)
+BANGLA_SUFFIXES = ("গুলো", "গুলি", "দের", "েরা", "ের", "তে", "কে", "টা", "টি", "ে", "র")
+
+# Variant spellings (Bangla script, Banglish, English) -> concept term
+CONCEPTS = {
+    "expense": ["expense", "expenses", "expenditure", "cost", "costs", "spent", "spend", "spending",
+                "khoroch", "khoros", "khorch", "khorcha", "খরচ", "ব্যয়"],
+    "income": ["income", "earning", "earnings", "salary", "ay", "aay", "aye", "beton", "আয়", "বেতন", "উপার্জন"],
+    "money": ["money", "taka", "tk", "bdt", "amount", "price", "dam", "টাকা", "দাম", "পরিমাণ"],
+    "today": ["today", "daily", "day", "ajk", "aj", "ajke", "আজ", "আজকে", "দৈনিক", "দিন"],
+    "yesterday": ["yesterday", "gotokal", "gtkl", "গতকাল"],
+    "month": ["month", "monthly", "mash", "mas", "মাস", "মাসিক"],
+    "date": ["date", "tarikh", "তারিখ"],
+    "book": ["book", "books", "reading", "boi", "বই", "পড়া"],
+    "food": ["food", "meal", "meals", "khabar", "khawa", "bhat", "খাবার", "খাওয়া"],
+    "market": ["market", "grocery", "groceries", "bazar", "bazaar", "shopping", "বাজার", "কেনাকাটা"],
+    "rent": ["rent", "bhara", "vara", "ভাড়া"],
+    "travel": ["travel", "trip", "tour", "journey", "bhromon", "vromon", "jatra", "ভ্রমণ", "যাত্রা"],
+    "transport": ["transport", "bus", "rickshaw", "cng", "uber", "gari", "গাড়ি", "রিকশা"],
+    "location": ["location", "place", "city", "jayga", "jaiga", "sthan", "জায়গা", "স্থান", "শহর"],
+    "dhaka": ["dhaka", "ঢাকা"],
+    "sylhet": ["sylhet", "sylet", "silet", "সিলেট"],
+    "chittagong": ["chittagong", "chattogram", "ctg", "চট্টগ্রাম"],
+    "rajshahi": ["rajshahi", "রাজশাহী"],
+    "khulna": ["khulna", "খুলনা"],
+    "health": ["health", "medicine", "medical", "doctor", "pharmacy", "oshudh", "osudh", "ওষুধ", "ডাক্তার", "স্বাস্থ্য"],
+    "bill": ["bill", "bills", "utility", "electricity", "biddut", "bidyut", "বিল", "বিদ্যুৎ"],
+    "study": ["study", "studies", "class", "exam", "porashona", "porasona", "পড়াশোনা", "পরীক্ষা"],
+    "task": ["task", "tasks", "todo", "kaj", "কাজ"],
+    "inventory": ["inventory", "stock", "supplies", "mojud", "মজুদ"],
+    "workout": ["workout", "gym", "exercise", "byayam", "ব্যায়াম"],
+    "category": ["category", "type", "dhoron", "ধরন", "ক্যাটাগরি"],
+    "note": ["note", "notes", "description", "details", "biboron", "বিবরণ", "মন্তব্য"],
+}
+
+VARIANT_TO_CONCEPT = {
+    variant: concept
+    for concept, variants in CONCEPTS.items()
+    for variant in variants
+}
+
+
+def _normalize(text):
+    return unicodedata.normalize("NFC", str(text or "")).lower().translate(BANGLA_DIGITS)
+
+
+def _stem(token):
+    if token in VARIANT_TO_CONCEPT:
+        return token
+    if "ঀ" <= token[0] <= "৿":
+        for suffix in BANGLA_SUFFIXES:
+            if not token.endswith(suffix):
+                continue
+            stripped = token[: -len(suffix)]
+            if stripped in VARIANT_TO_CONCEPT:
+                return stripped
+            # "র" is too often part of the word itself to strip blindly
+            if suffix != "র" and len(stripped) >= (2 if len(suffix) > 1 else 3):
+                return stripped
+        return token
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def _skeleton(token):
+    """Consonant skeleton of a Latin token, so 'sylet' and 'sylhet' meet."""
+    if len(token) < 4 or not token.isascii():
+        return None
+    skeleton = token[0] + re.sub(r"[aeiouyh]", "", token[1:])
+    skeleton = re.sub(r"(.)\1+", r"\1", skeleton)
+    return f"~{skeleton}" if len(skeleton) >= 2 else None
+
+
+def tokenize(text):
+    """Split text into normalized tokens, dropping stopwords and bare numbers."""
+    tokens = []
+    for token in TOKEN_RE.findall(_normalize(text)):
+        if token.isdigit() or token in STOPWORDS:
+            continue
+        tokens.append(_stem(token))
+    return tokens
+
+
+def search_words(text):
+    """
+    Words of free text for the row index (see ``row_search``): like
+    ``tokenize`` but numbers are kept, and each known variant is followed by
+    its concept name, so "oshudh" and "pharmacy" both find "health".
+    """
+    words = []
+    for token in TOKEN_RE.findall(_normalize(text)):
+        if token in STOPWORDS:
+            continue
+        token = _stem(token)
+        words.append(token)
+        concept = VARIANT_TO_CONCEPT.get(token)
+        if concept and concept != token:
+            words.append(concept)
+    return words
+
+
+def weighted_terms(text, weight=1.0, terms=None):
+    """Add the terms of ``text`` to ``terms`` with literal, concept and skeleton weights."""
+    terms = {} if terms is None else terms
+    for token in tokenize(text):
+        terms[token] = terms.get(token, 0.0) + weight
+        concept = VARIANT_TO_CONCEPT.get(token)
+        if concept:
+            key = f"@{concept}"
+            terms[key] = terms.get(key, 0.0) + weight * CONCEPT_WEIGHT
+        skeleton = _skeleton(token)
+        if skeleton:
+            terms[skeleton] = terms.get(skeleton, 0.0) + weight * SKELETON_WEIGHT
+    return terms
+
+
+def table_terms(name, description="", headers=None):
+    """Weighted terms for one table."""
+    terms = weighted_terms(name, NAME_WEIGHT)
+    weighted_terms(description, DESCRIPTION_WEIGHT, terms)
+    for header in headers or []:
+        weighted_terms(header, HEADER_WEIGHT, terms)
+    return terms
+
+
+def query_terms(query):
+    return weighted_terms(query)
+
+
+def rank(query_weights, postings, doc_count):
+    """
+    Rank documents for a query.
+
+    ``postings`` maps term -> {doc_id: term weight}. Returns a list of
+    ``(doc_id, score, relevance)`` sorted by score, where relevance is the
+    score as a percentage of a perfect match.
+    """
+    if not query_weights or not doc_count:
+        return []
+
+    scores = {}
+    best_possible = 0.0
+    for term, query_weight in query_weights.items():
+        docs = postings.get(term) or {}
+        idf = math.log(1 + doc_count / max(len(docs), 1))
+        best_possible += query_weight * idf
+        for doc_id, weight in docs.items():
+            tf = weight / (weight + TF_SATURATION)
+            scores[doc_id] = scores.get(doc_id, 0.0) + query_weight * tf * idf
+
+    ranked = []
+    for doc_id, score in scores.items():
+        relevance = min(round(100 * score / best_possible), 95) if best_possible else 0
+        ranked.append((doc_id, score, relevance))
+    ranked.sort(key=lambda item: (-item[1], str(item[0])))
+    return ranked
+
+
+def rank_tables(tables, query):
+    """Rank already-loaded table dicts (``table_name``/``description``/``headers``)."""
+    postings = {}
+    for index, table in enumerate(tables):
+        if not isinstance(table, dict):
+            continue
+        doc_id = table.get("id", index)
+        terms = table_terms(
+            table.get("table_name") or table.get("name") or "",
+            table.get("description") or "",
+            table.get("headers") or (table.get("data") or {}).get("headers") or []
+        )
+        for term, weight in terms.items():
+            postings.setdefault(term, {})[doc_id] = weight
+    return rank(query_terms(query), postings, len(tables))
+
+
+# ============ PERSISTENT INDEX ============
+
+def index_table(table, headers=None):
+    """(Re)build the index entries of one table."""
+    if headers is None:
+        headers = JsonTable.objects.filter(table=table).values_list('headers', flat=True).first() or []
+    terms = table_terms(table.table_name, table.description or "", headers)
+    with transaction.atomic():
+        TableSearchTerm.objects.filter(table=table).delete()
+        TableSearchTerm.objects.bulk_create([
+            TableSearchTerm(table=table, term=term[:64], weight=weight)
+            for term, weight in terms.items()
+        ])
+
+
+def unindex_table(table_id):
+    """Remove a table's index entries, for deleted tables."""
+    TableSearchTerm.objects.filter(table_id=table_id).delete()
+
+
+def rebuild_index(user_id=None):
+    """Rebuild the index for all tables, or for one user's tables."""
+    tables = DynamicTableData.objects.filter(deleted_at__isnull=True).select_related('jsontable')
+    if user_id is not None:
+        tables = tables.filter(user_id=user_id)
+    count = 0
+    for table in tables.iterator():
+        json_table = getattr(table, 'jsontable', None)
+        index_table(table, json_table.headers if json_table else [])
+        count += 1
+    return count
+
+
+def _accessible_tables_q(user_id, include_shared, prefix=""):
+    if include_shared:
+        # Owned and shared tables alike have a TableAccess row, see access.py
+        return Q(**{f"{prefix}access__user_id": user_id})
+    return Q(**{f"{prefix}user_id": user_id, f"{prefix}deleted_at__isnull": True})
+
+
+def search_user_tables(user_id, query, limit=10, include_shared=False):
+    """
+    Search a user's tables. Returns ``[(table_id, score, relevance), ...]``.
+
+    Runs two queries: the number of accessible tables (for IDF) and the
+    postings of the query's terms.
+    """
+    weights = query_terms(query)
+    if not weights:
+        return []
+
+    doc_count = DynamicTableData.objects.filter(_accessible_tables_q(user_id, include_shared)).distinct().count()
+    if not doc_count:
+        return []
+
+    postings = _load_postings(user_id, weights, include_shared)
+    if not postings and not TableSearchTerm.objects.filter(table__user_id=user_id).exists():
+        # Tables created before the index existed: build it once and retry.
+        rebuild_index(user_id)
+        postings = _load_postings(user_id, weights, include_shared)
+
+    return rank(weights, postings, doc_count)[:limit]
+
+
+def _load_postings(user_id, weights, include_shared):
+    entries = (
+        TableSearchTerm.objects.filter(term__in=list(weights))
+        .filter(_accessible_tables_q(user_id, include_shared, prefix="table__"))
+        .values_list('term', 'table_id', 'weight')
+        .distinct()
+    )
+    postings = {}
+    for term, table_id, weight in entries:
+        postings.setdefault(term, {})[table_id] = weight
+    return postings
@@ -0,0 +1,211 @@
+"""
+ORM expressions over the cells of table rows.
+
+A column's value is read from ``typed_data`` when the column has a type
+(numbers and dates compare as numbers and dates, categories case-folded) and
+from ``data`` otherwise, always under the column's id (see ``schema``);
+rows that predate a column read its default. Filters compile to lookups on
+those expressions, so they run in SQL.
+
+A filter is ``{"column": ..., "op": ..., "value": ...}`` with ``op`` one of
+``FILTER_OPS``; ``in`` takes a list. Values are parsed like cell values, so
+"1.5k" or "gotokal" work against currency and date columns. Filters combine
+with ``{"and": [...]}``, ``{"or": [...]}`` and ``{"not": ...}``; a plain list
+means "and".
+
+An ordering is ``"Date desc, Amount"``, ``["-Date", "Amount"]`` or
+``[{"column": "Date", "desc": true}]``; empty cells sort last and the row id
+breaks ties. Column names are checked against the table's headers and values
+are passed as parameters, so a spec can never inject SQL.
+"""
+from django.db.models import DateField, F, FloatField, Q, TextField, Value
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import Cast, Coalesce
+
+from . import column_types as types
+from .schema import column_id, data_key
+
+
+NUMERIC_TYPES = (types.NUMBER, types.CURRENCY)
+FILTER_OPS = ("eq", "ne", "gt", "gte", "lt", "lte", "in", "contains", "empty", "not_empty")
+LOOKUPS = {"eq": "exact", "gt": "gt", "gte": "gte", "lt": "lt", "lte": "lte", "in": "in", "contains": "icontains"}
+MAX_CONDITIONS = 50
+MAX_ORDER_COLUMNS = 5
+
+
+def column_type(json_table, header):
+    return (json_table.column_types or {}).get(header, types.TEXT)
+
+
+def check_column(json_table, header):
+    if header not in json_table.headers:
+        raise ValueError(f"Column '{header}' does not exist.")
+    return header
+
+
+def key_text(key, field):
+    # Plain text lookups; key transforms would compare against JSON-encoded values
+    return Cast(KeyTextTransform(key, field), TextField())
+
+
+def raw_value(json_table, header):
+    """The cell as stored text, or the column's default for rows written before it was added."""
+    value = key_text(data_key(json_table, header), 'data')
+    default = (json_table.column_defaults or {}).get(column_id(json_table, header))
+    if default in (None, ""):
+        return value
+    # Until the table is compacted (see ``schema``)
+    return Coalesce(value, Value(str(default)), output_field=TextField())
+
+
+def typed_value(json_table, header):
+    """The cell as a float, a date, a case-folded category, or raw text for text columns."""
+    kind = column_type(json_table, header)
+    if kind == types.TEXT:
+        return raw_value(json_table, header)
+    value = key_text(column_id(json_table, header), 'typed_data')
+    if kind in NUMERIC_TYPES:
+        return Cast(value, FloatField())
+    if kind == types.DATE:
+        return Cast(value, DateField())
+    return value
+
+
+def parse_filter_value(json_table, header, value):
+    """Parse a filter value the way a cell of the column would be parsed."""
+    kind = column_type(json_table, header)
+    if kind == types.TEXT:
+        return "" if value is None else str(value)
+    if kind in NUMERIC_TYPES:
+        parsed = types.parse_number(value)
+    elif kind == types.DATE:
+        parsed = types.parse_date(value)
+    else:
+        parsed = types.normalize_value(kind, value)
+    if parsed is None:
+        raise ValueError(f"'{value}' is not a valid {kind} value for column '{header}'.")
+    return parsed
+
+
+def _comparison(json_table, spec, aliases):
+    if not isinstance(spec, dict) or spec.get('op') not in FILTER_OPS:
+        raise ValueError(f"Each filter needs 'column' and an 'op' from: {', '.join(FILTER_OPS)}.")
+    if len(aliases) >= MAX_CONDITIONS:
+        raise ValueError(f"At most {MAX_CONDITIONS} filters per query.")
+    header = check_column(json_table, spec.get('column'))
+    op = spec['op']
+    alias = f"filter_{len(aliases)}"
+
+    if op in ("empty", "not_empty"):
+        aliases[alias] = raw_value(json_table, header)
+        empty = Q(**{f"{alias}__isnull": True}) | Q(**{alias: ""})
+        return empty if op == "empty" else ~empty
+
+    if op == "contains":
+        # Substring search always looks at the text as typed
+        aliases[alias] = raw_value(json_table, header)
+        return Q(**{f"{alias}__icontains": str(spec.get('value', ''))})
+
+    aliases[alias] = typed_value(json_table, header)
+    if op == "in":
+        values = spec.get('value')
+        if not isinstance(values, list):
+            raise ValueError("'in' filters take a list of values.")
+        value = [parse_filter_value(json_table, header, item) for item in values]
+    else:
+        value = parse_filter_value(json_table, header, spec.get('value'))
+
+    if op == "ne":
+        return ~Q(**{alias: value})
+    return Q(**{f"{alias}__{LOOKUPS[op]}": value})
+
+
+def _condition(json_table, spec, aliases):
+    if isinstance(spec, list):
+        spec = {"and": spec}
+    if isinstance(spec, dict) and ("and" in spec or "or" in spec):
+        key = "and" if "and" in spec else "or"
+        items = spec[key]
+        if not isinstance(items, list) or not items:
+            raise ValueError(f"'{key}' takes a non-empty list of filters.")
+        parts = [_condition(json_table, item, aliases) for item in items]
+        condition = parts[0]
+        for part in parts[1:]:
+            condition = condition & part if key == "and" else condition | part
+        return condition
+    if isinstance(spec, dict) and "not" in spec:
+        return ~_condition(json_table, spec['not'], aliases)
+    return _comparison(json_table, spec, aliases)
+
+
+def apply_filters(queryset, json_table, filters):
+    """Return ``queryset`` narrowed by ``filters``, a filter, a list of filters or an and/or/not tree."""
+    if not filters:
+        return queryset
+    if not isinstance(filters, (list, dict)):
+        raise ValueError("'filters' must be a filter object or a list of filters.")
+    aliases = {}
+    condition = _condition(json_table, filters, aliases)
+    return queryset.alias(**aliases).filter(condition)
+
+
+def parse_order_by(order_by):
+    """Return ``[(header, descending)]`` for any of the accepted ordering forms."""
+    if not order_by:
+        return []
+    if isinstance(order_by, str):
+        order_by = [part.strip() for part in order_by.split(",") if part.strip()]
+    if not isinstance(order_by, list):
+        raise ValueError("'order_by' must be a string or a list.")
+    if len(order_by) > MAX_ORDER_COLUMNS:
+        raise ValueError(f"At most {MAX_ORDER_COLUMNS} columns in 'order_by'.")
+
+    ordering = []
+    for item in order_by:
+        if isinstance(item, dict):
+            ordering.append((item.get('column'), bool(item.get('desc'))))
+        elif isinstance(item, str):
+            words = item.rsplit(" ", 1)
+            if len(words) == 2 and words[1].lower() in ("asc", "desc"):
+                ordering.append((words[0].strip(), words[1].lower() == "desc"))
+            elif item.startswith("-"):
+                ordering.append((item[1:], True))
+            else:
+                ordering.append((item, False))
+        else:
+            raise ValueError("Each 'order_by' entry is a column name or {'column', 'desc'}.")
+    return ordering
+
+
+def apply_ordering(queryset, json_table, order_by):
+    """Return ``queryset`` sorted by ``order_by``, then in the rows' own order (see ``positions``)."""
+    aliases = {}
+    ordering = []
+    for index, (header, descending) in enumerate(parse_order_by(order_by)):
+        if header not in json_table.headers and isinstance(header, str) and f"-{header}" in json_table.headers:
+            # "-Balance" is a column named "-Balance", not Balance descending
+            header, descending = f"-{header}", False
+        check_column(json_table, header)
+        alias = f"order_{index}"
+        aliases[alias] = typed_value(json_table, header)
+        ordering.append(F(alias).desc(nulls_last=True) if descending else F(alias).asc(nulls_last=True))
+    return queryset.alias(**aliases).order_by(*ordering, 'position', 'id')
+
+
+def referenced_columns(filters=None, order_by=None):
+    """Headers a filter tree and an ordering refer to."""
+    headers = [header for header, _ in parse_order_by(order_by)]
+    pending = [filters]
+    while pending:
+        spec = pending.pop()
+        if isinstance(spec, list):
+            pending.extend(spec)
+        elif isinstance(spec, dict):
+            for key in ("and", "or"):
+                if isinstance(spec.get(key), list):
+                    pending.extend(spec[key])
+            if "not" in spec:
+                pending.append(spec['not'])
+            if "column" in spec:
+                headers.append(spec['column'])
+    return list(dict.fromkeys(header for header in headers if isinstance(header, str)))
@@ -1,3 +1,129 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from . import column_types as types
+from . import rollups, row_search, schema, services
+from .aggregation import run_aggregation
+from .models import JsonTable, JsonTableRow
+from .table_query import apply_filters
+
+
+class ColumnDefaultTests(TestCase):
+    """A column added with a default reads it everywhere, before and after compaction."""
+
+    def setUp(self):
+        self.user = User.objects.create(username="owner")
+        self.table, self.json_table = services.create_table(self.user, "Expenses", ["Date", "Amount"])
+        for day in ("2025-01-05", "2025-01-20", "2025-02-03"):
+            services.insert_row(self.json_table, {"Date": day, "Amount": "100"})
+
+    def reload(self):
+        return JsonTable.objects.get(pk=self.json_table.pk)
+
+    def filtered(self, json_table, filters):
+        return apply_filters(JsonTableRow.objects.filter(table_id=json_table.pk), json_table, filters).count()
+
+    def add_columns(self):
+        services.add_column(self.json_table, "Method", column_type=types.CATEGORY, default="Cash")
+        services.add_column(self.json_table, "Note", column_type=types.TEXT, default="hello")
+        services.add_column(self.json_table, "Fee", column_type=types.NUMBER, default="10")
+        return self.reload()
+
+    def assert_defaults_visible(self, json_table):
+        self.assertEqual(self.filtered(json_table, {"column": "Method", "op": "eq", "value": "cash"}), 3)
+        self.assertEqual(self.filtered(json_table, {"column": "Note", "op": "eq", "value": "hello"}), 3)
+        self.assertEqual(self.filtered(json_table, {"column": "Note", "op": "empty"}), 0)
+        self.assertEqual(self.filtered(json_table, {"column": "Fee", "op": "gte", "value": 10}), 3)
+
+        by_method, _ = run_aggregation(json_table, {"group_by": ["Method"]})
+        self.assertEqual(by_method, [{"Method": "cash", "count": 3}])
+        fees, _ = run_aggregation(json_table, {"aggregates": [{"fn": "sum", "column": "Fee"}]})
+        self.assertEqual(fees[0]["sum_Fee"], 30)
+        # The same questions with a filter are answered from the rows rather than the rollups
+        filtered, _ = run_aggregation(json_table, {
+            "group_by": ["Method"], "filters": [{"column": "Amount", "op": "gt", "value": 0}]
+        })
+        self.assertEqual(filtered, [{"Method": "cash", "count": 3}])
+        self.assertEqual(rollups.check_table(json_table), [])
+
+        found = row_search.search_rows([self.table.pk], "hello")
+        self.assertEqual(len(found), 3)
+
+    def test_defaults_visible_before_compaction(self):
+        json_table = self.add_columns()
+        self.assertTrue(json_table.needs_compaction)
+        self.assert_defaults_visible(json_table)
+
+    def test_defaults_visible_after_compaction(self):
+        self.add_columns()
+        schema.compact_table(self.json_table.pk)
+        json_table = self.reload()
+        self.assertEqual(json_table.column_defaults, {})
+        for row in JsonTableRow.objects.filter(table_id=json_table.pk):
+            self.assertEqual(row.data["Method"], "Cash")
+            self.assertEqual(row.typed_data["Method"], "cash")
+            self.assertEqual(row.typed_data["Fee"], 10)
+        self.assert_defaults_visible(json_table)
+
+    def test_compaction_fills_typed_values(self):
+        # Defaults recorded without typed values, as they were before add_column wrote them
+        json_table = self.reload()
+        schema.add_column(json_table, "Method", "Cash")
+        json_table.column_types = {**json_table.column_types, "Method": types.CATEGORY}
+        json_table.save()
+        self.assertEqual(self.filtered(json_table, {"column": "Method", "op": "eq", "value": "cash"}), 0)
+
+        schema.compact_table(json_table.pk)
+        self.assertEqual(self.filtered(self.reload(), {"column": "Method", "op": "eq", "value": "cash"}), 3)
+
+    def test_rows_with_their_own_value_keep_it(self):
+        json_table = self.add_columns()
+        row = JsonTableRow.objects.filter(table_id=json_table.pk).order_by("pk").first()
+        services.update_row(row, {**services.read_row(json_table, row), "Method": "Card", "Fee": ""})
+        json_table = self.reload()
+
+        self.assertEqual(self.filtered(json_table, {"column": "Method", "op": "eq", "value": "cash"}), 2)
+        self.assertEqual(self.filtered(json_table, {"column": "Fee", "op": "empty"}), 1)
+        self.assertEqual(rollups.check_table(json_table), [])
+        schema.compact_table(json_table.pk)
+        json_table = self.reload()
+        self.assertEqual(self.filtered(json_table, {"column": "Method", "op": "eq", "value": "card"}), 1)
+        self.assertEqual(self.filtered(json_table, {"column": "Fee", "op": "gte", "value": 10}), 2)
+
+    def test_empty_default_adds_no_typed_values(self):
+        services.add_column(self.json_table, "Method", column_type=types.CATEGORY)
+        json_table = self.reload()
+        self.assertEqual(self.filtered(json_table, {"column": "Method", "op": "empty"}), 3)
+        for row in JsonTableRow.objects.filter(table_id=json_table.pk):
+            self.assertNotIn("Method", row.typed_data)
+
+
+@override_settings(TABLE_ROW_FORMAT=JsonTable.ARRAY_ROWS)
+class ArrayColumnDefaultTests(ColumnDefaultTests):
+    """The same for tables that store rows as arrays."""
+
+    def test_defaults_visible_after_compaction(self):
+        self.add_columns()
+        schema.compact_table(self.json_table.pk)
+        json_table = self.reload()
+        read = schema.row_reader(json_table)
+        for row in JsonTableRow.objects.filter(table_id=json_table.pk):
+            self.assertEqual(read(row.data)["Method"], "Cash")
+            self.assertEqual(row.typed_data["Method"], "cash")
+        self.assert_defaults_visible(json_table)
+
+
+class RowOperationTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(username="owner")
+        _, self.json_table = services.create_table(user, "Expenses", ["Item", "Amount"])
+        self.row = services.insert_row(self.json_table, {"Item": "Tea", "Amount": "20"})
+
+    def test_update_rejects_unknown_columns(self):
+        results, applied = services.apply_row_operations(
+            self.json_table, [{"op": "update", "rowId": self.row.pk, "data": {"Bogus": "1"}}]
+        )
+        self.assertFalse(applied)
+        self.assertEqual(results[0]["error"], "Unknown columns: Bogus")
+        self.row.refresh_from_db()
+        self.assertNotIn("Bogus", services.read_row(self.json_table, self.row))
@@ -11,13 +11,36 @@ from .views import (
     GetTableContentView,
     DeleteTableView,
     EditHeaderView,
-    ShareTableView
+    ShareTableView,
+    TableSearchView,
+    RowSearchView,
+    ColumnTypeView,
+    ExportTableView,
+    ImportTableRowsView,
+    BatchRowOperationsView,
+    MoveRowView,
+    TableChangesView,
+    TableSnapshotsView,
+    TableHistoryView,
+    RestoreTableView,
+    AggregateTableView
 )
 
 urlpatterns = [
     # ============ TABLE MANAGEMENT URLS ONLY ============
     path('tables/', DynamicTableListView.as_view(), name='dynamic-table-list'),
     path('tables/<int:table_id>/', DeleteTableView.as_view(), name='delete-table'),
+    path('tables/<int:table_id>/export/<str:export_format>/', ExportTableView.as_view(), name='export-table'),
+    path('tables/<int:table_id>/import/', ImportTableRowsView.as_view(), name='import-table-rows'),
+    path('tables/<int:table_id>/rows/batch/', BatchRowOperationsView.as_view(), name='batch-row-operations'),
+    path('tables/<int:table_id>/rows/<int:row_id>/move/', MoveRowView.as_view(), name='move-row'),
+    path('tables/<int:table_id>/changes/', TableChangesView.as_view(), name='table-changes'),
+    path('tables/<int:table_id>/snapshots/', TableSnapshotsView.as_view(), name='table-snapshots'),
+    path('tables/<int:table_id>/history/', TableHistoryView.as_view(), name='table-history'),
+    path('tables/<int:table_id>/restore/', RestoreTableView.as_view(), name='restore-table'),
+    path('tables/<int:table_id>/aggregate/', AggregateTableView.as_view(), name='aggregate-table'),
+    path('tables/search/', TableSearchView.as_view(), name='table-search'),
+    path('tables/search/rows/', RowSearchView.as_view(), name='row-search'),
     path('tables/update/', DynamicTableUpdateView.as_view(), name='dynamic-table-update'),
     path('table-contents/', GetTableContentView.as_view(), name='get-table-content'),
     path('create-tableContent/', CreateTableWithHeadersView.as_view(), name='create-table-content'),
@@ -26,6 +49,7 @@ urlpatterns = [
     path('delete-row/', DeleteRowView.as_view(), name='delete-row'),
     path('add-column/', AddColumnView.as_view(), name='add-column'),
     path('delete-column/', DeleteColumnView.as_view(), name='delete-column'),
+    path('column-type/', ColumnTypeView.as_view(), name='column-type'),
     path('edit-header/', EditHeaderView.as_view(), name='edit-header'),
     path('share-table/', ShareTableView.as_view(), name='share-table'),
 ]
\ No newline at end of file
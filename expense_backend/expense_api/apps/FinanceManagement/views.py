@@ -1,18 +1,52 @@
-from django.shortcuts import get_object_or_404
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from django.contrib.auth.models import User
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.utils.http import content_disposition_header
 import time
+import re
+import base64
+import hashlib
+import json
 from django.db import models
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 
 from ..user_auth.authentication import IsAuthenticatedCustom, decode_refresh_token, generate_access_token, generate_refresh_token
 from ..user_auth.permission import JWTAuthentication
 
-from .models import DynamicTableData, JsonTable, JsonTableRow
+from .models import DynamicTableData, JsonTable, JsonTableRow, TableSnapshot
 from .serializers import DynamicTableSerializer
+from .column_types import COLUMN_TYPES
+from . import access, catalog, changelog, column_indexes, row_search, schema, services, snapshots, table_index, table_query
+from .aggregation import aggregate_table
+from .export import EXPORT_FORMATS, export_table, aiter_sync
+from .importer import IMPORT_FORMATS, ImportFormatError, detect_format, import_rows, iter_records
+
+def _etag(*parts):
+    """Strong ETag from the versions (and request parameters) a response depends on."""
+    return '"%s"' % hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()[:32]
+
+
+def _with_etag(response, etag):
+    response['ETag'] = etag
+    # Let clients keep the payload but always revalidate it
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _json_table_for(user_id, table_id):
+    """The table's JsonTable (with its DynamicTableData) if the user may use it, else None."""
+    if not access.can_use(user_id, table_id):
+        return None
+    return JsonTable.objects.select_related('table').filter(pk=table_id).first()
+
 
 class DynamicTableListView(APIView):
     authentication_classes = [JWTAuthentication]
@@ -25,31 +59,119 @@ class DynamicTableListView(APIView):
                 return Response({'message': "Refresh token not provided."}, status=status.HTTP_401_UNAUTHORIZED)
             
             user_id = decode_refresh_token(refresh_token)
-            current_user = User.objects.get(id=user_id)
-            
-            # Get tables owned by the user
-            owned_tables = DynamicTableData.objects.filter(user=current_user).distinct()
-            
-            # Get tables shared with the user
-            shared_tables = DynamicTableData.objects.filter(shared_with=current_user).distinct()
+
+            # The catalog version changes with any table the user can see
+            version = services.catalog_version(user_id)
+            etag = _etag("catalog", user_id, version)
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                return _with_etag(not_modified, etag)
+
+            return _with_etag(Response({
+                "message": "Dynamic tables fetched successfully.",
+                "data": catalog.list_tables(user_id, version)
+            }, status=status.HTTP_200_OK), etag)
             
-            # Combine both querysets
-            all_tables = owned_tables.union(shared_tables)
+        except Exception as e:
+            return Response({
+                "error": str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
             
-            # Serialize the tables
-            serializer = DynamicTableSerializer(all_tables, many=True)
             
+class TableSearchView(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticatedCustom]
+
+    def get(self, request):
+        try:
+            refresh_token = request.COOKIES.get('refresh_token')
+            if not refresh_token:
+                return Response({'message': "Refresh token not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+
+            user_id = decode_refresh_token(refresh_token)
+            query = request.query_params.get('q', '').strip()
+            if not query:
+                return Response({"error": "Query parameter 'q' is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+            try:
+                limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+            except ValueError:
+                return Response({"error": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+            ranked = table_index.search_user_tables(user_id, query, limit=limit, include_shared=True)
+            tables = DynamicTableData.objects.in_bulk([table_id for table_id, _, _ in ranked])
+            results = [
+                {**DynamicTableSerializer(tables[table_id]).data, "relevance": relevance}
+                for table_id, _, relevance in ranked
+                if table_id in tables
+            ]
+
             return Response({
-                "message": "Dynamic tables fetched successfully.",
-                "data": serializer.data
+                "message": "Tables searched successfully.",
+                "data": results
             }, status=status.HTTP_200_OK)
-            
+
         except Exception as e:
             return Response({
                 "error": str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            
-            
+
+
+class RowSearchView(APIView):
+    """
+    Full-text search over the rows of the user's tables (see ``row_search``),
+    or of one table with ``?table_id=``.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticatedCustom]
+
+    def get(self, request):
+        try:
+            refresh_token = request.COOKIES.get('refresh_token')
+            if not refresh_token:
+                return Response({'message': "Refresh token not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+
+            user_id = decode_refresh_token(refresh_token)
+            query = request.query_params.get('q', '').strip()
+            if not query:
+                return Response({"error": "Query parameter 'q' is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+            try:
+                limit = min(max(int(request.query_params.get('limit', 20)), 1), row_search.MAX_RESULTS)
+                table_id = request.query_params.get('table_id')
+                table_id = int(table_id) if table_id is not None else None
+            except ValueError:
+                return Response({"error": "limit and table_id must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+
+            table_ids = access.table_ids(user_id)
+            if table_id is not None:
+                if table_id not in table_ids:
+                    return Response({"error": "Table not found."}, status=status.HTTP_404_NOT_FOUND)
+                table_ids = [table_id]
+
+            ranked = row_search.search_rows(table_ids, query, limit=limit)
+            results = [
+                {
+                    "table_id": row.table_id,
+                    "table_name": row.table.table.table_name,
+                    "row_id": row.pk,
+                    "row": services.read_row(row.table, row),
+                    "score": round(score, 4),
+                }
+                for row, score in row_search.load_rows(ranked)
+            ]
+
+            return Response({
+                "message": "Rows searched successfully.",
+                "data": results
+            }, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            return Response({
+                "error": str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 class DynamicTableUpdateView(APIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticatedCustom] 
@@ -61,35 +183,28 @@ class DynamicTableUpdateView(APIView):
                 return Response({'message': "Refresh token not provided."}, status=status.HTTP_401_UNAUTHORIZED)
             
             user_id = decode_refresh_token(refresh_token)
-            user = User.objects.get(id=user_id)
-
-            if not user.is_authenticated:
-                return Response({
-                    "message": "Authentication credentials were not provided or are invalid."
-                }, status=status.HTTP_401_UNAUTHORIZED)
-                
             data = request.data
             updated = False
 
-            try:
-                table = DynamicTableData.objects.get(id=data['id'], user=user)
-            except DynamicTableData.DoesNotExist:
+            table = DynamicTableData.objects.filter(id=data.get('id')).first() if access.is_owner(user_id, data.get('id')) else None
+            if table is None:
                 return Response({
                     "message": "Table not found for the current user."
                 }, status=status.HTTP_404_NOT_FOUND)
 
+            fields = {}
             if 'table_name' in data:
-                table.table_name = data['table_name']
+                fields['table_name'] = data['table_name']
                 updated = True
             if 'description' in data:
-                table.description = data['description']
+                fields['description'] = data['description']
                 updated = True
             if 'pendingCount' in data:
-                table.pendingCount = data['pendingCount']
+                fields['pending_count'] = data['pendingCount']
                 updated = True
 
             if updated:
-                table.save()
+                services.update_table(table, **fields)
                 serializer = DynamicTableSerializer(table)
                 return Response({
                     "message": "Table updated successfully.",
@@ -107,10 +222,47 @@ class DynamicTableUpdateView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
             
             
+def _encode_cursor(row_id=None, position=None, offset=None):
+    """
+    Opaque continuation token: the position and id of the last row returned
+    (keyset pagination), or for rows in a custom order the offset of the
+    next page.
+    """
+    payload = {"after": row_id, "position": position} if offset is None else {"offset": offset}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(token):
+    padded = token + "=" * (-len(token) % 4)
+    payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    if "offset" in payload:
+        return {"offset": max(int(payload["offset"]), 0)}
+    return {"after": int(payload["after"]), "position": str(payload.get("position") or "")}
+
+
 class GetTableContentView(APIView):
+    """
+    Headers and rows of the tables the user owns or has access to.
+
+    Optional query parameters:
+    - ``table_ids``: comma separated ids to load only some tables
+    - ``page_size``: rows per table (max ``MAX_PAGE_SIZE``); each table then
+      carries ``next_cursor`` (null on the last page)
+    - ``cursor``: ``<table_id>:<next_cursor>``, repeatable, to continue a table
+    - ``filter``: a JSON filter tree and ``order_by``: a column list such as
+      ``Date desc,Amount`` (see ``table_query``), applied in SQL; they need
+      exactly one table in ``table_ids``
+
+    Rows are in their manual order (see ``positions``) unless ``order_by`` is
+    given. Tables and rows are loaded in a fixed number of queries regardless
+    of how many tables are requested; with ``page_size`` the per-table limit
+    is applied in SQL with a window function.
+    """
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticatedCustom]
 
+    MAX_PAGE_SIZE = 500
+
     def get(self, request): 
         try:
             refresh_token = request.COOKIES.get('refresh_token')
@@ -118,35 +270,133 @@ class GetTableContentView(APIView):
                 return Response({'message': "Refresh token not provided."}, status=status.HTTP_401_UNAUTHORIZED)
             
             user_id = decode_refresh_token(refresh_token)
-            user = User.objects.get(id=user_id)
-            
+
+            try:
+                table_ids = [int(value) for value in request.query_params.get('table_ids', '').split(',') if value.strip()]
+                page_size = request.query_params.get('page_size')
+                page_size = min(max(int(page_size), 1), self.MAX_PAGE_SIZE) if page_size else None
+                cursors = {}
+                for value in request.query_params.getlist('cursor'):
+                    table_id, token = value.split(':', 1)
+                    cursors[int(table_id)] = _decode_cursor(token)
+                row_filter = request.query_params.get('filter')
+                row_filter = json.loads(row_filter) if row_filter else None
+                order_by = request.query_params.get('order_by')
+                if order_by and order_by.lstrip().startswith('['):
+                    order_by = json.loads(order_by)
+            except (ValueError, KeyError, TypeError):
+                return JsonResponse(
+                    {"error": "Invalid table_ids, page_size, cursor, filter or order_by."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            querying = bool(row_filter or order_by)
+            if querying and len(table_ids) != 1:
+                return JsonResponse(
+                    {"error": "filter and order_by need exactly one table in table_ids."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
             # Get tables that user owns or has access to
-            accessible_tables = DynamicTableData.objects.filter(
-                models.Q(user=user) | models.Q(shared_with=user)
+            accessible_ids = access.table_ids(user_id)
+            if table_ids:
+                accessible_ids = sorted(set(accessible_ids) & set(table_ids))
+
+            # Versions only: unchanged tables are answered without reading rows
+            versions = sorted(
+                DynamicTableData.objects.filter(pk__in=accessible_ids).values_list('id', 'version', 'change_seq')
             )
-            
-            result = []
+            etag = _etag(
+                "content", user_id, versions, table_ids, page_size, sorted(cursors.items()), row_filter, order_by
+            )
+            # Read before the rows: a client syncing from here may replay a change, never miss one
+            change_seqs = {table_id: change_seq for table_id, _, change_seq in versions}
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                return _with_etag(not_modified, etag)
+
+            # Query 1: headers of every accessible table
+            tables = list(
+                JsonTable.objects.filter(table_id__in=accessible_ids)
+                .order_by('table_id')
+                .only(
+                    'table_id', 'headers', 'column_types', 'column_ids', 'column_defaults', 'retired_columns',
+                    'row_format', 'row_layouts'
+                )
+            )
+            if not tables:
+                return _with_etag(JsonResponse([], safe=False, status=status.HTTP_200_OK), etag)
 
-            for table_data in accessible_tables:
-                try:
-                    table = JsonTable.objects.get(table=table_data)
-                    table_dict = {
-                        "id": table.table.id,  # Refers to DynamicTableData's ID
-                        "data": {
-                            "headers": table.headers,  # JSONField is already a list
-                            "rows": [
-                                {
-                                    "id": row.id,  # Include the row's ID
-                                    **row.data  # Include all the row data
-                                } for row in table.rows.all()  # Access rows via related_name
-                            ]
-                        }
-                    }
-                    result.append(table_dict)
-                except JsonTable.DoesNotExist:
-                    continue
+            # Query 2: the rows of all of them
+            rows = JsonTableRow.objects.filter(table_id__in=[table.table_id for table in tables])
+            offset = 0
+            try:
+                if querying:
+                    rows = table_query.apply_filters(rows, tables[0], row_filter)
+                    column_indexes.record_use(tables[0], table_query.referenced_columns(row_filter, order_by))
+                if order_by:
+                    rows = table_query.apply_ordering(rows, tables[0], order_by)
+            except ValueError as e:
+                return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            if order_by:
+                offset = cursors.get(tables[0].table_id, {}).get('offset', 0)
+                rows = rows[offset:offset + page_size + 1] if page_size else rows[offset:]
+            else:
+                if cursors:
+                    after_cursor = models.Q()
+                    for table in tables:
+                        cursor = cursors.get(table.table_id, {})
+                        after = cursor.get('after')
+                        after_cursor |= (
+                            models.Q(table_id=table.table_id, position__gt=cursor['position'])
+                            | models.Q(table_id=table.table_id, position=cursor['position'], id__gt=after)
+                        ) if after is not None else models.Q(table_id=table.table_id)
+                    rows = rows.filter(after_cursor)
+                if page_size:
+                    # One extra row per table tells whether there is a next page
+                    rows = rows.annotate(
+                        rank=Window(
+                            RowNumber(), partition_by=[F('table_id')], order_by=[F('position').asc(), F('id').asc()]
+                        )
+                    ).filter(rank__lte=page_size + 1)
+                rows = rows.order_by('table_id', 'position', 'id')
+            readers = {table.table_id: schema.row_reader(table) for table in tables}
+            rows_by_table = {}
+            last_positions = {}
+            for row in rows.values('id', 'table_id', 'position', 'data').iterator(chunk_size=2000):
+                table_rows = rows_by_table.setdefault(row['table_id'], [])
+                table_rows.append({
+                    "id": row['id'],  # Include the row's ID
+                    **readers[row['table_id']](row['data'])  # Include all the row data
+                })
+                if len(table_rows) == page_size:
+                    last_positions[row['table_id']] = row['position']
 
-            return JsonResponse(result, safe=False, status=status.HTTP_200_OK)
+            result = []
+            for table in tables:
+                table_rows = rows_by_table.get(table.table_id, [])
+                table_dict = {
+                    "id": table.table_id,  # Refers to DynamicTableData's ID
+                    "change_seq": change_seqs.get(table.table_id, 0),  # Start point for tables/<id>/changes/
+                    "data": {
+                        "headers": table.headers,  # JSONField is already a list
+                        "column_types": table.column_types,
+                        "rows": table_rows[:page_size] if page_size else table_rows
+                    }
+                }
+                if page_size:
+                    has_more = len(table_rows) > page_size
+                    if not has_more:
+                        table_dict["next_cursor"] = None
+                    elif order_by:
+                        table_dict["next_cursor"] = _encode_cursor(offset=offset + page_size)
+                    else:
+                        table_dict["next_cursor"] = _encode_cursor(
+                            table_rows[page_size - 1]["id"], last_positions[table.table_id]
+                        )
+                result.append(table_dict)
+
+            return _with_etag(JsonResponse(result, safe=False, status=status.HTTP_200_OK), etag)
 
         except Exception as e:
             return JsonResponse(
@@ -154,9 +404,383 @@ class GetTableContentView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
             
+class AggregateTableView(APIView):
+    """
+    Grouped totals, averages, minimums, maximums and counts over a table's
+    rows, computed in the database (see ``aggregation`` for the spec).
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticatedCustom]
+
+    def post(self, request, table_id):
+        try:
+            refresh_token = request.COOKIES.get('refresh_token')
+            if not refresh_token:
+                return Response({'message': "Refresh token not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+
+            user_id = decode_refresh_token(refresh_token)
+
+            if not isinstance(request.data, dict):
+                return Response({"error": "The body must be an aggregation spec object."}, status=status.HTTP_400_BAD_REQUEST)
+
+            json_table = _json_table_for(user_id, table_id)
+            if json_table is None:
+                return Response({"error": "Table not found."}, status=status.HTTP_404_NOT_FOUND)
+
+            spec = {key: request.data.get(key) for key in ('group_by', 'aggregates', 'filters')}
+            try:
+                result = aggregate_table(json_table, spec, json_table.table.version)
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            return Response({
+                "message": "Aggregation computed successfully.",
+                "data": result
+            }, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            return Response({
+                "error": str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class TableChangesView(APIView):
+    """
+    Changes to a table after ``?since=<seq>`` (see ``changelog``), at most
+    ``?limit=`` per page. ``resync: true`` means reload the table instead.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticatedCustom]
+
+    def get(self, request, table_id):
+        try:
+            refresh_token = request.COOKIES.get('refresh_token')
+            if not refresh_token:
+                return Response({'message': "Refresh token not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+
+            user_id = decode_refresh_token(refresh_token)
+
+            try:
+                since = int(request.query_params['since'])
+                limit = int(request.query_params.get('limit', changelog.MAX_CHANGES_PER_PAGE))
+            except (KeyError, ValueError):
+                return Response({"error": "'since' (and 'limit') must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+
+            table = None
+            if access.can_use(user_id, table_id):
+                table = DynamicTableData.objects.filter(pk=table_id).only('id', 'change_seq', 'change_floor').first()
+            if table is None:
+                return Response({"error": "Table not found."}, status=status.HTTP_404_NOT_FOUND)
+
+            return Response(changelog.changes_since(table, since, limit), status=status.HTTP_200_OK)
+
+        except Exception as e:
+            return Response({
+                "error": str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _history_seq(table, params):
+    """
+    The change seq a request points at: a ``snapshot`` id, a ``seq`` or an
+    ISO date and time ``at``. Raises ValueError.
+    """
+    if params.get('snapshot') is not None:
+        snapshot = TableSnapshot.objects.filter(table_id=table.pk, pk=int(params['snapshot'])).first()
+        if snapshot is None:
+            raise ValueError("Snapshot not found.")
+        return snapshot.seq
+    if params.get('seq') is not None:
+        return int(params['seq'])
+    if params.get('at'):
+        when = parse_datetime(str(params['at']))
+        if when is None:
+            raise ValueError("'at' must be an ISO date and time.")
+        if timezone.is_naive(when):
+            when = timezone.make_aware(when)
+        return snapshots.seq_at(table, when)
+    raise ValueError("Give a 'snapshot', 'seq' or 'at'.")
+
+
+def _snapshot_dict(snapshot):
+    return {
+        "id": snapshot.pk,
+        "label": snapshot.label,
+        "seq": snapshot.seq,
+        "created_at": snapshot.created_at,
+        "created_by": snapshot.created_by.username if snapshot.created_by else None,
+    }
+
+
+class TableSnapshotsView(APIView):
+    """
+    A table's snapshots (GET), newest first, and taking one (POST, body
+    ``{"label": ...}``). Taking a snapshot copies no rows (see ``snapshots``).
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticatedCustom]
+
+    def get(self, request, table_id):
+        try:
+            refresh_token = request.COOKIES.get('refresh_token')
+            if not refresh_token:
+                return Response({'message': "Refresh token not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+
+            user_id = decode_refresh_token(refresh_token)
+
+            if not access.can_use(user_id, table_id):
+                return Response({"error": "Table not found."}, status=status.HTTP_404_NOT_FOUND)
+
+            table_snapshots = TableSnapshot.objects.filter(table_id=table_id).select_related('created_by').order_by('-seq', '-pk')
+            return Response({
+                "message": "Snapshots fetched successfully.",
+                "data": [_snapshot_dict(snapshot) for snapshot in table_snapshots]
+            }, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            return Response({
+                "error": str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def post(self, request, table_id):
+        try:
+            refresh_token = request.COOKIES.get('refresh_token')
+            if not refresh_token:
+                return Response({'message': "Refresh token not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+
+            user_id = decode_refresh_token(refresh_token)
+
+            label = request.data.get("label") or ""
+            if not isinstance(label, str) or len(label) > 255:
+                return Response({"error": "'label' must be text of at most 255 characters."}, status=status.HTTP_400_BAD_REQUEST)
+
+            table = DynamicTableData.objects.filter(pk=table_id).first() if access.can_use(user_id, table_id) else None
+            if table is None:
+                return Response({"error": "Table not found."}, status=status.HTTP_404_NOT_FOUND)
+
+            snapshot = snapshots.create_snapshot(table, label, User.objects.filter(pk=user_id).first())
+            return Response({
+                "message": "Snapshot created successfully.",
+                "data": _snapshot_dict(snapshot)
+            }, status=status.HTTP_201_CREATED)
+
+        except Exception as e:
+            return Response({
+                "error": str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class TableHistoryView(APIView):
+    """
+    A table as it was at ``?snapshot=<id>``, ``?seq=<change seq>`` or
+    ``?at=<ISO date and time>``, rebuilt from a checkpoint and the change
+    log; nothing is written.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticatedCustom]
+
+    def get(self, request, table_id):
+        try:
+            refresh_token = request.COOKIES.get('refresh_token')
+            if not refresh_token:
+                return Response({'message': "Refresh token not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+
+            user_id = decode_refresh_token(refresh_token)
+
+            table = DynamicTableData.objects.filter(pk=table_id).first() if access.can_use(user_id, table_id) else None
+            if table is None:
+                return Response({"error": "Table not found."}, status=status.HTTP_404_NOT_FOUND)
+
+            try:
+                state = snapshots.table_at(table, _history_seq(table, request.query_params))
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            return Response({
+                "message": "Table history fetched successfully.",
+                "data": {
+                    "id": table.pk,
+                    "seq": state["seq"],
+                    "headers": state["headers"],
+                    "column_types": state["column_types"],
+                    "rows": [{"id": row_id, **values} for row_id, values in state["rows"]]
+                }
+            }, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            return Response({
+                "error": str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class RestoreTableView(APIView):
+    """
+    Restore a table to a ``snapshot`` id, a change ``seq`` or an ISO date and
+    time ``at`` (body). The table as it was is snapshotted first, so a
+    restore can itself be undone.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticatedCustom]
+
+    def post(self, request, table_id):
+        try:
+            refresh_token = request.COOKIES.get('refresh_token')
+            if not refresh_token:
+                return Response({'message': "Refresh token not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+
+            user_id = decode_refresh_token(refresh_token)
+
+            json_table = _json_table_for(user_id, table_id)
+            if json_table is None:
+                return Response({"error": "Table not found."}, status=status.HTTP_404_NOT_FOUND)
+
+            try:
+                seq = _history_seq(json_table.table, request.data)
+                result = services.restore_table(json_table, seq, User.objects.filter(pk=user_id).first())
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            return Response({
+                "message": f"Table restored to change #{seq}.",
+                "data": result
+            }, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            return Response({
+                "error": str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class ExportTableView(APIView):
+    """Stream a table's rows as CSV or NDJSON; ``?gzip=1`` returns a gzip file."""
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticatedCustom]
+
+    def get(self, request, table_id, export_format):
+        try:
+            refresh_token = request.COOKIES.get('refresh_token')
+            if not refresh_token:
+                return Response({'message': "Refresh token not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+
+            user_id = decode_refresh_token(refresh_token)
+
+            if export_format not in EXPORT_FORMATS:
+                return Response({
+                    "error": f"Unsupported format '{export_format}'. Use one of: {', '.join(EXPORT_FORMATS)}."
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            json_table = _json_table_for(user_id, table_id)
+            if json_table is None:
+                return Response({"error": "Table not found."}, status=status.HTTP_404_NOT_FOUND)
+
+            compress = request.query_params.get('gzip') in ('1', 'true', 'yes')
+            content_type, extension = EXPORT_FORMATS[export_format]
+            # Keep Bangla names intact, only drop characters that are unsafe in file names
+            name = re.sub(r'[\\/:*?"<>|\s]+', '-', json_table.table.table_name).strip('-.') or f"table-{table_id}"
+            filename = f"{name}.{extension}"
+            if compress:
+                content_type, filename = "application/gzip", f"{filename}.gz"
+
+            chunks = export_table(json_table, export_format, compress)
+            # Under ASGI a sync iterator would be read completely before sending
+            if isinstance(request._request, ASGIRequest):
+                chunks = aiter_sync(chunks)
+
+            response = StreamingHttpResponse(chunks, content_type=content_type)
+            response['Content-Disposition'] = content_disposition_header(True, filename)
+            response['X-Accel-Buffering'] = 'no'
+            return response
+
+        except Exception as e:
+            return Response({
+                "error": str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class ImportTableRowsView(APIView):
+    """
+    Append rows from an uploaded CSV, JSON array or NDJSON file.
+
+    Multipart fields: ``file``, and optionally ``format`` (detected from the
+    file name otherwise), ``createColumns``, ``dryRun`` and ``batchSize``.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticatedCustom]
+
+    def post(self, request, table_id):
+        try:
+            refresh_token = request.COOKIES.get('refresh_token')
+            if not refresh_token:
+                return Response({'message': "Refresh token not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+
+            user_id = decode_refresh_token(refresh_token)
+
+            upload = request.FILES.get('file')
+            if upload is None:
+                return Response({"error": "A 'file' upload is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+            import_format = request.data.get('format') or detect_format(upload.name, upload.content_type)
+            if import_format not in IMPORT_FORMATS:
+                return Response({
+                    "error": f"Unsupported format '{import_format}'. Use one of: {', '.join(IMPORT_FORMATS)}."
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            try:
+                batch_size = min(max(int(request.data.get('batchSize') or 1000), 1), 5000)
+            except (TypeError, ValueError):
+                return Response({"error": "'batchSize' must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+            json_table = _json_table_for(user_id, table_id)
+            if json_table is None:
+                return Response({"error": "Table not found."}, status=status.HTTP_404_NOT_FOUND)
+
+            def flag(name):
+                return str(request.data.get(name, '')).lower() in ('1', 'true', 'yes')
+
+            try:
+                report = import_rows(
+                    json_table,
+                    iter_records(upload.file, import_format),
+                    create_columns=flag('createColumns'),
+                    batch_size=batch_size,
+                    dry_run=flag('dryRun')
+                )
+            except (ImportFormatError, UnicodeDecodeError) as e:
+                return Response({"error": f"Could not read the file: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+
+            return Response({
+                "message": "Dry run finished, nothing was saved." if report["dry_run"] else "Rows imported successfully.",
+                "data": report
+            }, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            return Response({
+                "error": str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _row_anchor(data):
+    """``(after, before)`` row ids from a request body; at most one of them, ints. Raises ValueError."""
+    after, before = data.get("after"), data.get("before")
+    if after is not None and before is not None:
+        raise ValueError("Give either 'after' or 'before', not both.")
+    for value in (after, before):
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool)):
+            raise ValueError("'after' and 'before' must be row ids.")
+    return after, before
+
+
 class AddRowView(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticatedCustom]
+
     def post(self, request):
         try:
+            refresh_token = request.COOKIES.get('refresh_token')
+            if not refresh_token:
+                return Response({'message': "Refresh token not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+
+            user_id = decode_refresh_token(refresh_token)
             table_id = request.data.get("tableId")
             new_row = request.data.get("row")
 
@@ -165,8 +789,14 @@ class AddRowView(APIView):
                     "error": "Invalid input. 'tableId' must be provided and 'row' must be a dictionary."
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-            # Get the JsonTable instance (raises 404 if not found)
-            json_table = get_object_or_404(JsonTable, table_id=table_id)
+            try:
+                after, before = _row_anchor(request.data)
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            json_table = _json_table_for(user_id, table_id)
+            if json_table is None:
+                return Response({"error": "Table not found."}, status=status.HTTP_404_NOT_FOUND)
 
             # Optional: Validate if row keys match table headers
             if not all(key in json_table.headers for key in new_row.keys()):
@@ -175,8 +805,11 @@ class AddRowView(APIView):
                     "expected_headers": json_table.headers
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-            # Save the new row
-            row = JsonTableRow.objects.create(table=json_table, data=new_row)
+            # Save the new row, at the end unless 'after' or 'before' names a row
+            try:
+                row = services.insert_row(json_table, new_row, after, before)
+            except JsonTableRow.DoesNotExist:
+                return Response({"error": "Row to insert next to not found in table."}, status=status.HTTP_404_NOT_FOUND)
             # print(**new_row);
             # Include the row's ID in the response data
             response_data = {
@@ -217,24 +850,32 @@ class CreateTableWithHeadersView(APIView):
             table_name = request.data.get("table_name")
             headers = request.data.get("headers", [])
             description = request.data.get("description", "")
+            column_types = request.data.get("columnTypes") or {}
 
             if not table_name or not headers:
                 return Response({
                     "error": "Table name and headers are required."
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-            # Create the DynamicTableData instance
-            table_data = DynamicTableData.objects.create(
-                table_name=table_name,
-                user=user,
-                description=description
-            )
+            if not isinstance(column_types, dict):
+                return Response({
+                    "error": "'columnTypes' must be an object mapping headers to column types."
+                }, status=status.HTTP_400_BAD_REQUEST)
 
-            # Create the JsonTable instance
-            json_table = JsonTable.objects.create(
-                table=table_data,
-                headers=headers
-            )
+            unknown = [header for header in column_types if header not in headers]
+            if unknown:
+                return Response({
+                    "error": f"Column types given for unknown columns: {', '.join(map(str, unknown))}."
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            invalid_types = [value for value in column_types.values() if value not in COLUMN_TYPES]
+            if invalid_types:
+                return Response({
+                    "error": f"Invalid column types: {', '.join(map(str, invalid_types))}. Use one of: {', '.join(COLUMN_TYPES)}."
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            # Create the DynamicTableData and JsonTable instances
+            table_data, json_table = services.create_table(user, table_name, headers, description, column_types)
 
             # Return success response
             return Response({
@@ -243,6 +884,7 @@ class CreateTableWithHeadersView(APIView):
                     "id": table_data.id,
                     "table_name": table_data.table_name,
                     "headers": json_table.headers,
+                    "column_types": json_table.column_types,
                     "created_at": table_data.created_at,
                     "description": table_data.description
                 }
@@ -259,16 +901,35 @@ class AddColumnView(APIView):
     permission_classes = [IsAuthenticatedCustom]
     def post(self, request):
         try:
+            refresh_token = request.COOKIES.get('refresh_token')
+            if not refresh_token:
+                return Response({'message': "Refresh token not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+
+            user_id = decode_refresh_token(refresh_token)
+
             table_id = request.data.get("tableId")
             new_header = request.data.get("header")
+            column_type = request.data.get("type")
+            default = request.data.get("default", "")
 
             if not table_id or not new_header:
                 return Response({
                     "error": "'tableId' and 'header' are required."
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-            # Fetch JsonTable
-            json_table = get_object_or_404(JsonTable, pk=table_id)
+            if column_type and column_type not in COLUMN_TYPES:
+                return Response({
+                    "error": f"Invalid column type. Use one of: {', '.join(COLUMN_TYPES)}."
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            if isinstance(default, (dict, list)):
+                return Response({
+                    "error": "'default' must be a single value."
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            json_table = _json_table_for(user_id, table_id)
+            if json_table is None:
+                return Response({"error": "Table not found."}, status=status.HTTP_404_NOT_FOUND)
 
             # Check if header already exists
             if new_header in json_table.headers:
@@ -276,18 +937,59 @@ class AddColumnView(APIView):
                     "error": f"Header '{new_header}' already exists."
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-            # Add the new header
-            json_table.headers.append(new_header)
-            json_table.save()
-
-            # Add empty values for existing rows
-            for row in json_table.rows.all():
-                row.data[new_header] = ""
-                row.save()
+            # Existing rows read the default (empty unless given) for the new header
+            services.add_column(json_table, new_header, column_type, default)
 
             return Response({
                 "message": "Column added successfully.",
-                "headers": json_table.headers
+                "headers": json_table.headers,
+                "column_types": json_table.column_types
+            }, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            return Response({
+                "error": str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class ColumnTypeView(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticatedCustom]
+
+    def post(self, request):
+        """Set the type of one column, or re-infer all types from the rows with {"infer": true}."""
+        try:
+            refresh_token = request.COOKIES.get('refresh_token')
+            if not refresh_token:
+                return Response({'message': "Refresh token not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+
+            user_id = decode_refresh_token(refresh_token)
+
+            table_id = request.data.get("tableId")
+            header = request.data.get("header")
+            column_type = request.data.get("type")
+            infer = bool(request.data.get("infer"))
+
+            if not table_id or not (infer or (header and column_type)):
+                return Response({
+                    "error": "'tableId' and either 'header' and 'type' or 'infer' are required."
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            json_table = _json_table_for(user_id, table_id)
+            if json_table is None:
+                return Response({"error": "Table not found."}, status=status.HTTP_404_NOT_FOUND)
+
+            if infer:
+                column_types = services.refresh_column_types(json_table)
+            else:
+                try:
+                    column_types = services.set_column_type(json_table, header, column_type)
+                except ValueError as e:
+                    return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            return Response({
+                "message": "Column types updated successfully.",
+                "column_types": column_types
             }, status=status.HTTP_200_OK)
 
         except Exception as e:
@@ -301,6 +1003,12 @@ class DeleteColumnView(APIView):
     permission_classes = [IsAuthenticatedCustom]
     def post(self, request):
         try:
+            refresh_token = request.COOKIES.get('refresh_token')
+            if not refresh_token:
+                return Response({'message': "Refresh token not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+
+            user_id = decode_refresh_token(refresh_token)
+
             table_id = request.data.get("tableId")
             header_to_delete = request.data.get("header")
 
@@ -309,8 +1017,9 @@ class DeleteColumnView(APIView):
                     "error": "'tableId' and 'header' (string) are required."
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-            # Fetch JsonTable
-            json_table = get_object_or_404(JsonTable, pk=table_id)
+            json_table = _json_table_for(user_id, table_id)
+            if json_table is None:
+                return Response({"error": "Table not found."}, status=status.HTTP_404_NOT_FOUND)
 
             # Check if header exists
             if header_to_delete not in json_table.headers:
@@ -318,15 +1027,8 @@ class DeleteColumnView(APIView):
                     "error": f"Header '{header_to_delete}' does not exist in the table."
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-            # Remove the header from the headers list
-            json_table.headers.remove(header_to_delete)
-            json_table.save()
-
-            # Remove the header key from all rows
-            for row in json_table.rows.all():
-                if header_to_delete in row.data:
-                    del row.data[header_to_delete]
-                    row.save()
+            # Remove the header from the headers list and from all rows
+            services.delete_columns(json_table, [header_to_delete])
 
             return Response({
                 "message": f"Column '{header_to_delete}' deleted successfully.",
@@ -339,11 +1041,124 @@ class DeleteColumnView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class BatchRowOperationsView(APIView):
+    """
+    Apply many row adds, updates and deletes to one table in a single request.
+
+    Body: ``{"operations": [...], "mode": "atomic" | "best_effort"}``, see
+    ``services.apply_row_operations`` for the operation format.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticatedCustom]
+
+    def post(self, request, table_id):
+        try:
+            refresh_token = request.COOKIES.get('refresh_token')
+            if not refresh_token:
+                return Response({'message': "Refresh token not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+
+            user_id = decode_refresh_token(refresh_token)
+
+            operations = request.data.get('operations')
+            mode = request.data.get('mode') or 'atomic'
+            if not isinstance(operations, list) or not operations:
+                return Response({
+                    "error": "'operations' must be a non-empty list."
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            json_table = _json_table_for(user_id, table_id)
+            if json_table is None:
+                return Response({"error": "Table not found."}, status=status.HTTP_404_NOT_FOUND)
+
+            try:
+                results, applied = services.apply_row_operations(json_table, operations, mode)
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            failed = sum(1 for result in results if result["status"] == "error")
+            summary = {
+                "mode": mode,
+                "applied": applied,
+                "succeeded": sum(1 for result in results if result["status"] == "ok"),
+                "failed": failed,
+                "results": results
+            }
+            if not applied:
+                return Response({
+                    "error": f"{failed} operation(s) failed, nothing was applied.",
+                    "data": summary
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            return Response({
+                "message": "Batch applied." if not failed else f"Batch applied, {failed} operation(s) skipped.",
+                "data": summary
+            }, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            return Response({
+                "error": str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class MoveRowView(APIView):
+    """
+    Move a row within its table's manual order; only the moved row is written.
+
+    Body: ``{"after": <row id>}`` or ``{"before": <row id>}``; an empty body
+    moves the row to the end.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticatedCustom]
+
+    def post(self, request, table_id, row_id):
+        try:
+            refresh_token = request.COOKIES.get('refresh_token')
+            if not refresh_token:
+                return Response({'message': "Refresh token not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+
+            user_id = decode_refresh_token(refresh_token)
+
+            try:
+                after, before = _row_anchor(request.data)
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            if row_id in (after, before):
+                return Response({"error": "A row cannot be moved next to itself."}, status=status.HTTP_400_BAD_REQUEST)
+
+            json_table = _json_table_for(user_id, table_id)
+            if json_table is None:
+                return Response({"error": "Table not found."}, status=status.HTTP_404_NOT_FOUND)
+
+            row = json_table.rows.filter(pk=row_id).only('id', 'table_id', 'position').first()
+            if row is None:
+                return Response({"error": f"Row with ID '{row_id}' not found in table."}, status=status.HTTP_404_NOT_FOUND)
+            try:
+                follows = services.move_row(row, after, before)
+            except JsonTableRow.DoesNotExist:
+                return Response({"error": "Row to move next to not found in table."}, status=status.HTTP_404_NOT_FOUND)
+
+            return Response({
+                "message": "Row moved successfully.",
+                "data": {"id": row.pk, "after": follows}
+            }, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            return Response({
+                "error": str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 class DeleteRowView(APIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticatedCustom]
     def post(self, request):
         try:
+            refresh_token = request.COOKIES.get('refresh_token')
+            if not refresh_token:
+                return Response({'message': "Refresh token not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+
+            user_id = decode_refresh_token(refresh_token)
+
             table_id = request.data.get("tableId")
             row_id = request.data.get("rowId")
 
@@ -352,19 +1167,20 @@ class DeleteRowView(APIView):
                     "error": "'tableId' and 'rowId' are required."
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-            # Fetch JsonTable
-            json_table = get_object_or_404(JsonTable, pk=table_id)
+            json_table = _json_table_for(user_id, table_id)
+            if json_table is None:
+                return Response({"error": "Table not found."}, status=status.HTTP_404_NOT_FOUND)
 
             # Find and delete the row
             try:
                 if isinstance(row_id, str):
                     # Find row by data key 'id'
-                    row = json_table.rows.get(data__id=row_id)
+                    row = json_table.rows.get(**{schema.data_lookup(json_table, 'id'): row_id})
                 else:
                     # Find row by primary key
                     row = json_table.rows.get(pk=row_id)
                 
-                row.delete()
+                services.delete_row(row)
                 
                 return Response({
                     "message": "Row deleted successfully."
@@ -386,6 +1202,11 @@ class UpdateTableView(APIView):
     permission_classes = [IsAuthenticatedCustom]
     def patch(self, request, *args, **kwargs):
         try:
+            refresh_token = request.COOKIES.get('refresh_token')
+            if not refresh_token:
+                return JsonResponse({'error': "Refresh token not provided."}, status=401)
+
+            user_id = decode_refresh_token(refresh_token)
             table_id = request.data.get('tableId')
             row_id = request.data.get('rowId')
             new_row_data = request.data.get('newRowData')
@@ -396,23 +1217,24 @@ class UpdateTableView(APIView):
                 }, status=400)
             
             # Get table
-            json_table = JsonTable.objects.get(pk=table_id)
+            json_table = _json_table_for(user_id, table_id)
+            if json_table is None:
+                return JsonResponse({'error': 'Table not found.'}, status=404)
             
             # Get specific row
             if isinstance(row_id, str):
                 # Find row by data key 'id'
-                row = json_table.rows.get(data__id=row_id)
+                row = json_table.rows.get(**{schema.data_lookup(json_table, 'id'): row_id})
             else:
                 # Find row by primary key
                 row = json_table.rows.get(pk=row_id)
             
             # Update row data
-            row.data.update(new_row_data)
-            row.save()
+            updated_row = services.update_row(row, new_row_data)
             
             return JsonResponse({
                 'status': 'success',
-                'updated_row': row.data
+                'updated_row': updated_row
             })
             
         except Exception as e:
@@ -435,37 +1257,19 @@ class DeleteTableView(APIView):
                 return Response({'message': "Refresh token not provided."}, status=status.HTTP_401_UNAUTHORIZED)
             
             user_id = decode_refresh_token(refresh_token)
-            user = User.objects.get(id=user_id)
-
-            if not user.is_authenticated:
-                return Response({
-                    "message": "Authentication credentials were not provided or are invalid."
-                }, status=status.HTTP_401_UNAUTHORIZED)
 
             # Get the table and verify ownership
-            try:
-                table_data = DynamicTableData.objects.get(id=table_id, user=user)
-            except DynamicTableData.DoesNotExist:
+            table_data = DynamicTableData.objects.filter(id=table_id).first() if access.is_owner(user_id, table_id) else None
+            if table_data is None:
                 return Response({
                     "error": "Table not found or you don't have permission to delete it."
                 }, status=status.HTTP_404_NOT_FOUND)
 
-            # Get the associated JsonTable if it exists
-            try:
-                json_table = JsonTable.objects.get(table=table_data)
-                # Delete all rows first (cascade should handle this, but being explicit)
-                json_table.rows.all().delete()
-                # Delete the JsonTable
-                json_table.delete()
-            except JsonTable.DoesNotExist:
-                # Table exists in DynamicTableData but not in JsonTable, that's okay
-                pass
-
             # Store table name for response
             table_name = table_data.table_name
             
-            # Delete the main table record
-            table_data.delete()
+            # Hide the table at once; its rows are removed by the purge_deleted_tables command
+            services.delete_table(table_data)
 
             return Response({
                 "message": f"Table '{table_name}' and all its data deleted successfully."
@@ -483,6 +1287,12 @@ class EditHeaderView(APIView):
     
     def post(self, request):
         try:
+            refresh_token = request.COOKIES.get('refresh_token')
+            if not refresh_token:
+                return Response({'message': "Refresh token not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+
+            user_id = decode_refresh_token(refresh_token)
+
             table_id = request.data.get("tableId")
             old_header = request.data.get("oldHeader")
             new_header = request.data.get("newHeader")
@@ -492,8 +1302,9 @@ class EditHeaderView(APIView):
                     "error": "Missing required fields: tableId, oldHeader, newHeader"
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-            # Get the JsonTable instance
-            json_table = get_object_or_404(JsonTable, table_id=table_id)
+            json_table = _json_table_for(user_id, table_id)
+            if json_table is None:
+                return Response({"error": "Table not found."}, status=status.HTTP_404_NOT_FOUND)
 
             # Check if new header already exists
             if new_header in json_table.headers:
@@ -501,16 +1312,8 @@ class EditHeaderView(APIView):
                     "error": f"Header '{new_header}' already exists."
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-            # Update the header in the headers list
-            header_index = json_table.headers.index(old_header)
-            json_table.headers[header_index] = new_header
-            json_table.save()
-
-            # Update the header in all rows
-            for row in json_table.rows.all():
-                if old_header in row.data:
-                    row.data[new_header] = row.data.pop(old_header)
-                    row.save()
+            # Update the header in the headers list and in all rows
+            services.rename_column(json_table, old_header, new_header)
 
             return Response({
                 "message": "Header updated successfully.",
@@ -546,10 +1349,9 @@ class ShareTableView(APIView):
                     "error": "table_id and action are required."
                 }, status=status.HTTP_400_BAD_REQUEST)
                 
-            try:
-                # Get the original table
-                table = DynamicTableData.objects.get(id=table_id, user=current_user)
-            except DynamicTableData.DoesNotExist:
+            # Get the original table
+            table = DynamicTableData.objects.filter(id=table_id).first() if access.is_owner(user_id, table_id) else None
+            if table is None:
                 return Response({
                     "error": "Table not found or you don't have permission."
                 }, status=status.HTTP_404_NOT_FOUND)
@@ -573,9 +1375,7 @@ class ShareTableView(APIView):
                         friend = User.objects.get(id=friend_id)
                         # Check if friend is in the combined friends list
                         if friend in all_friends:
-                            # Check if table is already shared with this friend
-                            if not table.shared_with.filter(id=friend.id).exists():
-                                friends_to_share.append(friend)
+                            friends_to_share.append(friend)
                         else:
                             return Response({
                                 "error": f"{friend.username} is not your friend."
@@ -583,29 +1383,16 @@ class ShareTableView(APIView):
                     except User.DoesNotExist:
                         continue
                 
-                # Add all friends at once to prevent multiple saves
+                # Add all friends at once; the table's access rows follow
                 if friends_to_share:
-                    # Use bulk_create to prevent duplicate entries
-                    table.shared_with.add(*friends_to_share)
-                    # Only update is_shared if it's not already True
-                    if not table.is_shared:
-                        table.is_shared = True
-                        table.save()
+                    services.share_table(table, friends_to_share)
                 
                 message = "Table shared successfully."
                 
             elif action == 'unshare':
-                if not friend_ids:
-                    # Unshare with all friends
-                    table.shared_with.clear()
-                else:
-                    # Remove all specified friends at once
-                    friends_to_remove = User.objects.filter(id__in=friend_ids)
-                    table.shared_with.remove(*friends_to_remove)
-                            
-                if not table.shared_with.exists():
-                    table.is_shared = False
-                    table.save()
+                # Unshare with all friends, or remove the specified ones at once
+                friends_to_remove = list(User.objects.filter(id__in=friend_ids)) if friend_ids else None
+                services.unshare_table(table, friends_to_remove)
                     
                 message = "Table unshared successfully."
                 
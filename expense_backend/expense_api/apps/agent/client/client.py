@@ -1,7 +1,9 @@
 import os
 import sys
 import json
-from contextlib import AsyncExitStack
+import time
+import asyncio
+from contextlib import AsyncExitStack, aclosing
 from typing import Dict, Any, List, Optional
 
 from django.conf import settings
@@ -12,7 +14,12 @@ from mcp.client.stdio import stdio_client
 from langchain_mcp_adapters.tools import load_mcp_tools
 from langgraph.prebuilt import create_react_agent
 from langchain_anthropic import ChatAnthropic
-from langchain_core.messages import AIMessage
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.callbacks import AsyncCallbackHandler
+from asgiref.sync import sync_to_async
+
+from expense_api.apps.FinanceManagement.catalog import get_relevant_catalog, format_table_catalog
+from expense_api.apps.FinanceManagement.table_index import rank_tables
 
 
 DEBUG = os.environ.get("MCP_DEBUG", "false").lower() == "true"
@@ -22,6 +29,194 @@ def debug_print(*args, **kwargs):
         print("[DEBUG]", *args, **kwargs)
 
 
+MODEL_NAME = "claude-3-5-sonnet-20240620"
+
+# USD per million tokens, used to estimate the cost of a query
+MODEL_PRICING = {
+    "claude-3-5-sonnet-20240620": {"input": 3.00, "output": 15.00, "cache_read": 0.30, "cache_write": 3.75},
+}
+
+
+class UsageTracker(AsyncCallbackHandler):
+    """Collect token usage, round trips and timings for a single agent run."""
+
+    def __init__(self, model_name: str = MODEL_NAME):
+        self.model_name = model_name
+        self.llm_calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cache_read_tokens = 0
+        self.cache_write_tokens = 0
+        self.llm_seconds = 0.0
+        self.tool_calls = 0
+        self.tool_errors = 0
+        self.tool_seconds = 0.0
+        self.tools = {}
+        self._started = {}
+
+    async def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    async def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    async def on_llm_end(self, response, *, run_id, **kwargs):
+        self.llm_calls += 1
+        self.llm_seconds += self._elapsed(run_id)
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None)
+                if not usage:
+                    continue
+                details = usage.get("input_token_details") or {}
+                cache_read = details.get("cache_read", 0) or 0
+                cache_write = details.get("cache_creation", 0) or 0
+                # usage_metadata's input_tokens already includes the cached tokens
+                self.input_tokens += max(usage.get("input_tokens", 0) - cache_read - cache_write, 0)
+                self.output_tokens += usage.get("output_tokens", 0)
+                self.cache_read_tokens += cache_read
+                self.cache_write_tokens += cache_write
+
+    async def on_llm_error(self, error, *, run_id, **kwargs):
+        self.llm_calls += 1
+        self.llm_seconds += self._elapsed(run_id)
+
+    async def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+        name = (serialized or {}).get("name", "unknown")
+        self.tool_calls += 1
+        self.tools[name] = self.tools.get(name, 0) + 1
+
+    async def on_tool_end(self, output, *, run_id, **kwargs):
+        self.tool_seconds += self._elapsed(run_id)
+
+    async def on_tool_error(self, error, *, run_id, **kwargs):
+        self.tool_errors += 1
+        self.tool_seconds += self._elapsed(run_id)
+
+    def _elapsed(self, run_id) -> float:
+        started = self._started.pop(run_id, None)
+        return time.perf_counter() - started if started is not None else 0.0
+
+    def total_tokens(self) -> int:
+        """Every token of the run counted once; ``input_tokens`` excludes the cached ones."""
+        return self.input_tokens + self.cache_read_tokens + self.cache_write_tokens + self.output_tokens
+
+    def estimated_cost(self) -> float:
+        pricing = MODEL_PRICING.get(self.model_name)
+        if not pricing:
+            return 0.0
+        cost = (
+            self.input_tokens * pricing["input"]
+            + self.output_tokens * pricing["output"]
+            + self.cache_read_tokens * pricing["cache_read"]
+            + self.cache_write_tokens * pricing["cache_write"]
+        )
+        return round(cost / 1_000_000, 6)
+
+    def as_dict(self, **timings) -> Dict[str, Any]:
+        """Return the usage summary; extra phase timings are given in seconds."""
+        phases = {
+            "llm_ms": round(self.llm_seconds * 1000, 1),
+            "tools_ms": round(self.tool_seconds * 1000, 1),
+        }
+        for name, seconds in timings.items():
+            phases[f"{name}_ms"] = round(seconds * 1000, 1)
+        return {
+            "model": self.model_name,
+            "llm_calls": self.llm_calls,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cache_read_tokens": self.cache_read_tokens,
+            "cache_write_tokens": self.cache_write_tokens,
+            "total_tokens": self.total_tokens(),
+            "tool_calls": self.tool_calls,
+            "tool_errors": self.tool_errors,
+            "tools": self.tools,
+            "cost_usd": self.estimated_cost(),
+            "timings": phases,
+        }
+
+
+class RunGuard:
+    """
+    Budgets for a single agent run.
+
+    ``check`` is called with every intermediate graph state. It returns a stop
+    reason when the next step would exceed the step or token budget, or when
+    the model asks for a tool call it has already made (same tool, same
+    arguments) more than ``max_repeated_tool_calls`` times.
+    """
+
+    def __init__(self, tracker: UsageTracker, max_steps: int, max_tokens: int, max_repeated_tool_calls: int):
+        self.tracker = tracker
+        self.max_steps = max_steps
+        self.max_tokens = max_tokens
+        self.max_repeated_tool_calls = max_repeated_tool_calls
+        self.tool_call_counts = {}
+        self.state = None
+        self.stop_reason = None
+
+    def check(self, state) -> Optional[str]:
+        self.state = state
+        messages = state.get("messages", []) if isinstance(state, dict) else []
+        last = messages[-1] if messages else None
+        tool_calls = getattr(last, "tool_calls", None) if isinstance(last, AIMessage) else None
+        if not tool_calls:
+            return None
+
+        for call in tool_calls:
+            signature = (call.get("name"), json.dumps(call.get("args", {}), sort_keys=True, default=str))
+            self.tool_call_counts[signature] = self.tool_call_counts.get(signature, 0) + 1
+            if self.tool_call_counts[signature] > self.max_repeated_tool_calls:
+                return "repeated_tool_call"
+
+        if self.tracker.llm_calls >= self.max_steps:
+            return "step_budget"
+        if self.tracker.total_tokens() >= self.max_tokens:
+            return "token_budget"
+        return None
+
+
+STOP_MESSAGES = {
+    "timeout": "the request took too long",
+    "cancelled": "the request was cancelled",
+    "step_budget": "the step limit for one request was reached",
+    "token_budget": "the token limit for one request was reached",
+    "repeated_tool_call": "the same action was being repeated without progress",
+}
+
+
+def progress_events(messages) -> List[Dict[str, Any]]:
+    """Describe new agent messages as progress events for job status and streams."""
+    events = []
+    for message in messages:
+        if isinstance(message, AIMessage):
+            text = message.text().strip()
+            if message.tool_calls:
+                events.append({
+                    "type": "tool_call",
+                    "tools": [call.get("name") for call in message.tool_calls],
+                    "text": text[:500],
+                })
+            else:
+                events.append({"type": "answer", "text": text[:500]})
+        elif isinstance(message, ToolMessage):
+            events.append({
+                "type": "tool_result",
+                "tool": message.name,
+                "status": getattr(message, "status", "success"),
+            })
+    return events
+
+
+async def _wait_for_event(event, interval: float = 0.25):
+    """Wait until a ``threading.Event`` (or anything with ``is_set``) is set."""
+    while not event.is_set():
+        await asyncio.sleep(interval)
+
+
 PROMPT_TEMPLATE = """
 You are an advanced intelligent data management and tracking assistant with sophisticated analysis capabilities.
 
@@ -31,14 +226,23 @@ You have access to the following tools for managing data:
 
 1. `get_user_tables(user_id: int)` - Get all tables belonging to a user
 2. `create_table(user_id: int, table_name: str, description: str, headers: list)` - Create new data tracking table
-3. `add_table_row(table_id: int, row_data: dict)` - Add data entry to a table
-4. `update_table_row(table_id: int, row_id: str, new_data: dict)` - Update existing data entry
-5. `delete_table_row(table_id: int, row_id: str)` - Delete a data entry
-6. `get_table_content(user_id: int, table_id?: int)` - Get table data for analysis
-7. `add_table_column(table_id: int, header: str)` - Add new column to table
-8. `delete_table_columns(table_id: int, new_headers: list)` - Remove columns from table
+3. `add_table_row(user_id: int, table_id: int, row_data: dict)` - Add data entry to a table
+4. `update_table_row(user_id: int, table_id: int, row_id: str, new_data: dict)` - Update existing data entry
+5. `delete_table_row(user_id: int, table_id: int, row_id: str)` - Delete a data entry
+6. `get_table_content(user_id: int, table_id?: int, filters?: dict | list, order_by?: str | list)` - Get table data for analysis; with `table_id`, the database filters and sorts the rows so you only read the ones you need
+   - `filters`: `{"column": "Amount", "op": "gt", "value": 500}` with `op` one of eq, ne, gt, gte, lt, lte, in (a list value), contains, empty, not_empty; combine with `{"and": [...]}`, `{"or": [...]}` and `{"not": ...}` (a plain list means "and"). Values are read like cells, so "1.5k" or "ajk" work on amount and date columns
+   - `order_by`: `"Date desc, Amount"` or `["-Date", "Amount"]`; empty cells sort last
+7. `add_table_column(user_id: int, table_id: int, header: str)` - Add new column to table
+8. `delete_table_columns(user_id: int, table_id: int, new_headers: list)` - Remove columns from table
 9. `update_table_metadata(user_id: int, table_id: int, ...)` - Update table name/description
 10. `delete_table(user_id: int, table_id: int)` - Delete entire table
+11. `search_rows(user_id: int, query: str, table_id?: int, limit?: int)` - Full-text search inside rows of all the user's tables, or one table (e.g. "350 tk pharmacy"; Bangla, Banglish and English); use it to find specific entries instead of reading whole tables
+12. `set_column_type(user_id: int, table_id: int, header: str, column_type: str)` - Set a column's type (text, number, currency, date or category) so it can be sorted, filtered and summed
+13. `create_table_snapshot(user_id: int, table_id: int, label?: str)` - Save a restorable snapshot of a table
+14. `get_table_snapshots(user_id: int, table_id: int)` - List a table's snapshots
+15. `restore_table_snapshot(user_id: int, table_id: int, snapshot_id: int)` - Undo every change to a table since a snapshot
+
+Before bulk edits (changing or deleting many rows, removing columns), call `create_table_snapshot` first and mention the snapshot id in your answer, so the user can ask you to undo them.
 
 ## ADVANCED INTELLIGENCE INSTRUCTIONS:
 
@@ -50,7 +254,7 @@ You have access to the following tools for managing data:
 - Provide insights on data organization and tracking habits
 
 ### 🎯 INTELLIGENT TABLE MATCHING:
-- **Step 1**: Always get user's existing tables first with `get_user_tables(user_id)`
+- **Step 1**: Use the TABLE CATALOG in the user context (table id, name, headers, row count; tables shared with the user are marked) to know the tables the user can read and edit. Only call `get_user_tables(user_id)` when no catalog is provided or you need descriptions or sharing details
 - **Step 2**: Analyze table names, descriptions, and purposes to find best matches
 - **Step 3**: Use semantic similarity to match query intent with table purpose
 - **Step 4**: Consider table usage patterns and relevance scores
@@ -164,18 +368,27 @@ Remember: You are a universal data management assistant - help users track, orga
 
 class ExpenseMCPClient:
 
-    def __init__(self, anthropic_api_key=None):
+    def __init__(self, anthropic_api_key=None, use_table_catalog=None):
         self.anthropic_api_key = anthropic_api_key or getattr(
             settings, "ANTHROPIC_API_KEY", os.getenv("ANTHROPIC_API_KEY")
         )
         if not self.anthropic_api_key:
             raise ValueError("Anthropic API key is required.")
+        if use_table_catalog is None:
+            use_table_catalog = getattr(settings, "AGENT_TABLE_CATALOG", True)
+        self.use_table_catalog = use_table_catalog
+        self.catalog_limit = getattr(settings, "AGENT_CATALOG_LIMIT", 25)
+        self.run_timeout = getattr(settings, "AGENT_RUN_TIMEOUT", 90)
+        self.max_steps = getattr(settings, "AGENT_MAX_STEPS", 12)
+        self.max_tokens = getattr(settings, "AGENT_MAX_TOKENS", 60000)
+        self.max_repeated_tool_calls = getattr(settings, "AGENT_MAX_REPEATED_TOOL_CALLS", 2)
         self.exit_stack = None
         self.client = None
         self.agent = None
         self.available_tools = []
         self.sessions = {}
         self.operation_history = []  # Track operation history
+        self.connect_seconds = 0.0
 
     @staticmethod
     def read_config_json():
@@ -308,16 +521,14 @@ class ExpenseMCPClient:
                 formatted_response += f"- **Tables Analyzed:** {len(data)} tables\n"
                 
                 # Analyze table relevance
-                best_match = self._find_best_table_match(data, original_query)
-                if best_match:
+                ranked = self._rank_tables(data, original_query)
+                if ranked:
+                    best_match = ranked[0]
                     formatted_response += f"- **Best Match:** {best_match['name']} (Relevance: {best_match['score']}%)\n"
                 
                 # Show table analysis
-                for i, item in enumerate(data[:3]):
-                    if isinstance(item, dict):
-                        table_name = item.get("table_name") or item.get("name") or f"Table {i+1}"
-                        relevance = self._calculate_table_relevance(item, original_query)
-                        formatted_response += f"  • {table_name} - Relevance: {relevance}%\n"
+                for match in ranked[:3]:
+                    formatted_response += f"  • {match['name']} - Relevance: {match['score']}%\n"
                         
             elif isinstance(data, dict):
                 if "table_id" in data:
@@ -416,87 +627,22 @@ class ExpenseMCPClient:
         else:
             return "Low (<60%)"
 
-    def _find_best_table_match(self, tables: List[Dict], query: str) -> Dict:
-        """Find the best matching table based on semantic analysis."""
-        if not tables:
-            return None
-            
-        best_match = None
-        highest_score = 0
-        
-        # Keywords for different categories
-        query_lower = query.lower()
-        expense_keywords = ['khoroch', 'expense', 'cost', 'spent', 'buy', 'purchase']
-        location_keywords = ['sylhet', 'dhaka', 'chittagong', 'travel']
-        time_keywords = ['daily', 'monthly', 'yearly', 'ajk', 'today']
-        
-        for table in tables:
-            if not isinstance(table, dict):
-                continue
-                
-            table_name = table.get("table_name", "").lower()
-            description = table.get("description", "").lower()
-            
-            score = 0
-            
-            # Check for expense-related matches
-            if any(keyword in query_lower for keyword in expense_keywords):
-                if any(keyword in table_name for keyword in expense_keywords):
-                    score += 40
-                if 'expense' in table_name or 'cost' in table_name:
-                    score += 30
-                    
-            # Check for location matches
-            for location in location_keywords:
-                if location in query_lower and location in table_name:
-                    score += 35
-                    
-            # Check for time period matches
-            for time_word in time_keywords:
-                if time_word in query_lower and time_word in table_name:
-                    score += 25
-                    
-            # General name similarity
-            if 'daily' in table_name and ('ajk' in query_lower or 'today' in query_lower):
-                score += 20
-                
-            if score > highest_score:
-                highest_score = score
-                best_match = {
-                    "name": table.get("table_name", "Unknown"),
-                    "score": min(score, 95),  # Cap at 95%
-                    "id": table.get("id")
-                }
-        
-        return best_match
-
-    def _calculate_table_relevance(self, table: Dict, query: str) -> int:
-        """Calculate relevance percentage for a specific table."""
-        if not isinstance(table, dict):
-            return 0
-            
-        table_name = table.get("table_name", "").lower()
-        query_lower = query.lower()
-        
-        relevance = 20  # Base relevance
-        
-        # Keyword matching
-        expense_words = ['expense', 'khoroch', 'cost']
-        location_words = ['sylhet', 'dhaka', 'travel']
-        
-        for word in expense_words:
-            if word in query_lower and word in table_name:
-                relevance += 25
-                
-        for word in location_words:
-            if word in query_lower and word in table_name:
-                relevance += 30
-                
-        # Time relevance
-        if ('ajk' in query_lower or 'today' in query_lower) and 'daily' in table_name:
-            relevance += 20
-            
-        return min(relevance, 95)
+    def _rank_tables(self, tables: List[Dict], query: str) -> List[Dict]:
+        """Rank tables against the query with the shared table index scorer, best match first."""
+        by_key = {
+            table.get("id", index): table
+            for index, table in enumerate(tables)
+            if isinstance(table, dict)
+        }
+        return [
+            {
+                "id": key,
+                "name": by_key[key].get("table_name") or by_key[key].get("name") or "Unknown",
+                "score": relevance
+            }
+            for key, _, relevance in rank_tables(tables, query)
+            if key in by_key
+        ]
 
     def _generate_smart_recommendations(self, response_data: Dict, query: str) -> List[str]:
         """Generate intelligent recommendations based on the operation."""
@@ -547,6 +693,13 @@ class ExpenseMCPClient:
         return datetime.now().isoformat()
 
     async def connect(self):
+        connect_started = time.perf_counter()
+        try:
+            return await self._connect()
+        finally:
+            self.connect_seconds = time.perf_counter() - connect_started
+
+    async def _connect(self):
         config = self.read_config_json()
         mcp_servers = config.get("mcpServers", {})
         if not mcp_servers:
@@ -589,7 +742,7 @@ class ExpenseMCPClient:
             return
 
         llm = ChatAnthropic(
-            model="claude-3-5-sonnet-20240620",
+            model=MODEL_NAME,
             temperature=0,
             anthropic_api_key=self.anthropic_api_key
         )
@@ -630,7 +783,102 @@ class ExpenseMCPClient:
             return "✅ Disconnected"
         return "ℹ️ Not connected"
 
-    async def process_query(self, query_data):
+    async def _stream_agent(self, full_prompt, tracker: UsageTracker, guard: RunGuard, progress=None):
+        """
+        Run the agent step by step, stopping as soon as the guard reports a reason.
+
+        ``progress`` is an optional async callable that receives a list of
+        events (see ``progress_events``) for the messages added by each step.
+        """
+        config = {
+            # Hard backstop; the guard normally stops the run long before this.
+            "recursion_limit": 2 * self.max_steps + 5,
+            "callbacks": [tracker],
+        }
+        async with aclosing(self.agent.astream({"messages": full_prompt}, config, stream_mode="values")) as states:
+            seen = 0
+            async for state in states:
+                if progress is not None:
+                    messages = state.get("messages", []) if isinstance(state, dict) else []
+                    # The first state only holds the prompt
+                    events = progress_events(messages[max(seen, 1):])
+                    seen = len(messages)
+                    if events:
+                        await progress(events)
+                reason = guard.check(state)
+                if reason:
+                    guard.stop_reason = reason
+                    break
+        return guard.state
+
+    async def _run_with_limits(self, full_prompt, tracker: UsageTracker, guard: RunGuard, timeout: float,
+                               cancel_event=None, progress=None):
+        """
+        Run the agent under the wall-clock deadline and the cancel event.
+
+        On timeout or cancellation the run task is cancelled, which propagates
+        into the in-flight LLM request or MCP tool call. The last completed
+        state stays available on ``guard.state``.
+        """
+        run = asyncio.create_task(self._stream_agent(full_prompt, tracker, guard, progress))
+        watcher = asyncio.create_task(_wait_for_event(cancel_event)) if cancel_event is not None else None
+        waiting = {run, watcher} if watcher else {run}
+        try:
+            done, _ = await asyncio.wait(waiting, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            run.cancel()
+            raise
+        finally:
+            if watcher:
+                watcher.cancel()
+
+        if run in done:
+            return run.result()
+
+        run.cancel()
+        try:
+            await run
+        except asyncio.CancelledError:
+            pass
+        guard.stop_reason = "cancelled" if watcher in done else "timeout"
+        return guard.state
+
+    def _partial_answer(self, state, stop_reason: str) -> str:
+        """Summarize what a run that was stopped early got done."""
+        messages = state.get("messages", []) if isinstance(state, dict) else []
+        tools_done = {}
+        for message in messages:
+            if isinstance(message, ToolMessage):
+                tools_done[message.name] = tools_done.get(message.name, 0) + 1
+        last_text = ""
+        for message in reversed(messages):
+            if isinstance(message, AIMessage):
+                last_text = message.text()
+                if last_text.strip():
+                    break
+
+        answer = f"⚠️ I stopped before finishing because {STOP_MESSAGES.get(stop_reason, stop_reason)}."
+        if tools_done:
+            done = ", ".join(f"{name} ×{count}" if count > 1 else name for name, count in tools_done.items())
+            answer += f"\nCompleted actions: {done}."
+        else:
+            answer += "\nNo changes were made."
+        if last_text.strip():
+            answer += f"\n\n{last_text.strip()}"
+        return answer
+
+    async def process_query(self, query_data, cancel_event=None, progress=None):
+        """
+        Run one query through the agent.
+
+        ``cancel_event`` is an optional ``threading.Event``; setting it (e.g.
+        when the HTTP client disconnects) stops the run. Runs are also bounded
+        by ``AGENT_RUN_TIMEOUT``, ``AGENT_MAX_STEPS``, ``AGENT_MAX_TOKENS`` and
+        ``AGENT_MAX_REPEATED_TOOL_CALLS``; a run stopped early returns a
+        partial answer with ``partial`` and ``stop_reason`` set. ``progress``
+        receives step events while the run is going, see ``_stream_agent``.
+        """
+        run_started = time.perf_counter()
         if not self.agent:
             await self.connect()
         if not self.agent:
@@ -641,6 +889,7 @@ class ExpenseMCPClient:
             }
 
         # Format the query with context
+        catalog_seconds = 0.0
         if isinstance(query_data, dict):
             query_text = query_data.get('query', str(query_data))
             user_id = query_data.get('user_id', 'unknown')
@@ -649,6 +898,14 @@ class ExpenseMCPClient:
                 context += f"\nTable ID: {query_data['table_id']}"
             if 'context_type' in query_data:
                 context += f"\nContext: {query_data['context_type']}"
+            if self.use_table_catalog and isinstance(user_id, int):
+                catalog_started = time.perf_counter()
+                catalog, total_tables = await sync_to_async(get_relevant_catalog)(user_id, query_text, self.catalog_limit)
+                catalog_seconds = time.perf_counter() - catalog_started
+                context += (
+                    "\nTABLE CATALOG (current, most relevant first, use these ids and headers directly):\n"
+                    f"{format_table_catalog(catalog, total_tables)}"
+                )
         else:
             context = f"Query: {query_data}"
             query_text = str(query_data)
@@ -662,8 +919,42 @@ Process this request and use the appropriate tools to help the user.
 When you receive tool responses, look for the 'steps' array and provide detailed feedback about the operation progress.
 """
 
+        tracker = UsageTracker()
+        guard = RunGuard(tracker, self.max_steps, self.max_tokens, self.max_repeated_tool_calls)
         try:
-            response = await self.agent.ainvoke({"messages": full_prompt}, {"recursion_limit": 100})
+            # The deadline covers the whole request, including connecting and the catalog
+            remaining = max(self.run_timeout - (time.perf_counter() - run_started), 1)
+            response = await self._run_with_limits(full_prompt, tracker, guard, remaining, cancel_event, progress)
+            post_started = time.perf_counter()
+
+            if guard.stop_reason:
+                partial_answer = self._partial_answer(response, guard.stop_reason)
+                usage = tracker.as_dict(
+                    connect=self.connect_seconds,
+                    catalog=catalog_seconds,
+                    post_processing=time.perf_counter() - post_started,
+                    total=time.perf_counter() - run_started
+                )
+                usage["stop_reason"] = guard.stop_reason
+                self.operation_history.append({
+                    "timestamp": self._get_timestamp(),
+                    "success": False,
+                    "message": partial_answer,
+                    "query": query_text,
+                    "stop_reason": guard.stop_reason
+                })
+                return {
+                    "success": False,
+                    "partial": True,
+                    "stop_reason": guard.stop_reason,
+                    "message": f"Stopped early: {guard.stop_reason}",
+                    "query": query_text,
+                    "response": partial_answer,
+                    "formatted_response": partial_answer,
+                    "raw_response": response,
+                    "operation_stats": self.get_operation_stats(),
+                    "usage": usage
+                }
 
             # Extract response content
             final_response = ""
@@ -697,6 +988,12 @@ When you receive tool responses, look for the 'steps' array and provide detailed
                 "formatted_response": final_response,
                 "raw_response": raw_response,
                 "operation_stats": self.get_operation_stats(),
+                "usage": tracker.as_dict(
+                    connect=self.connect_seconds,
+                    catalog=catalog_seconds,
+                    post_processing=time.perf_counter() - post_started,
+                    total=time.perf_counter() - run_started
+                ),
                 **structured_data  # Merge any extracted structured data
             }
 
@@ -730,7 +1027,12 @@ When you receive tool responses, look for the 'steps' array and provide detailed
                     "status": "failed",
                     "error": str(e)
                 }],
-                "operation_stats": self.get_operation_stats()
+                "operation_stats": self.get_operation_stats(),
+                "usage": tracker.as_dict(
+                    connect=self.connect_seconds,
+                    catalog=catalog_seconds,
+                    total=time.perf_counter() - run_started
+                )
             }
 
     def _extract_structured_response(self, response_text: str, query: str) -> Dict[str, Any]:
@@ -832,7 +1134,7 @@ When you receive tool responses, look for the 'steps' array and provide detailed
         return False
 
     @staticmethod
-    async def create_and_run_query(query_data, anthropic_api_key=None):
+    async def create_and_run_query(query_data, anthropic_api_key=None, cancel_event=None):
         """Static method to create client, run query, and cleanup in one go."""
         async with ExpenseMCPClient(anthropic_api_key) as client:
             if not client.agent:
@@ -841,4 +1143,4 @@ When you receive tool responses, look for the 'steps' array and provide detailed
                     "error": "Failed to initialize MCP client",
                     "message": "Could not connect to the finance management tools"
                 }
-            return await client.process_query(query_data)
\ No newline at end of file
+            return await client.process_query(query_data, cancel_event=cancel_event)
\ No newline at end of file
@@ -0,0 +1,323 @@
+"""
+Background agent jobs.
+
+``submit_job`` records a query and returns at once. Workers started with
+``python manage.py run_agent_workers`` claim queued jobs, run them through the
+MCP client and write progress events and the final answer to the job row, so
+web workers never wait on the agent. Clients poll the job or attach to its
+event stream; when the job belongs to a chat session the query and the reply
+are saved as ``ChatMessage`` rows, like replies from the synchronous endpoints.
+"""
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import AgentJob, ChatMessage
+from .usage import save_bot_reply
+
+
+# ============ JOB LIFECYCLE ============
+
+def submit_job(user, query_data, chat_session=None):
+    """Queue a query for the workers; the user's message is saved to the session right away."""
+    query = query_data['query']
+    with transaction.atomic():
+        user_message_id = ""
+        if chat_session is not None:
+            user_message_id = f"user_{uuid.uuid4().hex}"
+            ChatMessage.objects.create(
+                chat_session=chat_session,
+                user=user,
+                message_id=user_message_id,
+                text=query,
+                displayed_text=query,
+                sender='user'
+            )
+            # Update session timestamp
+            chat_session.save()
+
+        return AgentJob.objects.create(
+            job_id=f"job_{uuid.uuid4().hex}",
+            user=user,
+            chat_session=chat_session,
+            query=query,
+            query_data={key: query_data[key] for key in ('table_id', 'context_type') if key in query_data},
+            user_message_id=user_message_id
+        )
+
+
+def cancel_job(job):
+    """Cancel a queued job immediately, or ask the worker to stop a running one."""
+    now = timezone.now()
+    if AgentJob.objects.filter(pk=job.pk, status='queued').update(
+        status='cancelled', cancel_requested=True, finished_at=now
+    ):
+        append_progress(job.pk, [{"type": "finished", "status": "cancelled"}])
+    else:
+        AgentJob.objects.filter(pk=job.pk, status='running').update(cancel_requested=True)
+    job.refresh_from_db()
+    return job
+
+
+def claim_next_job(worker):
+    """
+    Atomically move the oldest queued job to ``running`` for this worker.
+
+    The claim is a conditional UPDATE, so concurrent workers on any database
+    backend never pick the same job.
+    """
+    close_old_connections()
+    candidates = list(
+        AgentJob.objects.filter(status='queued').order_by('created_at').values_list('pk', flat=True)[:5]
+    )
+    for pk in candidates:
+        now = timezone.now()
+        claimed = AgentJob.objects.filter(pk=pk, status='queued').update(
+            status='running', worker=worker, started_at=now, heartbeat_at=now
+        )
+        if claimed:
+            return AgentJob.objects.select_related('chat_session').get(pk=pk)
+    return None
+
+
+def requeue_stale_jobs(stale_after):
+    """Put running jobs whose worker stopped sending heartbeats back in the queue."""
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    return AgentJob.objects.filter(status='running', heartbeat_at__lt=cutoff).update(
+        status='queued', worker=""
+    )
+
+
+def append_progress(job_pk, events):
+    """Append events to a job's progress log; each event gets a sequence number."""
+    with transaction.atomic():
+        job = AgentJob.objects.select_for_update().only('pk', 'progress').get(pk=job_pk)
+        progress = list(job.progress or [])
+        now = timezone.now()
+        for event in events:
+            progress.append({"seq": len(progress) + 1, "at": now.isoformat(), **event})
+        AgentJob.objects.filter(pk=job_pk).update(progress=progress, heartbeat_at=now)
+
+
+def heartbeat(job_pk):
+    """Record that the worker is alive and return whether cancellation was requested."""
+    AgentJob.objects.filter(pk=job_pk).update(heartbeat_at=timezone.now())
+    return AgentJob.objects.filter(pk=job_pk).values_list('cancel_requested', flat=True).first()
+
+
+def finish_job(job, response_obj):
+    """Store the agent's answer on the job and in the chat session."""
+    # Same response shape as the synchronous agent endpoint
+    from .views import AgentAPIView
+    result = AgentAPIView()._clean_response(response_obj)
+
+    if response_obj.get('stop_reason') == 'cancelled':
+        status = 'cancelled'
+    elif response_obj.get('success') or response_obj.get('partial'):
+        status = 'succeeded'
+    else:
+        status = 'failed'
+
+    bot_message_id = ""
+    if job.chat_session_id and status != 'cancelled':
+        message = save_bot_reply(
+            job.user,
+            job.chat_session.session_id,
+            job.query,
+            result['response'],
+            {
+                'tools_called': result['tools_called'],
+                'usage': result.get('usage'),
+                'job_id': job.job_id,
+            }
+        )
+        if message:
+            bot_message_id = message.message_id
+            result['message_id'] = bot_message_id
+
+    # Log the event first so streams see it before the job turns finished
+    append_progress(job.pk, [{"type": "finished", "status": status}])
+    AgentJob.objects.filter(pk=job.pk).update(
+        status=status,
+        result=result,
+        error="" if status != 'failed' else str(response_obj.get('error') or result['response']),
+        bot_message_id=bot_message_id,
+        finished_at=timezone.now()
+    )
+    return status
+
+
+# ============ WORKERS ============
+
+class AgentWorker:
+    """
+    Claims jobs one at a time and runs them on a long-lived MCP client.
+    Between jobs it puts jobs of dead workers back in the queue every
+    ``stale_after`` seconds.
+    """
+
+    def __init__(self, name, poll_interval, stop_when_idle=False, stale_after=None):
+        self.name = name
+        self.poll_interval = poll_interval
+        self.stop_when_idle = stop_when_idle
+        self.stale_after = stale_after
+        self.next_stale_check = 0
+        self.client = None
+
+    async def requeue_stale(self):
+        if not self.stale_after or time.monotonic() < self.next_stale_check:
+            return
+        self.next_stale_check = time.monotonic() + self.stale_after
+        await sync_to_async(requeue_stale_jobs)(self.stale_after)
+
+    async def run(self):
+        try:
+            while True:
+                await self.requeue_stale()
+                job = await sync_to_async(claim_next_job)(self.name)
+                if job is None:
+                    if self.stop_when_idle:
+                        return
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                await self.process(job)
+        finally:
+            if self.client is not None:
+                await self.client.disconnect()
+
+    async def _get_client(self):
+        from .client.client import ExpenseMCPClient
+        if self.client is None or not self.client.agent:
+            self.client = ExpenseMCPClient()
+            await self.client.connect()
+        return self.client
+
+    async def _watch_for_cancel(self, job_pk, cancel_event):
+        while not cancel_event.is_set():
+            await asyncio.sleep(self.poll_interval)
+            if await sync_to_async(heartbeat)(job_pk):
+                cancel_event.set()
+
+    async def process(self, job):
+        await sync_to_async(append_progress)(job.pk, [{"type": "started", "worker": self.name}])
+
+        async def on_progress(events):
+            await sync_to_async(append_progress)(job.pk, events)
+
+        cancel_event = threading.Event()
+        watcher = asyncio.create_task(self._watch_for_cancel(job.pk, cancel_event))
+        try:
+            client = await self._get_client()
+            if not client.agent:
+                response_obj = {
+                    "success": False,
+                    "error": "Failed to initialize MCP client",
+                    "message": "Could not connect to the finance management tools"
+                }
+            else:
+                query_data = {"query": job.query, "user_id": job.user_id, **(job.query_data or {})}
+                response_obj = await client.process_query(query_data, cancel_event=cancel_event, progress=on_progress)
+        except Exception as e:
+            response_obj = {"success": False, "error": str(e)}
+        finally:
+            watcher.cancel()
+
+        return await sync_to_async(finish_job)(job, response_obj)
+
+
+def worker_name(index):
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+
+async def run_workers(count=None, poll_interval=None, stop_when_idle=False):
+    """Run ``count`` workers in this process until interrupted (or the queue is empty)."""
+    count = count or getattr(settings, "AGENT_JOB_WORKERS", 2)
+    poll_interval = poll_interval or getattr(settings, "AGENT_JOB_POLL_INTERVAL", 1.0)
+    stale_after = getattr(settings, "AGENT_JOB_STALE_AFTER", 300)
+    workers = [
+        AgentWorker(worker_name(index), poll_interval, stop_when_idle, stale_after) for index in range(count)
+    ]
+    await asyncio.gather(*(worker.run() for worker in workers))
+
+
+# ============ EVENT STREAM ============
+
+def _job_snapshot(job_pk):
+    close_old_connections()
+    return AgentJob.objects.filter(pk=job_pk).values('status', 'progress', 'result', 'error').first()
+
+
+def _sse(event, data, event_id=None):
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {event}", f"data: {json.dumps(data, default=str)}"]
+    return "\n".join(lines) + "\n\n"
+
+
+def _events_after(job_pk, after):
+    """The events of a job after ``after``; returns ``(chunks, after, finished)``."""
+    snapshot = _job_snapshot(job_pk)
+    if snapshot is None:
+        return [_sse("error", {"error": "Job not found"})], after, True
+
+    chunks = []
+    for event in (snapshot['progress'] or [])[after:]:
+        chunks.append(_sse(event.get('type', 'progress'), event, event['seq']))
+        after = event['seq']
+
+    if snapshot['status'] in AgentJob.FINISHED_STATUSES:
+        chunks.append(_sse("result", {
+            "status": snapshot['status'],
+            "result": snapshot['result'],
+            "error": snapshot['error'],
+        }))
+        return chunks, after, True
+    return chunks, after, False
+
+
+def job_events(job_pk, after=0, poll_interval=0.5, keepalive=15, max_seconds=300):
+    """
+    Server-sent events for a job: one event per progress entry after ``after``,
+    then a final ``result`` event. Clients that reconnect send the last seen
+    id as ``Last-Event-ID`` (or ``?after=``) and only receive newer events.
+
+    A sync generator for WSGI servers; ``job_event_stream`` is the same for ASGI.
+    """
+    started = last_sent = time.monotonic()
+    while time.monotonic() - started < max_seconds:
+        chunks, after, finished = _events_after(job_pk, after)
+        yield from chunks
+        if finished:
+            return
+        if chunks:
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= keepalive:
+            yield ": keepalive\n\n"
+            last_sent = time.monotonic()
+        time.sleep(poll_interval)
+
+
+async def job_event_stream(job_pk, after=0, poll_interval=0.5, keepalive=15, max_seconds=300):
+    """``job_events`` for ASGI servers, polling without holding a thread."""
+    started = last_sent = time.monotonic()
+    while time.monotonic() - started < max_seconds:
+        chunks, after, finished = await sync_to_async(_events_after)(job_pk, after)
+        for chunk in chunks:
+            yield chunk
+        if finished:
+            return
+        if chunks:
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= keepalive:
+            yield ": keepalive\n\n"
+            last_sent = time.monotonic()
+        await asyncio.sleep(poll_interval)
@@ -0,0 +1,138 @@
+"""
+Replay recorded user queries through the agent and compare agent cost.
+
+Each mode runs against a throwaway copy of the user's tables, so replayed
+writes never touch real data. For every query the usage collected by the MCP
+client (LLM round trips, tool calls, tokens, latency) is recorded and the
+averages per mode are printed side by side.
+
+    python manage.py replay_agent_queries --user 1 --limit 20
+    python manage.py replay_agent_queries --user 1 --queries-file queries.txt --mode catalog
+"""
+import asyncio
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from expense_api.apps.FinanceManagement import counters, services
+from expense_api.apps.FinanceManagement.models import JsonTable, JsonTableRow
+from expense_api.apps.agent.client.client import ExpenseMCPClient
+from expense_api.apps.agent.models import ChatMessage
+
+
+MODES = {
+    "catalog": True,
+    "no-catalog": False,
+}
+
+METRICS = ["llm_calls", "tool_calls", "input_tokens", "output_tokens", "cost_usd", "total_ms"]
+
+
+class Command(BaseCommand):
+    help = "Replay recorded agent queries and report round trips, tokens and latency per mode."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, required=True, help="User whose tables and queries are replayed")
+        parser.add_argument("--limit", type=int, default=20, help="Number of most recent queries to replay")
+        parser.add_argument("--queries-file", help="Replay queries from a file (one per line) instead of chat history")
+        parser.add_argument("--mode", choices=["both", *MODES], default="both")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(id=options["user"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']} not found")
+
+        queries = self._load_queries(user, options)
+        if not queries:
+            raise CommandError("No queries to replay")
+
+        modes = list(MODES) if options["mode"] == "both" else [options["mode"]]
+        results = {}
+        for mode in modes:
+            clone = self._clone_user_tables(user)
+            try:
+                self.stdout.write(f"▶ Replaying {len(queries)} queries with mode '{mode}'...")
+                results[mode] = asyncio.run(self._replay(queries, clone.id, MODES[mode]))
+            finally:
+                clone.delete()
+
+        self._report(results)
+
+    def _load_queries(self, user, options):
+        if options["queries_file"]:
+            with open(options["queries_file"], encoding="utf-8") as f:
+                return [line.strip() for line in f if line.strip()][:options["limit"]]
+        texts = (
+            ChatMessage.objects.filter(user=user, sender='user')
+            .order_by('-timestamp')
+            .values_list('text', flat=True)[:options["limit"]]
+        )
+        return list(reversed(texts))
+
+    def _clone_user_tables(self, user):
+        """Copy the user's tables and rows to a temporary replay user."""
+        clone = User.objects.create(username=f"replay_{user.id}_{int(time.time() * 1000)}")
+        for json_table in JsonTable.objects.filter(table__user=user).select_related('table'):
+            _, cloned_table = services.create_table(
+                clone,
+                json_table.table.table_name,
+                list(json_table.headers),
+                json_table.table.description or "",
+                json_table.column_types
+            )
+            # Rows are copied as stored, so the clone needs the same column ids
+            cloned_table.column_ids = json_table.column_ids
+            cloned_table.column_defaults = json_table.column_defaults
+            cloned_table.retired_columns = json_table.retired_columns
+            cloned_table.row_format = json_table.row_format
+            cloned_table.row_layouts = json_table.row_layouts
+            cloned_table.save(update_fields=['column_ids', 'column_defaults', 'retired_columns', 'row_format', 'row_layouts'])
+            JsonTableRow.objects.bulk_create(
+                [
+                    JsonTableRow(table=cloned_table, data=row.data, typed_data=row.typed_data, position=row.position)
+                    for row in json_table.rows.all()
+                ],
+                batch_size=1000
+            )
+            counters.recount(cloned_table.pk)
+        return clone
+
+    async def _replay(self, queries, user_id, use_table_catalog):
+        usages = []
+        async with ExpenseMCPClient(use_table_catalog=use_table_catalog) as client:
+            for query in queries:
+                response = await client.process_query({"query": query, "user_id": user_id})
+                usage = response.get("usage") or {}
+                usages.append(usage)
+                self.stdout.write(
+                    f"  {'✅' if response.get('success') else '❌'} "
+                    f"llm={usage.get('llm_calls', 0)} tools={usage.get('tool_calls', 0)} "
+                    f"tokens={usage.get('total_tokens', 0)} | {query[:60]}"
+                )
+        return usages
+
+    def _report(self, results):
+        averages = {}
+        for mode, usages in results.items():
+            averages[mode] = {}
+            for metric in METRICS:
+                values = [
+                    usage.get("timings", {}).get(metric, 0) if metric.endswith("_ms") else usage.get(metric, 0)
+                    for usage in usages
+                ]
+                averages[mode][metric] = sum(values) / len(values) if values else 0
+
+        self.stdout.write("\n📊 Average per query:")
+        self.stdout.write(f"{'metric':<16}" + "".join(f"{mode:>14}" for mode in averages))
+        for metric in METRICS:
+            self.stdout.write(f"{metric:<16}" + "".join(f"{averages[mode][metric]:>14.4f}" for mode in averages))
+
+        if len(averages) == 2:
+            with_catalog, without_catalog = averages["catalog"], averages["no-catalog"]
+            saved = without_catalog["llm_calls"] - with_catalog["llm_calls"]
+            self.stdout.write(
+                f"\nRound trips saved per query by the table catalog: {saved:.2f} LLM calls, "
+                f"{without_catalog['tool_calls'] - with_catalog['tool_calls']:.2f} tool calls"
+            )
@@ -0,0 +1,38 @@
+"""
+Run agent job workers.
+
+Each worker claims one queued ``AgentJob`` at a time and keeps its MCP client
+connected between jobs. Start as many processes as needed; claims are atomic,
+so workers in different processes or hosts never run the same job. Jobs
+whose worker stopped sending heartbeats for ``AGENT_JOB_STALE_AFTER`` seconds
+are put back in the queue by the workers still running.
+
+    python manage.py run_agent_workers
+    python manage.py run_agent_workers --workers 4
+    python manage.py run_agent_workers --once
+"""
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from expense_api.apps.agent.jobs import run_workers
+
+
+class Command(BaseCommand):
+    help = "Process queued agent jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, help="Concurrent workers in this process (default: AGENT_JOB_WORKERS)")
+        parser.add_argument("--poll-interval", type=float, help="Seconds between queue polls when idle")
+        parser.add_argument("--once", action="store_true", help="Exit once the queue is empty")
+
+    def handle(self, *args, **options):
+        self.stdout.write("▶ Agent workers started")
+        try:
+            asyncio.run(run_workers(
+                count=options["workers"],
+                poll_interval=options["poll_interval"],
+                stop_when_idle=options["once"]
+            ))
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping agent workers")
@@ -44,4 +44,46 @@ class ChatMessage(models.Model):
         ]
     
     def __str__(self):
-        return f"{self.sender}: {self.text[:50]}..." if len(self.text) > 50 else f"{self.sender}: {self.text}" 
\ No newline at end of file
+        return f"{self.sender}: {self.text[:50]}..." if len(self.text) > 50 else f"{self.sender}: {self.text}" 
+
+class AgentJob(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ]
+    FINISHED_STATUSES = ('succeeded', 'failed', 'cancelled')
+
+    job_id = models.CharField(max_length=64, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='agent_jobs')
+    chat_session = models.ForeignKey(ChatSession, on_delete=models.SET_NULL, null=True, blank=True, related_name='agent_jobs')
+    query = models.TextField()
+    query_data = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    progress = models.JSONField(default=list, blank=True)
+    result = models.JSONField(blank=True, null=True)
+    error = models.TextField(blank=True, default="")
+    cancel_requested = models.BooleanField(default=False)
+    worker = models.CharField(max_length=100, blank=True, default="")
+    user_message_id = models.CharField(max_length=255, blank=True, default="")
+    bot_message_id = models.CharField(max_length=255, blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['user', '-created_at']),
+        ]
+
+    @property
+    def is_finished(self):
+        return self.status in self.FINISHED_STATUSES
+
+    def __str__(self):
+        return f"{self.job_id} ({self.status})"
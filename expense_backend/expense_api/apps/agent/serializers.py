@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from langchain_core.messages import AIMessage
 from django.contrib.auth.models import User
-from .models import ChatSession, ChatMessage
+from .models import ChatSession, ChatMessage, AgentJob
 
 
 class ChatSessionSerializer(serializers.ModelSerializer):
@@ -87,6 +87,19 @@ class ChatMessageSerializer(serializers.ModelSerializer):
         return message
 
 
+class AgentJobSerializer(serializers.ModelSerializer):
+    session_id = serializers.CharField(source='chat_session.session_id', read_only=True, default=None)
+
+    class Meta:
+        model = AgentJob
+        fields = [
+            'job_id', 'status', 'query', 'session_id', 'progress', 'result', 'error',
+            'cancel_requested', 'user_message_id', 'bot_message_id',
+            'created_at', 'started_at', 'finished_at'
+        ]
+        read_only_fields = fields
+
+
 class QuerySerializer(serializers.Serializer):
     """Input serializer for finance management AI queries."""
     query = serializers.CharField()
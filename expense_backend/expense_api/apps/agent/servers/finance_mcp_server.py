@@ -47,14 +47,29 @@ from django.utils.timezone import now
 from asgiref.sync import sync_to_async
 from django.contrib.auth.models import User
 from django.db import transaction
-from expense_api.apps.FinanceManagement.models import DynamicTableData, JsonTable, JsonTableRow
+from expense_api.apps.FinanceManagement.models import DynamicTableData, JsonTable, JsonTableRow, TableSnapshot
 from expense_api.apps.FinanceManagement.serializers import DynamicTableSerializer
+from expense_api.apps.FinanceManagement import access, column_indexes, row_search, schema, services, snapshots, table_index, table_query
 from expense_api.apps.agent.models import ChatSession, ChatMessage
 from expense_api.apps.agent.serializers import ChatSessionSerializer, ChatMessageSerializer
 
 # MCP server
 mcp = FastMCP("finance_management")
 
+
+def _json_table_for(user_id, table_id):
+    """The table's JsonTable if the user may use it (see access.py); raises JsonTable.DoesNotExist otherwise."""
+    if not access.can_use(user_id, table_id):
+        raise JsonTable.DoesNotExist
+    return JsonTable.objects.get(pk=table_id)
+
+
+def _owned_table(user_id, table_id):
+    """The table if the user owns it; raises DynamicTableData.DoesNotExist otherwise."""
+    if not access.is_owner(user_id, table_id):
+        raise DynamicTableData.DoesNotExist
+    return DynamicTableData.objects.get(pk=table_id)
+
 # ✅ Tool 1: Get all tables for a user
 @mcp.tool()
 async def get_user_tables(user_id: int) -> str:
@@ -73,7 +88,7 @@ async def get_user_tables(user_id: int) -> str:
             return json.dumps({"success": False, "error": "User not found"})
         
         user = await sync_to_async(User.objects.get)(id=user_id)
-        tables = await sync_to_async(lambda: list(DynamicTableData.objects.filter(user=user)))()
+        tables = await sync_to_async(lambda: list(DynamicTableData.objects.filter(user=user, deleted_at__isnull=True)))()
         
         if not tables:
             return json.dumps({
@@ -130,19 +145,12 @@ async def create_table(user_id: int, table_name: str, description: str, headers)
         
         user = await sync_to_async(User.objects.get)(id=user_id)
         
-        @sync_to_async
-        def create_table_sync():
-            with transaction.atomic():
-                dynamic_table = DynamicTableData.objects.create(
-                    table_name=table_name.strip(),
-                    description=description.strip() if description else "",
-                    user=user,
-                    pending_count=0
-                )
-                JsonTable.objects.create(table=dynamic_table, headers=headers_list)
-                return dynamic_table
-        
-        dynamic_table = await create_table_sync()
+        dynamic_table, json_table = await sync_to_async(services.create_table)(
+            user,
+            table_name.strip(),
+            headers_list,
+            description.strip() if description else ""
+        )
         
         return json.dumps({
             "success": True,
@@ -152,6 +160,7 @@ async def create_table(user_id: int, table_name: str, description: str, headers)
                 "table_name": dynamic_table.table_name,
                 "description": dynamic_table.description,
                 "headers": headers_list,
+                "column_types": json_table.column_types,
                 "user_id": user.id,
                 "created_at": dynamic_table.created_at.isoformat()
             }
@@ -164,11 +173,12 @@ async def create_table(user_id: int, table_name: str, description: str, headers)
 
 # ✅ Tool 3: Add a new row to a table
 @mcp.tool()
-async def add_table_row(table_id: int, row_data) -> str:
+async def add_table_row(user_id: int, table_id: int, row_data) -> str:
     """
     Add a new row to an existing table.
     
     Parameters:
+    - user_id: User ID working on the table (owner or shared with)
     - table_id: ID of the table to add row to
     - row_data: Row data as dictionary or JSON string
     
@@ -188,14 +198,14 @@ async def add_table_row(table_id: int, row_data) -> str:
             return json.dumps({"success": False, "error": "Row data must be a dictionary or JSON string"})
         
         # Get JsonTable by the table_id (which is the primary key from DynamicTableData)
-        json_table = await sync_to_async(JsonTable.objects.get)(table_id=table_id)
+        json_table = await sync_to_async(_json_table_for)(user_id, table_id)
         
         # Add unique ID if not present
         if 'id' not in row_dict:
             row_dict['id'] = str(uuid.uuid4())[:8]
         
         # Create the row
-        await sync_to_async(JsonTableRow.objects.create)(table=json_table, data=row_dict)
+        await sync_to_async(services.insert_row)(json_table, row_dict)
         
         return json.dumps({
             "success": True,
@@ -210,11 +220,12 @@ async def add_table_row(table_id: int, row_data) -> str:
 
 # ✅ Tool 4: Update an existing row
 @mcp.tool()
-async def update_table_row(table_id: int, row_id: str, new_data) -> str:
+async def update_table_row(user_id: int, table_id: int, row_id: str, new_data) -> str:
     """
     Update an existing row in a table.
     
     Parameters:
+    - user_id: User ID working on the table (owner or shared with)
     - table_id: ID of the table
     - row_id: ID of the row to update
     - new_data: New data to update as dictionary or JSON string
@@ -234,21 +245,15 @@ async def update_table_row(table_id: int, row_id: str, new_data) -> str:
         else:
             return json.dumps({"success": False, "error": "New data must be a dictionary or JSON string"})
         
-        # Find the row using table_id and the id within the JSON data
-        row = await sync_to_async(JsonTableRow.objects.get)(
-            table__table_id=table_id,
-            data__id=row_id
-        )
+        try:
+            json_table = await sync_to_async(_json_table_for)(user_id, table_id)
+        except JsonTable.DoesNotExist:
+            return json.dumps({"success": False, "error": "Table not found"})
         
-        @sync_to_async
-        def update_row():
-            current_data = row.data or {}
-            current_data.update(new_data_dict)
-            row.data = current_data
-            row.save()
-            return row.data
+        # Find the row using table_id and the id within the JSON data
+        row = await sync_to_async(json_table.rows.get)(**{schema.data_lookup(json_table, "id"): row_id})
         
-        updated_data = await update_row()
+        updated_data = await sync_to_async(services.update_row)(row, new_data_dict)
         
         return json.dumps({
             "success": True,
@@ -263,11 +268,12 @@ async def update_table_row(table_id: int, row_id: str, new_data) -> str:
 
 # ✅ Tool 5: Delete a row from a table
 @mcp.tool()
-async def delete_table_row(table_id: int, row_id: str) -> str:
+async def delete_table_row(user_id: int, table_id: int, row_id: str) -> str:
     """
     Delete a row from a table.
     
     Parameters:
+    - user_id: User ID working on the table (owner or shared with)
     - table_id: ID of the table
     - row_id: ID of the row to delete
     
@@ -275,13 +281,14 @@ async def delete_table_row(table_id: int, row_id: str) -> str:
     - JSON string with success status
     """
     try:
-        json_table = await sync_to_async(JsonTable.objects.get)(pk=table_id)
+        json_table = await sync_to_async(_json_table_for)(user_id, table_id)
         
         @sync_to_async
         def delete_row():
+            read = schema.row_reader(json_table)
             for row in json_table.rows.all():
-                if str(row.data.get("id")) == str(row_id):
-                    row.delete()
+                if str(read(row.data).get("id")) == str(row_id):
+                    services.delete_row(row)
                     return True
             return False
         
@@ -302,13 +309,17 @@ async def delete_table_row(table_id: int, row_id: str) -> str:
 
 # ✅ Tool 6: Get table content
 @mcp.tool()
-async def get_table_content(user_id: int, table_id: Optional[int] = None) -> str:
+async def get_table_content(user_id: int, table_id: Optional[int] = None, filters=None, order_by=None) -> str:
     """
     Get complete content of all tables or specific table.
+    With table_id, rows can be filtered and sorted by the database instead of reading them all.
     
     Parameters:
     - user_id: User ID to filter tables
-    - table_id: Optional specific table ID to fetch
+    - table_id: Optional specific table ID to fetch (owned or shared with the user); all owned tables otherwise
+    - filters: Optional filter (needs table_id), e.g. {"column": "Amount", "op": "gt", "value": 500};
+      ops: eq, ne, gt, gte, lt, lte, in, contains, empty, not_empty; combine with {"and": [...]}, {"or": [...]}, {"not": ...}
+    - order_by: Optional sort (needs table_id), e.g. "Date desc, Amount" or ["-Date", "Amount"]
     
     Returns:
     - JSON string with table content
@@ -316,22 +327,35 @@ async def get_table_content(user_id: int, table_id: Optional[int] = None) -> str
     try:
         user = await sync_to_async(User.objects.get)(id=user_id)
         
+        filters_spec = json.loads(filters) if isinstance(filters, str) and filters.strip() else filters
+        order_spec = json.loads(order_by) if isinstance(order_by, str) and order_by.lstrip().startswith('[') else order_by
+        if (filters_spec or order_spec) and not table_id:
+            return json.dumps({"success": False, "error": "filters and order_by need a table_id"})
+        
         @sync_to_async
         def get_tables():
             if table_id:
-                tables = JsonTable.objects.filter(table_id=table_id, table__user=user)
+                table_ids = [table_id] if access.can_use(user.id, table_id) else []
             else:
-                tables = JsonTable.objects.filter(table__user=user)
+                table_ids = access.table_ids(user.id, only=access.OWNER)
+            tables = JsonTable.objects.filter(table_id__in=table_ids).select_related('table')
             
             result = []
             for table in tables:
+                rows = table.rows.order_by('position', 'id')
+                if filters_spec or order_spec:
+                    rows = table_query.apply_ordering(
+                        table_query.apply_filters(rows, table, filters_spec), table, order_spec
+                    )
+                    column_indexes.record_use(table, table_query.referenced_columns(filters_spec, order_spec))
                 table_dict = {
                     "id": table.table.id,
                     "table_name": table.table.table_name,
                     "description": table.table.description,
                     "data": {
                         "headers": table.headers,
-                        "rows": [row.data for row in table.rows.all()]
+                        "column_types": table.column_types,
+                        "rows": [services.read_row(table, row) for row in rows]
                     }
                 }
                 result.append(table_dict)
@@ -347,16 +371,19 @@ async def get_table_content(user_id: int, table_id: Optional[int] = None) -> str
         
     except User.DoesNotExist:
         return json.dumps({"success": False, "error": "User not found"})
+    except ValueError as e:
+        return json.dumps({"success": False, "error": str(e)})
     except Exception as e:
         return json.dumps({"success": False, "error": str(e)})
 
 # ✅ Tool 7: Add a column to a table
 @mcp.tool()
-async def add_table_column(table_id: int, header: str) -> str:
+async def add_table_column(user_id: int, table_id: int, header: str) -> str:
     """
     Add a new column to an existing table.
     
     Parameters:
+    - user_id: User ID working on the table (owner or shared with)
     - table_id: ID of the table
     - header: Name of the new column header
     
@@ -364,24 +391,13 @@ async def add_table_column(table_id: int, header: str) -> str:
     - JSON string with success status
     """
     try:
-        json_table = await sync_to_async(JsonTable.objects.get)(pk=table_id)
+        json_table = await sync_to_async(_json_table_for)(user_id, table_id)
         
         if header in json_table.headers:
             return json.dumps({"success": False, "error": f"Header '{header}' already exists"})
         
-        @sync_to_async
-        def add_column():
-            json_table.headers.append(header)
-            json_table.save()
-            
-            # Update all rows with empty value for new column
-            for row in json_table.rows.all():
-                row.data[header] = ""
-                row.save()
-            
-            return json_table.headers
-        
-        updated_headers = await add_column()
+        # Adds the header and an empty value for the new column in all rows
+        updated_headers = await sync_to_async(services.add_column)(json_table, header)
         
         return json.dumps({
             "success": True,
@@ -396,11 +412,12 @@ async def add_table_column(table_id: int, header: str) -> str:
 
 # ✅ Tool 8: Delete columns from a table
 @mcp.tool()
-async def delete_table_columns(table_id: int, new_headers) -> str:
+async def delete_table_columns(user_id: int, table_id: int, new_headers) -> str:
     """
     Delete columns from a table by providing new headers list.
     
     Parameters:
+    - user_id: User ID working on the table (owner or shared with)
     - table_id: ID of the table
     - new_headers: List of headers to keep or JSON string (others will be deleted)
     
@@ -419,7 +436,7 @@ async def delete_table_columns(table_id: int, new_headers) -> str:
         else:
             return json.dumps({"success": False, "error": "Headers must be a list or JSON string"})
             
-        json_table = await sync_to_async(JsonTable.objects.get)(table_id=table_id)
+        json_table = await sync_to_async(_json_table_for)(user_id, table_id)
         
         @sync_to_async
         def delete_columns():
@@ -429,16 +446,8 @@ async def delete_table_columns(table_id: int, new_headers) -> str:
             if not deleted_headers:
                 return old_headers, []
             
-            json_table.headers = new_headers_list
-            json_table.save()
-            
-            # Update rows to remove deleted columns
-            for row in json_table.rows.all():
-                for col in deleted_headers:
-                    row.data.pop(col, None)
-                row.save()
-            
-            return new_headers_list, list(deleted_headers)
+            # Remove deleted columns from the headers and from all rows
+            return services.delete_columns(json_table, list(deleted_headers)), list(deleted_headers)
         
         updated_headers, deleted_headers = await delete_columns()
         
@@ -471,25 +480,14 @@ async def update_table_metadata(user_id: int, table_id: int, table_name: Optiona
     - JSON string with success status
     """
     try:
-        user = await sync_to_async(User.objects.get)(id=user_id)
-        table = await sync_to_async(DynamicTableData.objects.get)(id=table_id, user=user)
+        table = await sync_to_async(_owned_table)(user_id, table_id)
         
         @sync_to_async
         def update_metadata():
-            updated = False
-            
-            if table_name is not None:
-                table.table_name = table_name
-                updated = True
-            if description is not None:
-                table.description = description
-                updated = True
-            if pending_count is not None:
-                table.pending_count = pending_count
-                updated = True
+            updated = any(value is not None for value in (table_name, description, pending_count))
             
             if updated:
-                table.save()
+                services.update_table(table, table_name, description, pending_count)
                 return DynamicTableSerializer(table).data, True
             return None, False
         
@@ -504,8 +502,6 @@ async def update_table_metadata(user_id: int, table_id: int, table_name: Optiona
         else:
             return json.dumps({"success": False, "error": "No fields to update"})
             
-    except User.DoesNotExist:
-        return json.dumps({"success": False, "error": "User not found"})
     except DynamicTableData.DoesNotExist:
         return json.dumps({"success": False, "error": "Table not found"})
     except Exception as e:
@@ -525,14 +521,13 @@ async def delete_table(user_id: int, table_id: int) -> str:
     - JSON string with success status
     """
     try:
-        user = await sync_to_async(User.objects.get)(id=user_id)
-        table = await sync_to_async(DynamicTableData.objects.get)(id=table_id, user=user)
+        table = await sync_to_async(_owned_table)(user_id, table_id)
         
         @sync_to_async
         def delete_table_sync():
             with transaction.atomic():
                 table_name = table.table_name
-                table.delete()  # This will cascade delete JsonTable and JsonTableRow
+                services.delete_table(table)  # Rows are purged later, see purge.py
                 return table_name
         
         deleted_table_name = await delete_table_sync()
@@ -542,8 +537,6 @@ async def delete_table(user_id: int, table_id: int) -> str:
             "message": f"Table '{deleted_table_name}' deleted successfully"
         })
         
-    except User.DoesNotExist:
-        return json.dumps({"success": False, "error": "User not found"})
     except DynamicTableData.DoesNotExist:
         return json.dumps({"success": False, "error": "Table not found"})
     except Exception as e:
@@ -551,11 +544,12 @@ async def delete_table(user_id: int, table_id: int) -> str:
 
 # ✅ Tool 11: Delete a single column from a table
 @mcp.tool()
-async def delete_single_column(table_id: int, header: str) -> str:
+async def delete_single_column(user_id: int, table_id: int, header: str) -> str:
     """
     Delete a single column from a table.
     
     Parameters:
+    - user_id: User ID working on the table (owner or shared with)
     - table_id: ID of the table
     - header: Name of the column header to delete
     
@@ -563,26 +557,13 @@ async def delete_single_column(table_id: int, header: str) -> str:
     - JSON string with success status
     """
     try:
-        json_table = await sync_to_async(JsonTable.objects.get)(pk=table_id)
+        json_table = await sync_to_async(_json_table_for)(user_id, table_id)
         
         if header not in json_table.headers:
             return json.dumps({"success": False, "error": f"Header '{header}' does not exist in the table"})
         
-        @sync_to_async
-        def delete_column():
-            # Remove the header from the headers list
-            json_table.headers.remove(header)
-            json_table.save()
-            
-            # Remove the header key from all rows
-            for row in json_table.rows.all():
-                if header in row.data:
-                    del row.data[header]
-                    row.save()
-            
-            return json_table.headers
-        
-        updated_headers = await delete_column()
+        # Remove the header from the headers list and from all rows
+        updated_headers = await sync_to_async(services.delete_columns)(json_table, [header])
         
         return json.dumps({
             "success": True,
@@ -955,27 +936,28 @@ async def clear_chat_messages(user_id: int, session_id: str) -> str:
 @mcp.tool()
 async def search_tables(user_id: int, query: str) -> str:
     """
-    Search user's tables by name or description.
+    Search user's tables by name, description or headers.
+    Understands Bangla, Banglish and English (e.g. "khoroch", "খরচ" and "expense" all match).
     
     Parameters:
     - user_id: User ID to search tables for
     - query: Search query string
     
     Returns:
-    - JSON string with matching tables
+    - JSON string with matching tables, best match first, each with a relevance (0-95)
     """
     try:
         user = await sync_to_async(User.objects.get)(id=user_id)
         
         @sync_to_async
         def search():
-            from django.db.models import Q
-            tables = DynamicTableData.objects.filter(
-                user=user
-            ).filter(
-                Q(table_name__icontains=query) | Q(description__icontains=query)
-            )
-            return DynamicTableSerializer(tables, many=True).data
+            ranked = table_index.search_user_tables(user.id, query)
+            tables = DynamicTableData.objects.in_bulk([table_id for table_id, _, _ in ranked])
+            results = []
+            for table_id, _, relevance in ranked:
+                if table_id in tables:
+                    results.append({**DynamicTableSerializer(tables[table_id]).data, "relevance": relevance})
+            return results
         
         results = await search()
         
@@ -1009,29 +991,26 @@ async def get_table_statistics(user_id: int, table_id: Optional[int] = None) ->
         @sync_to_async
         def get_stats():
             if table_id:
-                tables = DynamicTableData.objects.filter(id=table_id, user=user)
+                table_ids = [table_id] if access.can_use(user.id, table_id) else []
             else:
-                tables = DynamicTableData.objects.filter(user=user)
+                table_ids = access.table_ids(user.id, only=access.OWNER)
+            # Row counts are the tables' counters, so one query covers every table
+            tables = DynamicTableData.objects.filter(pk__in=table_ids).select_related('jsontable')
             
             stats = []
             for table in tables:
-                try:
-                    json_table = JsonTable.objects.get(table=table)
-                    row_count = json_table.rows.count()
-                    column_count = len(json_table.headers)
-                except JsonTable.DoesNotExist:
-                    row_count = 0
-                    column_count = 0
-                
+                json_table = getattr(table, 'jsontable', None)
                 stats.append({
                     "table_id": table.id,
                     "table_name": table.table_name,
                     "description": table.description,
-                    "row_count": row_count,
-                    "column_count": column_count,
+                    "row_count": table.row_count,
+                    "column_count": len(json_table.headers) if json_table else 0,
+                    "data_bytes": table.row_bytes,
                     "pending_count": table.pending_count,
                     "created_at": table.created_at.isoformat(),
-                    "modified_at": table.modified_at.isoformat()
+                    "modified_at": table.modified_at.isoformat(),
+                    "rows_modified_at": table.rows_modified_at.isoformat() if table.rows_modified_at else None
                 })
             
             return stats
@@ -1049,6 +1028,208 @@ async def get_table_statistics(user_id: int, table_id: Optional[int] = None) ->
     except Exception as e:
         return json.dumps({"success": False, "error": str(e)})
 
+# ✅ Tool 22: Set the type of a column
+@mcp.tool()
+async def set_column_type(user_id: int, table_id: int, header: str, column_type: str) -> str:
+    """
+    Set the type of a column so its values can be sorted, filtered and summed.
+    Values keep their original text; a parsed copy ("100 tk" -> 100, "ajk" -> today's date) is stored alongside.
+    
+    Parameters:
+    - user_id: User ID working on the table (owner or shared with)
+    - table_id: ID of the table
+    - header: Column header to change
+    - column_type: One of text, number, currency, date, category
+    
+    Returns:
+    - JSON string with the table's column types
+    """
+    try:
+        json_table = await sync_to_async(_json_table_for)(user_id, table_id)
+        column_types = await sync_to_async(services.set_column_type)(json_table, header, column_type)
+        
+        return json.dumps({
+            "success": True,
+            "message": f"Column '{header}' is now {column_type}",
+            "column_types": column_types
+        })
+        
+    except JsonTable.DoesNotExist:
+        return json.dumps({"success": False, "error": "Table not found"})
+    except ValueError as e:
+        return json.dumps({"success": False, "error": str(e)})
+    except Exception as e:
+        return json.dumps({"success": False, "error": str(e)})
+
+# ✅ Tool 23: Search row contents
+@mcp.tool()
+async def search_rows(user_id: int, query: str, table_id: Optional[int] = None, limit: Optional[int] = 20) -> str:
+    """
+    Full-text search inside the rows of the user's tables (e.g. "350 tk pharmacy").
+    Understands Bangla, Banglish and English like search_tables.
+    
+    Parameters:
+    - user_id: User ID whose tables (owned and shared) are searched
+    - query: Search query string
+    - table_id: Optional table ID to search only that table
+    - limit: Maximum number of rows to return (default 20, at most 100)
+    
+    Returns:
+    - JSON string with matching rows, best match first, each with its table and score
+    """
+    try:
+        user = await sync_to_async(User.objects.get)(id=user_id)
+        
+        @sync_to_async
+        def search():
+            table_ids = access.table_ids(user.id)
+            if table_id is not None:
+                table_ids = [table_id] if table_id in table_ids else []
+            ranked = row_search.search_rows(table_ids, query, limit=limit or 20)
+            return [
+                {
+                    "table_id": row.table_id,
+                    "table_name": row.table.table.table_name,
+                    "row_id": row.pk,
+                    "row": services.read_row(row.table, row),
+                    "score": round(score, 4)
+                }
+                for row, score in row_search.load_rows(ranked)
+            ]
+        
+        results = await search()
+        
+        return json.dumps({
+            "success": True,
+            "message": f"Found {len(results)} matching rows",
+            "data": results
+        })
+        
+    except User.DoesNotExist:
+        return json.dumps({"success": False, "error": "User not found"})
+    except Exception as e:
+        return json.dumps({"success": False, "error": str(e)})
+
+# ✅ Tool 24: Snapshot a table before bulk edits
+@mcp.tool()
+async def create_table_snapshot(user_id: int, table_id: int, label: Optional[str] = "") -> str:
+    """
+    Save a snapshot of a table that it can be restored to later.
+    Take one before bulk edits (many rows updated or deleted, columns removed) so they can be undone.
+    Snapshots are cheap: no rows are copied.
+    
+    Parameters:
+    - user_id: User ID working on the table (owner or shared with)
+    - table_id: ID of the table
+    - label: Optional short note, e.g. "Before recategorizing March expenses"
+    
+    Returns:
+    - JSON string with the snapshot's id, to pass to restore_table_snapshot
+    """
+    try:
+        json_table = await sync_to_async(_json_table_for)(user_id, table_id)
+        
+        @sync_to_async
+        def snapshot_sync():
+            user = User.objects.filter(pk=user_id).first()
+            return snapshots.create_snapshot(json_table.table, (label or "")[:255], user)
+        
+        snapshot = await snapshot_sync()
+        
+        return json.dumps({
+            "success": True,
+            "message": f"Snapshot {snapshot.pk} of table {table_id} created",
+            "snapshot_id": snapshot.pk,
+            "seq": snapshot.seq
+        })
+        
+    except JsonTable.DoesNotExist:
+        return json.dumps({"success": False, "error": "Table not found"})
+    except Exception as e:
+        return json.dumps({"success": False, "error": str(e)})
+
+# ✅ Tool 25: List a table's snapshots
+@mcp.tool()
+async def get_table_snapshots(user_id: int, table_id: int) -> str:
+    """
+    List the snapshots of a table, newest first.
+    
+    Parameters:
+    - user_id: User ID working on the table (owner or shared with)
+    - table_id: ID of the table
+    
+    Returns:
+    - JSON string with each snapshot's id, label, change seq and creation time
+    """
+    try:
+        await sync_to_async(_json_table_for)(user_id, table_id)
+        
+        @sync_to_async
+        def list_snapshots():
+            return [
+                {
+                    "snapshot_id": snapshot.pk,
+                    "label": snapshot.label,
+                    "seq": snapshot.seq,
+                    "created_at": snapshot.created_at.isoformat()
+                }
+                for snapshot in TableSnapshot.objects.filter(table_id=table_id).order_by('-seq', '-pk')
+            ]
+        
+        results = await list_snapshots()
+        
+        return json.dumps({
+            "success": True,
+            "message": f"Found {len(results)} snapshots",
+            "data": results
+        })
+        
+    except JsonTable.DoesNotExist:
+        return json.dumps({"success": False, "error": "Table not found"})
+    except Exception as e:
+        return json.dumps({"success": False, "error": str(e)})
+
+# ✅ Tool 26: Restore a table to a snapshot
+@mcp.tool()
+async def restore_table_snapshot(user_id: int, table_id: int, snapshot_id: int) -> str:
+    """
+    Restore a table's columns and rows to a snapshot, undoing every change made since.
+    The table as it is now is snapshotted first, so the restore can be undone too.
+    
+    Parameters:
+    - user_id: User ID working on the table (owner or shared with)
+    - table_id: ID of the table
+    - snapshot_id: ID returned by create_table_snapshot or get_table_snapshots
+    
+    Returns:
+    - JSON string with the number of rows restored and the id of the snapshot taken before restoring
+    """
+    try:
+        json_table = await sync_to_async(_json_table_for)(user_id, table_id)
+        
+        @sync_to_async
+        def restore_sync():
+            snapshot = TableSnapshot.objects.get(pk=snapshot_id, table_id=table_id)
+            user = User.objects.filter(pk=user_id).first()
+            return services.restore_table(json_table, snapshot.seq, user)
+        
+        result = await restore_sync()
+        
+        return json.dumps({
+            "success": True,
+            "message": f"Table {table_id} restored to snapshot {snapshot_id}",
+            **result
+        })
+        
+    except JsonTable.DoesNotExist:
+        return json.dumps({"success": False, "error": "Table not found"})
+    except TableSnapshot.DoesNotExist:
+        return json.dumps({"success": False, "error": "Snapshot not found"})
+    except ValueError as e:
+        return json.dumps({"success": False, "error": str(e)})
+    except Exception as e:
+        return json.dumps({"success": False, "error": str(e)})
+
 # ✅ MCP entry point
 if __name__ == "__main__":
     mcp.run(transport='stdio')
@@ -5,6 +5,13 @@ from .views import (
     AgentAPIView, 
     AgentStreamingAPIView, 
     AgentHistoryAPIView,
+    AgentUsageAPIView,
+    
+    # Agent job views
+    AgentJobListView,
+    AgentJobDetailView,
+    AgentJobCancelView,
+    AgentJobStreamView,
     
     # Chat session management views
     ChatSessionListView,
@@ -18,6 +25,13 @@ urlpatterns = [
     path('query/', AgentAPIView.as_view(), name='agent-query'),           # /agent/query/
     path('streaming/', AgentStreamingAPIView.as_view(), name='agent-streaming'),  # /agent/streaming/
     path('history/', AgentHistoryAPIView.as_view(), name='agent-history'),        # /agent/history/
+    path('usage/', AgentUsageAPIView.as_view(), name='agent-usage'),              # /agent/usage/
+    
+    # ============ AGENT JOB ENDPOINTS ============
+    path('jobs/', AgentJobListView.as_view(), name='agent-jobs'),                                  # GET: list, POST: submit
+    path('jobs/<str:job_id>/', AgentJobDetailView.as_view(), name='agent-job-detail'),             # GET: poll
+    path('jobs/<str:job_id>/cancel/', AgentJobCancelView.as_view(), name='agent-job-cancel'),      # POST: cancel
+    path('jobs/<str:job_id>/stream/', AgentJobStreamView.as_view(), name='agent-job-stream'),      # GET: server-sent events
     
     # ============ CHAT SESSION ENDPOINTS ============
     # Chat session management
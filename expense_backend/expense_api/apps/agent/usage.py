@@ -0,0 +1,121 @@
+"""Token, latency and cost accounting for agent queries.
+
+Usage collected by the MCP client is stored in ``ChatMessage.agent_data['usage']``
+on the bot reply, so reports are plain aggregate queries over chat messages.
+Replies to queries sent with a ``session_id`` are saved here; the web client
+saves its replies through ``SaveSessionMessageView`` instead, passing on the
+``usage`` the agent endpoints return.
+"""
+import uuid
+from datetime import timedelta
+
+from django.db.models import Count, FloatField, IntegerField, Sum
+from django.db.models.fields.json import KT
+from django.db.models.functions import Cast, Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import ChatSession, ChatMessage
+
+
+USAGE_INT_FIELDS = [
+    'llm_calls', 'input_tokens', 'output_tokens', 'cache_read_tokens', 'cache_write_tokens', 'total_tokens',
+    'tool_calls',
+]
+USAGE_TIMING_FIELDS = ['connect_ms', 'catalog_ms', 'llm_ms', 'tools_ms', 'post_processing_ms', 'total_ms']
+
+
+def save_bot_reply(user, session_id, query, response_text, agent_data):
+    """Persist the agent's reply in a chat session and return the message.
+
+    Returns None when the session does not exist for the user. The generated
+    ``message_id`` is returned to the frontend so that saving the same reply
+    again through ``SaveSessionMessageView`` is a no-op.
+    """
+    session = ChatSession.objects.filter(session_id=session_id, user=user).first()
+    if session is None:
+        return None
+
+    message = ChatMessage.objects.create(
+        chat_session=session,
+        user=user,
+        message_id=f"bot_{uuid.uuid4().hex}",
+        text=response_text,
+        displayed_text=response_text,
+        sender='bot',
+        agent_data={**agent_data, 'query': query}
+    )
+    # Update session timestamp
+    session.save()
+    return message
+
+
+def _usage_value(path, output_field):
+    return Coalesce(Cast(KT(f'agent_data__usage__{path}'), output_field), 0, output_field=output_field)
+
+
+def _usage_aggregates():
+    aggregates = {'queries': Count('id')}
+    for field in USAGE_INT_FIELDS:
+        aggregates[field] = Sum(_usage_value(field, IntegerField()))
+    for field in USAGE_TIMING_FIELDS:
+        aggregates[field] = Sum(_usage_value(f'timings__{field}', FloatField()))
+    aggregates['cost_usd'] = Sum(_usage_value('cost_usd', FloatField()))
+    return aggregates
+
+
+def usage_messages(user=None, days=30):
+    """Bot messages with recorded usage, optionally limited to one user."""
+    since = timezone.now() - timedelta(days=days)
+    messages = ChatMessage.objects.filter(
+        sender='bot',
+        timestamp__gte=since,
+        agent_data__usage__isnull=False
+    )
+    if user is not None:
+        messages = messages.filter(user=user)
+    return messages
+
+
+def summarize_usage(user=None, days=30, per_user=False, top=10):
+    """Aggregate usage into totals, per-day (and optionally per-user) buckets.
+
+    All sums run in the database over the JSON ``agent_data`` column; only the
+    ``top`` most expensive queries are loaded as rows.
+    """
+    messages = usage_messages(user=user, days=days)
+    aggregates = _usage_aggregates()
+
+    summary = {
+        'days': days,
+        'totals': messages.aggregate(**aggregates),
+        'per_day': list(
+            messages.annotate(day=TruncDate('timestamp'))
+            .values('day')
+            .annotate(**aggregates)
+            .order_by('day')
+        ),
+    }
+
+    if per_user:
+        summary['per_user'] = list(
+            messages.values('user_id', 'user__username')
+            .annotate(**aggregates)
+            .order_by('-total_tokens')
+        )
+
+    expensive = (
+        messages.annotate(tokens=_usage_value('total_tokens', IntegerField()))
+        .order_by('-tokens')
+        .values('message_id', 'user_id', 'timestamp', 'tokens', 'agent_data')[:top]
+    )
+    summary['most_expensive'] = [
+        {
+            'message_id': row['message_id'],
+            'user_id': row['user_id'],
+            'timestamp': row['timestamp'],
+            'query': (row['agent_data'] or {}).get('query'),
+            'usage': (row['agent_data'] or {}).get('usage'),
+        }
+        for row in expensive
+    ]
+    return summary
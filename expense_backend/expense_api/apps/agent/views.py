@@ -1,24 +1,79 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework import status
+from django.http import StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.contrib.auth.models import User
 from django.shortcuts import get_object_or_404
-from asgiref.sync import async_to_sync
+from django.http import Http404
+from asgiref.sync import async_to_sync, sync_to_async
+import asyncio
+import functools
+import threading
 import time
 
 from ..user_auth.authentication import IsAuthenticatedCustom
 from ..user_auth.permission import JWTAuthentication
 from .serializers import (
     QuerySerializer, ResponseSerializer, 
-    ChatSessionSerializer, ChatMessageSerializer
+    ChatSessionSerializer, ChatMessageSerializer, AgentJobSerializer
 )
-from .models import ChatSession, ChatMessage
+from .models import ChatSession, ChatMessage, AgentJob
 from .client.client import ExpenseMCPClient
+from .usage import save_bot_reply, summarize_usage
+from .jobs import submit_job, cancel_job, job_event_stream, job_events
+
+
+def _persist_agent_reply(request, query_data, cleaned_response):
+    """Save the bot reply with its usage when the query belongs to a chat session."""
+    session_id = query_data.get('session_id')
+    if not session_id:
+        return
+    message = save_bot_reply(
+        request.user,
+        session_id,
+        query_data.get('query'),
+        cleaned_response['response'],
+        {
+            'tools_called': cleaned_response['tools_called'],
+            'usage': cleaned_response.get('usage'),
+        }
+    )
+    if message:
+        cleaned_response['message_id'] = message.message_id
+
+class CancelOnDisconnectMixin:
+    """
+    Stop the agent run when the HTTP client goes away.
+
+    DRF views are synchronous, so under ASGI Django cannot interrupt them when
+    the client disconnects. ``as_view`` wraps the view in an async function:
+    Django cancels that coroutine on disconnect, which sets
+    ``request.agent_cancel_event`` and makes the running agent stop.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+
+        @functools.wraps(view)
+        async def cancellable_view(request, *args, **kwargs):
+            cancel_event = threading.Event()
+            request.agent_cancel_event = cancel_event
+            try:
+                return await sync_to_async(view)(request, *args, **kwargs)
+            except asyncio.CancelledError:
+                cancel_event.set()
+                raise
+
+        return cancellable_view
+
 
 @method_decorator(csrf_exempt, name='dispatch')
-class AgentAPIView(APIView):
+class AgentAPIView(CancelOnDisconnectMixin, APIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticatedCustom]
 
@@ -45,20 +100,23 @@ class AgentAPIView(APIView):
                 query_data['context_type'] = request.data['context_type']
 
             # Run agent and get response
-            response_obj = async_to_sync(self.run_agent_simple)(query_data)
+            response_obj = async_to_sync(self.run_agent_simple)(
+                query_data, getattr(request, 'agent_cancel_event', None)
+            )
             
             # Process and clean the response
             cleaned_response = self._clean_response(response_obj)
+            _persist_agent_reply(request, query_data, cleaned_response)
             
             return Response(cleaned_response, status=status.HTTP_200_OK)
             
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    async def run_agent_simple(self, query_data):
+    async def run_agent_simple(self, query_data, cancel_event=None):
         """Simplified agent runner that returns raw response."""
         try:
-            return await ExpenseMCPClient.create_and_run_query(query_data)
+            return await ExpenseMCPClient.create_and_run_query(query_data, cancel_event=cancel_event)
         except Exception as e:
             return {"error": str(e)}
 
@@ -100,6 +158,11 @@ class AgentAPIView(APIView):
             # Extract tools information if available
             if 'raw_response' in response_obj:
                 cleaned_response['tools_called'] = self._extract_tools_from_raw_response(response_obj['raw_response'])
+            if response_obj.get('usage'):
+                cleaned_response['usage'] = response_obj['usage']
+            if response_obj.get('partial'):
+                cleaned_response['partial'] = True
+                cleaned_response['stop_reason'] = response_obj.get('stop_reason')
         else:
             response_text = str(response_obj)
         
@@ -170,7 +233,7 @@ class AgentHistoryAPIView(APIView):
 
 
 @method_decorator(csrf_exempt, name='dispatch')
-class AgentStreamingAPIView(APIView):
+class AgentStreamingAPIView(CancelOnDisconnectMixin, APIView):
     """Simple streaming endpoint that returns unformatted responses."""
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticatedCustom]
@@ -199,20 +262,23 @@ class AgentStreamingAPIView(APIView):
                 query_data['context_type'] = request.data['context_type']
 
             # Run agent and get response
-            response_obj = async_to_sync(self._run_agent)(query_data)
+            response_obj = async_to_sync(self._run_agent)(
+                query_data, getattr(request, 'agent_cancel_event', None)
+            )
             
             # Process and clean the response
             cleaned_response = self._clean_response(response_obj)
+            _persist_agent_reply(request, query_data, cleaned_response)
             
             return Response(cleaned_response, status=status.HTTP_200_OK)
             
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    async def _run_agent(self, query_data):
+    async def _run_agent(self, query_data, cancel_event=None):
         """Run agent without cleaning response."""
         try:
-            return await ExpenseMCPClient.create_and_run_query(query_data)
+            return await ExpenseMCPClient.create_and_run_query(query_data, cancel_event=cancel_event)
         except Exception as e:
             return {"error": str(e)}
 
@@ -238,6 +304,11 @@ class AgentStreamingAPIView(APIView):
             # Extract tools information if available
             if 'raw_response' in response_obj:
                 cleaned_response['tools_called'] = self._extract_tools_from_raw_response(response_obj['raw_response'])
+            if response_obj.get('usage'):
+                cleaned_response['usage'] = response_obj['usage']
+            if response_obj.get('partial'):
+                cleaned_response['partial'] = True
+                cleaned_response['stop_reason'] = response_obj.get('stop_reason')
         else:
             response_text = str(response_obj)
         
@@ -284,6 +355,220 @@ class AgentStreamingAPIView(APIView):
         return tools_called
 
 
+@method_decorator(csrf_exempt, name='dispatch')
+class AgentUsageAPIView(APIView):
+    """Aggregated token, latency and cost usage of agent queries."""
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticatedCustom]
+
+    MAX_DAYS = 366
+    MAX_TOP = 100
+
+    def get(self, request):
+        """Get per-day usage for the current user, or for all users (staff only)."""
+        try:
+            if not request.user.is_authenticated:
+                return Response({'message': "Authentication credentials were not provided or are invalid."}, 
+                              status=status.HTTP_401_UNAUTHORIZED)
+
+            try:
+                days = int(request.query_params.get('days', 30))
+                top = int(request.query_params.get('top', 10))
+            except ValueError:
+                return Response({"error": "'days' and 'top' must be integers."},
+                              status=status.HTTP_400_BAD_REQUEST)
+            if days < 1 or top < 1:
+                return Response({"error": "'days' and 'top' must be positive."},
+                              status=status.HTTP_400_BAD_REQUEST)
+            days = min(days, self.MAX_DAYS)
+            top = min(top, self.MAX_TOP)
+
+            all_users = request.query_params.get('scope') == 'all'
+            if all_users and not request.user.is_staff:
+                return Response({"error": "Only staff can view usage for all users."},
+                              status=status.HTTP_403_FORBIDDEN)
+
+            summary = summarize_usage(
+                user=None if all_users else request.user,
+                days=days,
+                per_user=all_users,
+                top=top
+            )
+
+            return Response({
+                "message": "Agent usage retrieved successfully.",
+                "data": summary
+            }, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+# ============ AGENT JOB VIEWS ============
+class EventStreamRenderer(BaseRenderer):
+    """Lets DRF accept ``Accept: text/event-stream`` (sent by EventSource)."""
+    media_type = 'text/event-stream'
+    format = 'sse'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AgentJobListView(APIView):
+    """Submit agent queries as background jobs and list recent jobs."""
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticatedCustom]
+
+    def get(self, request):
+        """List the current user's most recent jobs."""
+        try:
+            if not request.user.is_authenticated:
+                return Response({'message': "Authentication credentials were not provided or are invalid."}, 
+                              status=status.HTTP_401_UNAUTHORIZED)
+
+            jobs = AgentJob.objects.filter(user=request.user).select_related('chat_session')
+            job_status = request.query_params.get('status')
+            if job_status:
+                jobs = jobs.filter(status=job_status)
+            serializer = AgentJobSerializer(jobs[:50], many=True)
+
+            return Response({
+                "message": "Agent jobs retrieved successfully.",
+                "data": serializer.data
+            }, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def post(self, request):
+        """Queue a query and return the job id immediately."""
+        try:
+            if not request.user.is_authenticated:
+                return Response({'message': "Authentication credentials were not provided or are invalid."}, 
+                              status=status.HTTP_401_UNAUTHORIZED)
+
+            input_serializer = QuerySerializer(data=request.data)
+            if not input_serializer.is_valid():
+                return Response(input_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+            query_data = input_serializer.validated_data
+            if 'table_id' in request.data:
+                query_data['table_id'] = request.data['table_id']
+            if 'context_type' in request.data:
+                query_data['context_type'] = request.data['context_type']
+
+            chat_session = None
+            if query_data.get('session_id'):
+                chat_session = ChatSession.objects.filter(
+                    session_id=query_data['session_id'], user=request.user
+                ).first()
+                if chat_session is None:
+                    return Response({"error": "Chat session not found."}, status=status.HTTP_404_NOT_FOUND)
+
+            job = submit_job(request.user, query_data, chat_session)
+
+            return Response({
+                "message": "Agent job queued successfully.",
+                "data": AgentJobSerializer(job).data
+            }, status=status.HTTP_202_ACCEPTED)
+
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AgentJobDetailView(APIView):
+    """Poll the status, progress and result of a job."""
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticatedCustom]
+
+    def get(self, request, job_id):
+        try:
+            if not request.user.is_authenticated:
+                return Response({'message': "Authentication credentials were not provided or are invalid."}, 
+                              status=status.HTTP_401_UNAUTHORIZED)
+
+            job = get_object_or_404(AgentJob.objects.select_related('chat_session'), job_id=job_id, user=request.user)
+
+            return Response({
+                "message": "Agent job retrieved successfully.",
+                "data": AgentJobSerializer(job).data
+            }, status=status.HTTP_200_OK)
+
+        except Http404:
+            return Response({"error": "Agent job not found."}, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AgentJobCancelView(APIView):
+    """Cancel a queued or running job."""
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticatedCustom]
+
+    def post(self, request, job_id):
+        try:
+            if not request.user.is_authenticated:
+                return Response({'message': "Authentication credentials were not provided or are invalid."}, 
+                              status=status.HTTP_401_UNAUTHORIZED)
+
+            job = get_object_or_404(AgentJob.objects.select_related('chat_session'), job_id=job_id, user=request.user)
+            if job.is_finished:
+                return Response({
+                    "error": f"Agent job already {job.status}."
+                }, status=status.HTTP_409_CONFLICT)
+
+            job = cancel_job(job)
+
+            return Response({
+                "message": "Agent job cancelled." if job.status == 'cancelled' else "Cancellation requested.",
+                "data": AgentJobSerializer(job).data
+            }, status=status.HTTP_200_OK)
+
+        except Http404:
+            return Response({"error": "Agent job not found."}, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AgentJobStreamView(APIView):
+    """Server-sent events with a job's progress, ending with its result."""
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticatedCustom]
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    def get(self, request, job_id):
+        try:
+            if not request.user.is_authenticated:
+                return Response({'message': "Authentication credentials were not provided or are invalid."}, 
+                              status=status.HTTP_401_UNAUTHORIZED)
+
+            job = AgentJob.objects.filter(job_id=job_id, user=request.user).only('pk').first()
+            if job is None:
+                return Response({"error": "Agent job not found."}, status=status.HTTP_404_NOT_FOUND)
+
+            try:
+                after = int(request.query_params.get('after') or request.headers.get('Last-Event-ID') or 0)
+            except ValueError:
+                return Response({"error": "'after' must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+            # Each server type buffers the other kind of iterator completely before sending
+            if isinstance(request._request, ASGIRequest):
+                events = job_event_stream(job.pk, after)
+            else:
+                events = job_events(job.pk, after)
+            response = StreamingHttpResponse(events, content_type='text/event-stream')
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'
+            return response
+
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 # ============ CHAT SESSION MANAGEMENT VIEWS ============
 @method_decorator(csrf_exempt, name='dispatch')
 class ChatSessionListView(APIView):
@@ -118,3 +118,19 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Agent
+AGENT_TABLE_CATALOG = env.bool('AGENT_TABLE_CATALOG', default=True)
+AGENT_CATALOG_LIMIT = env.int('AGENT_CATALOG_LIMIT', default=25)
+# Wall-clock limit per agent request, in seconds
+AGENT_RUN_TIMEOUT = env.int('AGENT_RUN_TIMEOUT', default=90)
+# Budgets after which a run stops with a partial answer
+AGENT_MAX_STEPS = env.int('AGENT_MAX_STEPS', default=12)
+AGENT_MAX_TOKENS = env.int('AGENT_MAX_TOKENS', default=60000)
+AGENT_MAX_REPEATED_TOOL_CALLS = env.int('AGENT_MAX_REPEATED_TOOL_CALLS', default=2)
+# Background agent jobs (python manage.py run_agent_workers)
+AGENT_JOB_WORKERS = env.int('AGENT_JOB_WORKERS', default=2)
+AGENT_JOB_POLL_INTERVAL = env.float('AGENT_JOB_POLL_INTERVAL', default=1.0)
+# Running jobs without a heartbeat for this many seconds are queued again
+AGENT_JOB_STALE_AFTER = env.int('AGENT_JOB_STALE_AFTER', default=300)
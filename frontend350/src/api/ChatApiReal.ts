@@ -35,6 +35,8 @@ interface AgentStreamingResponse {
       >
     >;
   };
+  // Tokens, timings and cost of the run, kept with the saved reply for usage reports
+  usage?: Record<string, unknown>;
 }
 
 // Create axios instance with base configuration
@@ -290,6 +292,8 @@ export const chatApi = {
                 name: msg[0][1].name,
                 args: msg[0][1].input as Record<string, unknown>,
               })) || [],
+          query: message.text,
+          usage: agentResponse.data.usage,
         },
       };
 
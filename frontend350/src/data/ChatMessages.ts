@@ -13,6 +13,8 @@ export interface ChatMessage {
       // eslint-disable-next-line @typescript-eslint/no-explicit-any
       args: Record<string, any>;
     }>;
+    query?: string;
+    usage?: Record<string, unknown>;
     streaming_info?: {
       tool_operations: Array<{
         step: number;